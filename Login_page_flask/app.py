@@ -1,27 +1,26 @@
 from flask import Flask, render_template, request, redirect, url_for, session, flash
-from werkzeug.security import generate_password_hash, check_password_hash
-from pymongo import MongoClient
+from hashing import HashingBusy, PasswordHasher
+from user_store import UserStore, client_from_env
 from dotenv import load_dotenv
-import os
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-prod'  # Change this!
 
 # Load environment variables
 load_dotenv()
-mongo_uri = os.getenv('MONGODB_URI')
 
-# MongoDB Atlas connection
-client = MongoClient(mongo_uri)
+# MongoDB Atlas connection (pool size and timeouts: MONGO_* in .env)
+client = client_from_env()
 db = client['login_app']  # Database name
 users_collection = db['users']  # Collection name
+user_store = UserStore(users_collection)
+user_store.ensure_indexes()
+
+# PBKDF2/scrypt runs on a bounded process pool, not on the request threads
+password_hasher = PasswordHasher()
 
 # # One-time script to add admin user (run once, then comment out)
-# users_collection.insert_one({
-#     'username': 'admin',
-#     'password': generate_password_hash('adminpass'),
-#     'role': 'admin'
-# })
+# user_store.create('admin', password_hasher.hash('adminpass'), role='admin')
 
 @app.route('/')
 def index():
@@ -35,9 +34,15 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        user = users_collection.find_one({'username': username})
+        user = user_store.find_for_login(username)
+        
+        try:
+            valid = user is not None and password_hasher.verify(user['password'], password)
+        except HashingBusy:
+            flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+            return render_template('login.html'), 503
         
-        if user and check_password_hash(user['password'], password):
+        if valid:
             session['username'] = username
             session['role'] = user['role']
             flash('Login successful!', 'success')
@@ -53,17 +58,20 @@ def register():
         username = request.form['username']
         password = request.form['password']
         
-        if users_collection.find_one({'username': username}):
+        # Cheap check first so a taken name doesn't cost a hash; create() is the atomic one
+        if user_store.exists(username):
             flash('Username already exists!', 'error')
         else:
-            hashed_password = generate_password_hash(password)
-            users_collection.insert_one({
-                'username': username,
-                'password': hashed_password,
-                'role': 'user'  # Default role; admins set manually in DB
-            })
-            flash('Registration successful! Please log in.', 'success')
-            return redirect(url_for('login'))
+            try:
+                hashed_password = password_hasher.hash(password)
+            except HashingBusy:
+                flash('Too many sign-ins right now. Please try again in a moment.', 'error')
+                return render_template('register.html'), 503
+            # Default role; admins set manually in DB
+            if user_store.create(username, hashed_password):
+                flash('Registration successful! Please log in.', 'success')
+                return redirect(url_for('login'))
+            flash('Username already exists!', 'error')
     
     return render_template('register.html')
 
@@ -110,4 +118,5 @@ def logout():
     return redirect(url_for('login'))
 
 if __name__ == '__main__':
+    password_hasher.start()  # Fork the hashing processes before the server starts its threads
     app.run(debug=True)
\ No newline at end of file
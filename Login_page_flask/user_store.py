@@ -0,0 +1,66 @@
+import logging
+import os
+from typing import Dict, Optional
+from pymongo import ASCENDING, MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# Login only needs these; never ship other fields (or _id) over the wire
+LOGIN_PROJECTION = {'_id': 0, 'password': 1, 'role': 1}
+
+
+def client_from_env() -> MongoClient:
+    """A MongoClient with an explicit pool and timeouts, from MONGODB_URI and MONGO_* in .env."""
+    return MongoClient(
+        os.getenv('MONGODB_URI'),
+        maxPoolSize=int(os.getenv('MONGO_MAX_POOL_SIZE', 50)),
+        minPoolSize=int(os.getenv('MONGO_MIN_POOL_SIZE', 2)),
+        maxIdleTimeMS=int(os.getenv('MONGO_MAX_IDLE_MS', 60000)),
+        waitQueueTimeoutMS=int(os.getenv('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000)),
+        connectTimeoutMS=int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', 5000)),
+        serverSelectionTimeoutMS=int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+        socketTimeoutMS=int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', 10000)),
+        appname='login_app',
+    )
+
+
+class UserStore:
+    """Users collection access for the login app.
+
+    A unique index on ``username`` keeps lookups a single index seek however
+    large the collection grows, and makes registration atomic: ``create`` is
+    one upsert that only inserts when the name is free, so two concurrent
+    registrations of the same name can't both succeed.
+    """
+
+    def __init__(self, collection):
+        self.users = collection
+
+    def ensure_indexes(self) -> None:
+        try:
+            self.users.create_index([('username', ASCENDING)], unique=True, name='username_unique')
+        except DuplicateKeyError:
+            logger.error("Duplicate usernames exist; remove them so the unique username index can be built")
+        except PyMongoError as e:
+            logger.error(f"Could not ensure user indexes: {e}")
+
+    def find_for_login(self, username: str) -> Optional[Dict]:
+        """``{'password': ..., 'role': ...}`` for ``username``, or None."""
+        return self.users.find_one({'username': username}, LOGIN_PROJECTION)
+
+    def exists(self, username: str) -> bool:
+        return self.users.find_one({'username': username}, {'_id': 1}) is not None
+
+    def create(self, username: str, password_hash: str, role: str = 'user') -> bool:
+        """Insert the user unless the name is taken; True if this call created it."""
+        try:
+            result = self.users.update_one(
+                {'username': username},
+                {'$setOnInsert': {'password': password_hash, 'role': role}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Lost a race with a concurrent upsert of the same name
+            return False
+        return result.upserted_id is not None
@@ -0,0 +1,114 @@
+"""Benchmark the user store: login lookup latency as the collection grows, and registration races.
+
+Runs against a scratch database on a local mongod (default), or in-process
+against mongomock with ``--mock``. For each size it bulk-loads users, then
+times ``find_for_login`` for random existing names and reports p50/p99;
+``--no-index`` skips ``ensure_indexes`` to show the collection-scan baseline.
+Finally ``--racers`` threads register the same name at once: exactly one
+must win. mongomock scans on every query, so it checks behaviour (projection,
+the race) but only a real mongod shows the flat, indexed latency.
+
+    python bench_user_store.py --uri mongodb://localhost:27017 --sizes 1000 10000 100000
+    python bench_user_store.py --mock --sizes 1000 10000
+"""
+import argparse
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+from typing import Dict, List
+
+from user_store import UserStore
+
+BENCH_DB = 'login_app_bench'
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q / 100.0 * len(ordered)))] * 1000.0, 3)
+
+
+def make_collection(args):
+    if args.mock:
+        import mongomock
+        return mongomock.MongoClient()[BENCH_DB]['users']
+    from pymongo import MongoClient
+    client = MongoClient(args.uri, maxPoolSize=max(50, args.racers), serverSelectionTimeoutMS=5000)
+    return client[BENCH_DB]['users']
+
+
+def load_users(collection, start: int, stop: int, batch: int = 10000) -> None:
+    for first in range(start, stop, batch):
+        collection.insert_many([{'username': f"user{i:08d}", 'password': 'x' * 100, 'role': 'user'}
+                                for i in range(first, min(stop, first + batch))], ordered=False)
+
+
+def time_lookups(store: UserStore, size: int, lookups: int) -> Dict:
+    latencies = []
+    for _ in range(lookups):
+        name = f"user{random.randrange(size):08d}"
+        started = time.perf_counter()
+        user = store.find_for_login(name)
+        latencies.append(time.perf_counter() - started)
+        assert user is not None and set(user) == {'password', 'role'}
+    return {'users': size, 'lookups': lookups, 'mean_ms': round(statistics.mean(latencies) * 1000.0, 3),
+            'p50_ms': _percentile(latencies, 50), 'p99_ms': _percentile(latencies, 99)}
+
+
+def race(store: UserStore, racers: int) -> Dict:
+    barrier = threading.Barrier(racers)
+    wins: List[bool] = []
+
+    def register() -> None:
+        barrier.wait()
+        wins.append(store.create('race_target', 'x' * 100))
+
+    threads = [threading.Thread(target=register) for _ in range(racers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stored = store.users.count_documents({'username': 'race_target'})
+    return {'racers': racers, 'created': sum(wins), 'stored': stored, 'ok': sum(wins) == 1 and stored == 1}
+
+
+def run(args) -> Dict:
+    collection = make_collection(args)
+    collection.drop()
+    store = UserStore(collection)
+    if not args.no_index:
+        store.ensure_indexes()
+    report = {'backend': 'mongomock' if args.mock else args.uri, 'indexed': not args.no_index, 'lookups': []}
+    loaded = 0
+    try:
+        for size in sorted(args.sizes):
+            load_users(collection, loaded, size)
+            loaded = size
+            report['lookups'].append(time_lookups(store, size, args.lookups))
+        if not args.no_index:
+            report['registration_race'] = race(store, args.racers)
+    finally:
+        collection.drop()
+    return report
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--uri', default='mongodb://localhost:27017')
+    parser.add_argument('--mock', action='store_true', help='Use mongomock instead of a server')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--lookups', type=int, default=2000, help='Timed lookups per size')
+    parser.add_argument('--racers', type=int, default=20, help='Concurrent registrations of one name')
+    parser.add_argument('--no-index', action='store_true', help='Skip ensure_indexes (scan baseline)')
+    return parser
+
+
+def main(argv=None) -> int:
+    print(json.dumps(run(build_parser().parse_args(argv)), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Optional
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Raised when a password operation can't be queued or didn't finish in time."""
+
+
+def _watch_parent(parent: int) -> None:
+    # A killed parent never shuts the pool down; don't linger as an orphan
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    os._exit(0)
+
+
+def _init_worker(nice: int) -> None:
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), daemon=True).start()
+
+
+def _noop() -> None:
+    return None
+
+
+class PasswordHasher:
+    """Runs password hashing on a small, bounded pool of low-priority processes.
+
+    At most ``workers`` hashes run at once and at most ``max_pending`` wait;
+    beyond that ``HashingBusy`` is raised so a burst of sign-ins gets a quick
+    "try again" instead of occupying every core. Settings come from the
+    environment (.env):
+
+        HASH_WORKERS=2  HASH_MAX_PENDING=32  HASH_TIMEOUT_S=10  HASH_NICE=10
+        HASH_METHOD=scrypt  (e.g. scrypt:32768:8:1 or pbkdf2:sha256:600000)
+        HASH_INLINE=1       (hash on the request thread instead)
+    """
+
+    def __init__(self):
+        self.inline = os.getenv('HASH_INLINE', '0') == '1'
+        self.workers = max(1, int(os.getenv('HASH_WORKERS', 2)))
+        self.max_pending = max(1, int(os.getenv('HASH_MAX_PENDING', 32)))
+        self.timeout = float(os.getenv('HASH_TIMEOUT_S', 10))
+        self.nice = int(os.getenv('HASH_NICE', 10))
+        self.method = os.getenv('HASH_METHOD', 'scrypt')
+        self._executor: Optional[Executor] = None
+        self._pid: Optional[int] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Create the pool in this process and fork its workers now (call before starting threads)."""
+        if self.inline:
+            return
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            if 'fork' in multiprocessing.get_all_start_methods():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_worker, initargs=(self.nice,))
+            else:
+                # hashlib releases the GIL, so threads still bound concurrent hashing
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pid = os.getpid()
+            executor = self._executor
+        executor.submit(_noop).result()
+
+    def _pool(self) -> Executor:
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+        if executor is None:
+            self.start()
+            with self._lock:
+                executor = self._executor
+        if executor is None:  # Another request saw the pool break in the meantime
+            raise HashingBusy("Password hashing pool restarted")
+        return executor
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _reset(self, executor: Executor) -> None:
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _run(self, fn: Callable, *args):
+        if self.inline:
+            return fn(*args)
+        executor = self._pool()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HashingBusy("Too many sign-ins at once")
+            self._pending += 1
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._release()
+            self._reset(executor)
+            raise HashingBusy("Password hashing pool restarted")
+        # The slot stays taken until the job is really done, not just until this request gives up
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy("Password check timed out")
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise HashingBusy("Password hashing pool restarted")
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run(check_password_hash, pwhash, password)
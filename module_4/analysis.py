@@ -0,0 +1,534 @@
+import cv2
+import json
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import yaml
+
+import metrics
+from metrics import stage_timer, FpsMeter
+from profiler import profiler
+from framering import FrameRing, load_ring_config
+from scheduler import scheduler
+from inference import inference_pool, LIVE, OFFLINE
+from encoder import TierEncoder, load_output_config
+from hls import HlsStream, hls_available, load_hls_config
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+EMPTY_DATA = {"person_details": {}, "global_metrics": {}}
+# Content-Length lets a browser parse the stream with fetch(); X-Frame-Seq matches a frame to its overlay
+MJPEG_PART_HEADER = '--frame\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\nX-Frame-Seq: {}\r\n\r\n'
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+DEFAULT_SESSION_CONFIG = {
+    'max_sessions': 8,        # Each session holds a tracker, a frame ring and (while running) a pipeline thread
+    'idle_timeout_s': 15,     # Stop a pipeline nobody has watched for this long
+    'evict_after_s': 600,     # Drop a stopped session's state after this long
+    'cameras': {'webcam': {'source': 0, 'label': 'Webcam'}},
+}
+
+# Methods a web worker may call on the state owner (see ipc.py / serve.py)
+ANALYSIS_RPC_METHODS = (
+    'ready', 'open_camera', 'open_file', 'cameras', 'list_sessions', 'describe',
+    'start', 'stop', 'close', 'reset', 'set_zone', 'ring_name', 'get_person_data',
+    'latest_for', 'update_thresholds', 'stats', 'core_budgets', 'inference_report',
+    'metrics_text', 'profile', 'memory_report', 'trace_report', 'start_hls', 'can_manage',
+)
+
+
+def load_session_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `sessions` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_SESSION_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('sessions') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load session config: {e}. Using defaults.")
+    return config
+
+
+class SessionError(Exception):
+    """A session request that can't be served; ``status`` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class Pipeline(threading.Thread):
+    """Decode -> detect/track -> log alerts -> encode per tier -> publish to the tier rings, for one session.
+
+    Annotated tiers carry frames with the boxes and zone drawn in. ``-raw`` tiers
+    carry the frames as decoded, each with its overlay (boxes, ids, zone, alert
+    flags) as the slot's metadata, keyed by the same frame sequence number as the
+    part's ``X-Frame-Seq`` header, for pages that draw the overlays themselves.
+    The tracker skips drawing while no annotated tier (and no HLS stream) is being watched.
+    An HLS viewer gets the annotated frames through ``session.hls`` instead of a ring.
+
+    New alerts are logged once for every user who has opened this session's stream
+    since the pipeline started (``session.viewer_ids``), so each viewer finds them
+    in their own history and CSV export, as when every viewer ran their own loop.
+    """
+
+    def __init__(self, session: 'AnalysisSession', idle_timeout: float):
+        super().__init__(name=f"pipeline-{session.id}", daemon=True)
+        self.session = session
+        self.idle_timeout = idle_timeout
+        self.ring = session.ring
+        self.rings = session.tier_rings
+        # (generation, first seq) of every tier's ring, for viewers joining this stream
+        self.streams = {tier: ring.begin_stream() for tier, ring in self.rings.items()}
+        self.generation, self.start_seq = self.streams[session.encoder.default_tier]
+        self.frame_seq = 0
+        self._stop_event = threading.Event()
+
+    def _end_streams(self) -> None:
+        for ring in self.rings.values():
+            ring.end_stream()
+
+    def _watched(self) -> List[str]:
+        now = time.time()
+        return [tier for tier, ring in self.rings.items() if now - ring.last_read <= self.session.encoder.watch_window]
+
+    def _publish(self, watched: List[str], processed, raw, data: Dict, overlay: Dict) -> None:
+        """Encode the frame once per watched tier and publish; metrics go to the default tier, overlays to raw tiers."""
+        session = self.session
+        encoder = session.encoder
+        with stage_timer('encode'):
+            encoded = encoder.encode(processed, watched, raw)
+            meta = json.dumps(data).encode()
+            overlay_meta = b''
+            if any(not encoder.tiers[tier][2] for tier in encoded):
+                height, width = raw.shape[:2]
+                overlay_meta = json.dumps(dict(overlay, seq=self.frame_seq, width=width, height=height)).encode()
+        for tier, ring in self.rings.items():
+            jpeg = encoded.get(tier)
+            if ring is self.ring:
+                ring_meta = meta
+            else:
+                ring_meta = overlay_meta if jpeg is not None and not encoder.tiers[tier][2] else b''
+            if jpeg is None and not ring_meta:
+                continue
+            chunk = b''
+            if jpeg is not None:
+                header = MJPEG_PART_HEADER.format(memoryview(jpeg).nbytes, self.frame_seq).encode()
+                chunk = (header, jpeg, b'\r\n')
+            if not ring.publish(chunk, ring_meta):
+                metrics.FRAMES_DROPPED.labels(session.metrics_label, 'oversize').inc()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def run(self) -> None:
+        session = self.session
+        cap = cv2.VideoCapture(session.source)
+        if not cap.isOpened():
+            logger.error(f"Failed to open video source for session {session.id}: {session.source}")
+            self._end_streams()
+            return
+
+        fps = FpsMeter(session.metrics_label)
+        profiler.register_thread(self.name)
+        scheduler.register(session.id, session.priority, session.target_fps)
+        budget_generation = -1
+        # Analyse at most target_fps frames a second; faster cameras have the surplus skipped
+        interval = 1.0 / session.target_fps if session.target_fps else 0.0
+        next_due = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                # Nobody watching: stop instead of burning CPU on frames no one sees
+                last_seen = max(ring.last_read for ring in self.rings.values())
+                if session.hls is not None:
+                    last_seen = max(last_seen, session.hls.last_request)
+                if time.time() - last_seen > self.idle_timeout:
+                    logger.info(f"{self.name} idle for {self.idle_timeout:.0f}s, stopping")
+                    break
+                budget_generation = scheduler.apply(session.id, budget_generation)
+
+                if interval:
+                    now = time.monotonic()
+                    if now < next_due:
+                        if session.kind == 'camera':
+                            cap.grab()  # Keep the capture buffer fresh without decoding
+                            continue
+                        time.sleep(next_due - now)
+                    next_due = max(next_due + interval, now)
+
+                with stage_timer('decode'):
+                    ret, frame = cap.read()
+                if not ret:
+                    if session.kind == 'camera':
+                        metrics.FRAMES_DROPPED.labels(session.metrics_label, 'read_failed').inc()
+                    break
+
+                # A live frame that would miss its latency SLO is skipped, not queued behind
+                if not inference_pool.admit(session.inference_class):
+                    metrics.FRAMES_DROPPED.labels(session.metrics_label, 'admission').inc()
+                    continue
+
+                watched = self._watched()
+                hls_live = session.hls is not None and session.hls.live
+                with session.lock:
+                    processed, data, new_alerts = session.tracker.process_frame(
+                        frame, annotate=hls_live or session.encoder.needs_annotation(watched))
+                    overlay = session.tracker.overlay
+                    session.person_data = data
+                session.last_active = time.time()
+
+                if new_alerts:
+                    for user_id in session.viewer_ids():
+                        session.on_alerts(new_alerts, user_id)
+
+                self.frame_seq += 1
+                self._publish(watched, processed, frame, data, overlay)
+                if hls_live:
+                    session.hls.offer(processed)
+                fps.tick()
+        except Exception as e:
+            metrics.FRAMES_DROPPED.labels(session.metrics_label, 'error').inc()
+            logger.error(f"Error in frame pipeline for session {session.id}: {e}")
+        finally:
+            scheduler.unregister(session.id)
+            profiler.unregister_thread()
+            cap.release()
+            self._end_streams()
+            if session.hls is not None:
+                session.hls.finish()
+            logger.info(f"{self.name} released its video source.")
+
+
+class AnalysisSession:
+    """One camera or uploaded video: its own tracker state, zone, metrics snapshot and frame ring.
+
+    ``owner_id`` is the user who opened it; only they (or an admin) may stop,
+    reset, re-zone or close it. Anyone logged in may watch.
+    """
+
+    def __init__(self, session_id: str, kind: str, source, label: str, tracker,
+                 ring_config: Dict, on_alerts: Callable[[List[Dict], int], None],
+                 encoder: TierEncoder, priority: Optional[int] = None, target_fps: float = 0,
+                 hls: Optional[HlsStream] = None, owner_id: Optional[int] = None):
+        self.id = session_id
+        self.owner_id = owner_id
+        self.kind = kind  # 'camera' or 'file'
+        self.source = source
+        self.label = label
+        self.priority = int(priority or scheduler.default_priority(kind))
+        self.target_fps = float(target_fps or 0)  # 0 = as fast as the source delivers
+        self.tracker = tracker
+        self.inference_class = LIVE if kind == 'camera' else OFFLINE
+        tracker.runner = inference_pool.bind(self.inference_class, session_id)
+        self.on_alerts = on_alerts
+        self.encoder = encoder
+        # One ring per output tier; only tiers somebody reads get frames (and touch their pages).
+        # The default tier's ring also carries the metrics snapshots.
+        self.tier_rings = {tier: FrameRing.create(ring_config) for tier in encoder.tiers}
+        self.ring = self.tier_rings[encoder.default_tier]
+        self.hls = hls  # None when HLS output is off or FFmpeg is missing
+        self.person_data: Dict = dict(EMPTY_DATA)
+        self.pipeline: Optional[Pipeline] = None
+        self.viewers: set = set()  # Users who opened the stream during the current pipeline run
+        self.created = time.time()
+        self.last_active = self.created
+        self.lock = threading.RLock()  # Guards the tracker between the pipeline and requests
+        self._pipeline_lock = threading.Lock()
+        # Camera ids are a small fixed set; uploads share one series so label cardinality stays bounded
+        self.metrics_label = session_id if kind == 'camera' else 'file'
+
+    @property
+    def running(self) -> bool:
+        return self.pipeline is not None and self.pipeline.is_alive()
+
+    def viewer_ids(self) -> List[int]:
+        with self._pipeline_lock:
+            return sorted(self.viewers)
+
+    def tier_ring(self, tier: Optional[str]) -> FrameRing:
+        ring = self.tier_rings.get(tier or self.encoder.default_tier)
+        if ring is None:
+            raise SessionError(f"Unknown output tier: {tier} (available: {', '.join(self.tier_rings)})")
+        return ring
+
+    def start(self, user_id: int, idle_timeout: float, tier: Optional[str] = None) -> Dict:
+        """Ensure the pipeline is running; returns where a ``tier`` viewer should read: ``{'ring', 'generation', 'seq'}``."""
+        tier = tier or self.encoder.default_tier
+        ring = self.tier_ring(tier)
+        with self._pipeline_lock:
+            self.last_active = time.time()
+            if not self.running:
+                self.viewers = {user_id} if user_id else set()
+                self.pipeline = Pipeline(self, idle_timeout)
+                self.pipeline.start()
+                generation, seq = self.pipeline.streams[tier]
+                return {'ring': ring.name, 'generation': generation, 'seq': seq}
+            if user_id:
+                self.viewers.add(user_id)
+            ring.touch()  # Start encoding this tier now, before the viewer's first wait
+            return {'ring': ring.name, 'generation': self.pipeline.streams[tier][0], 'seq': ring.head}
+
+    def start_hls(self, user_id: int, idle_timeout: float) -> Dict:
+        """Ensure the pipeline and its HLS encoding run; returns ``{'token', 'ready'}`` of the stream."""
+        if self.hls is None:
+            raise SessionError("HLS output is not available (disabled, or FFmpeg is not installed)", 503)
+        info = self.hls.request()
+        self.start(user_id, idle_timeout)
+        return info
+
+    def stop(self) -> None:
+        with self._pipeline_lock:
+            if self.pipeline is not None:
+                self.pipeline.stop()
+                self.pipeline.join(timeout=5)
+
+    def close(self) -> None:
+        self.stop()
+        if self.hls is not None:
+            self.hls.close()
+        for ring in self.tier_rings.values():
+            ring.close()
+
+    def reset(self) -> None:
+        with self.lock:
+            self.tracker.reset()
+            self.person_data = dict(EMPTY_DATA)
+        self.ring.publish(b'', json.dumps(EMPTY_DATA).encode())
+
+    def set_zone(self, start: Tuple[int, int], end: Tuple[int, int]) -> None:
+        with self.lock:
+            self.tracker.red_zone.set_points(tuple(start), tuple(end))
+
+    def describe(self) -> Dict:
+        tracker = self.tracker
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'owner_id': self.owner_id,
+            'label': self.label,
+            'running': self.running,
+            'zone_ready': tracker.red_zone.ready,
+            'created': self.created,
+            'last_active': self.last_active,
+            'active_tracks': len(tracker.track_data),
+            'heatmap_points': len(tracker.heatmap_points),
+            'people': self.person_data.get('global_metrics', {}).get('total_count', 0),
+            'priority': self.priority,
+            'target_fps': self.target_fps,
+            'core_budget': scheduler.budget(self.id),
+            'tiers': list(self.tier_rings),
+            'hls': self.hls is not None and self.hls.token is not None,
+        }
+
+
+class SessionRegistry:
+    """All analysis sessions of this deployment, keyed by camera or upload id.
+
+    Sessions share one loaded model (see ``PersonTracker.spawn``) but nothing
+    else. At most ``max_sessions`` exist at once; stopped sessions are evicted
+    after ``evict_after_s``, or earlier to make room for a new one.
+
+    In the default single-process mode the app calls this object directly. Under
+    serve.py it lives only in the master process and web workers reach it through
+    an RpcClient exposing ``ANALYSIS_RPC_METHODS``. Frames and metric snapshots
+    don't go through RPC: viewers read them from each session's FrameRing.
+    """
+
+    def __init__(self, on_alerts: Callable[[List[Dict], int], None],
+                 resolve_path: Callable[[str], str], config: Optional[Dict] = None):
+        self.on_alerts = on_alerts
+        self.resolve_path = resolve_path
+        self.config = config or load_session_config()
+        self.ring_config = load_ring_config()
+        self.encoder = TierEncoder(load_output_config())
+        self.hls_config = load_hls_config()
+        self.hls_enabled = hls_available(self.hls_config)
+        self.template = None  # Warmed-up tracker every session is spawned from
+        self.system_settings: Dict = {}
+        self.sessions: Dict[str, AnalysisSession] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        # Set by the app: callables that report process-level telemetry
+        self.metrics_renderer: Callable[[], str] = metrics.REGISTRY.render
+        self.memory_reporter: Optional[Callable[..., Dict]] = None
+        self.trace_reporter: Optional[Callable[..., Dict]] = None
+
+    def set_template(self, tracker) -> None:
+        self.template = tracker
+
+    def ready(self) -> bool:
+        return self.template is not None
+
+    # --- Opening sessions ---
+
+    def cameras(self) -> Dict[str, Dict]:
+        return {cid: dict(cam) for cid, cam in (self.config.get('cameras') or {}).items()}
+
+    def open_camera(self, camera_id: str, owner_id: Optional[int] = None) -> str:
+        """Session for a configured camera; whoever opens it first owns it until it is closed or evicted."""
+        camera = (self.config.get('cameras') or {}).get(camera_id)
+        if camera is None:
+            raise SessionError(f"Unknown camera: {camera_id}", 404)
+        return self._open(camera_id, 'camera', camera['source'], camera.get('label', camera_id),
+                          camera.get('priority'), camera.get('target_fps', 0), owner_id)
+
+    def open_file(self, filename: str, path: Optional[str] = None, owner_id: Optional[int] = None) -> str:
+        """Session for an uploaded video; ``path`` pins the file (proxy or original) the zone is drawn on.
+
+        Uploads are stored by content hash, so two users uploading the same video
+        share one file; the session id includes the owner so they still get
+        separate trackers and zones.
+        """
+        digest = re.sub(r'[^A-Za-z0-9_-]', '', os.path.splitext(filename)[0])[:32]
+        session_id = f"file-{owner_id}-{digest}" if owner_id is not None else f"file-{digest}"
+        session_id = self._open(session_id, 'file', path or self.resolve_path(filename), filename,
+                                owner_id=owner_id)
+        if path:
+            self.sessions[session_id].source = path
+        return session_id
+
+    def _open(self, session_id: str, kind: str, source, label: str,
+              priority: Optional[int] = None, target_fps: float = 0, owner_id: Optional[int] = None) -> str:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise SessionError(f"Invalid session id: {session_id}")
+        if self.template is None:
+            raise SessionError("Detector is warming up", 503)
+        with self._lock:
+            if session_id in self.sessions:
+                return session_id
+            if len(self.sessions) >= int(self.config['max_sessions']):
+                self._evict_one()
+            tracker = self.template.spawn()
+            if self.system_settings:
+                tracker.update_thresholds(self.system_settings)
+            hls = HlsStream(session_id, self.hls_config) if self.hls_enabled else None
+            self.sessions[session_id] = AnalysisSession(session_id, kind, source, label, tracker,
+                                                        self.ring_config, self.on_alerts, self.encoder,
+                                                        priority, target_fps, hls, owner_id)
+        self._start_reaper()
+        logger.info(f"Opened {kind} session {session_id} ({len(self.sessions)} total)")
+        return session_id
+
+    def _evict_one(self) -> None:
+        """Make room by closing the least recently active stopped session (caller holds the lock)."""
+        stopped = [s for s in self.sessions.values() if not s.running]
+        if not stopped:
+            raise SessionError(f"All {len(self.sessions)} analysis sessions are busy", 429)
+        victim = min(stopped, key=lambda s: s.last_active)
+        self._close_locked(victim.id)
+
+    def _close_locked(self, session_id: str) -> None:
+        session = self.sessions.pop(session_id)
+        session.close()
+        logger.info(f"Closed session {session_id}")
+
+    def _start_reaper(self) -> None:
+        if self._reaper is None:
+            self._reaper = threading.Thread(target=self._reap_loop, name='session-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self) -> None:
+        while True:
+            time.sleep(max(1.0, float(self.config['evict_after_s']) / 10))
+            cutoff = time.time() - float(self.config['evict_after_s'])
+            with self._lock:
+                for session in list(self.sessions.values()):
+                    if not session.running and session.last_active < cutoff:
+                        self._close_locked(session.id)
+
+    # --- Per-session operations ---
+
+    def get(self, session_id: str) -> AnalysisSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise SessionError(f"No such session: {session_id}", 404)
+        return session
+
+    def list_sessions(self) -> List[Dict]:
+        return [s.describe() for s in list(self.sessions.values())]
+
+    def describe(self, session_id: str) -> Dict:
+        return self.get(session_id).describe()
+
+    def start(self, session_id: str, user_id: int, tier: Optional[str] = None) -> Dict:
+        return self.get(session_id).start(user_id, float(self.config['idle_timeout_s']), tier)
+
+    def can_manage(self, session_id: str, user_id: Optional[int], is_admin: bool = False) -> bool:
+        """Whether the user may stop, reset, re-zone or close the session: its owner, or an admin."""
+        owner_id = self.get(session_id).owner_id
+        return is_admin or (owner_id is not None and owner_id == user_id)
+
+    def start_hls(self, session_id: str, user_id: int) -> Dict:
+        return self.get(session_id).start_hls(user_id, float(self.config['idle_timeout_s']))
+
+    def stop(self, session_id: str) -> None:
+        self.get(session_id).stop()
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            self.get(session_id)
+            self._close_locked(session_id)
+
+    def reset(self, session_id: str) -> None:
+        self.get(session_id).reset()
+
+    def set_zone(self, session_id: str, start: Tuple[int, int], end: Tuple[int, int]) -> None:
+        self.get(session_id).set_zone(start, end)
+
+    def ring_name(self, session_id: str, tier: Optional[str] = None) -> str:
+        return self.get(session_id).tier_ring(tier).name
+
+    def get_person_data(self, session_id: str) -> Dict:
+        return self.get(session_id).person_data
+
+    def latest_for(self, user_id: Optional[int]) -> Optional[str]:
+        """The most recently active session the user opened or is watching (what the single-source routes use)."""
+        mine = [s for s in list(self.sessions.values())
+                if user_id is not None and (s.owner_id == user_id or user_id in s.viewer_ids())]
+        return max(mine, key=lambda s: s.last_active).id if mine else None
+
+    def update_thresholds(self, system_settings: Dict) -> None:
+        self.system_settings = dict(system_settings)
+        for session in list(self.sessions.values()):
+            with session.lock:
+                session.tracker.update_thresholds(system_settings)
+
+    def stats(self) -> Dict[str, int]:
+        sessions = list(self.sessions.values())
+        return {
+            'sessions': len(sessions),
+            'running_sessions': sum(1 for s in sessions if s.running),
+            'active_tracks': sum(len(s.tracker.track_data) for s in sessions),
+            'heatmap_points': sum(len(s.tracker.heatmap_points) for s in sessions),
+            'person_details': sum(len(s.person_data.get('person_details', {})) for s in sessions),
+        }
+
+    # --- Process-level diagnostics (served from whichever process owns the pipelines) ---
+
+    def core_budgets(self) -> Dict:
+        return scheduler.report()
+
+    def inference_report(self) -> Dict:
+        return inference_pool.report()
+
+    def metrics_text(self) -> str:
+        return self.metrics_renderer()
+
+    def profile(self, seconds: float, hz: int, pipeline_only: bool = True) -> Dict:
+        return profiler.sample(seconds, hz, pipeline_only=pipeline_only)
+
+    def memory_report(self, limit: int = 120, sample: bool = False) -> Dict:
+        return self.memory_reporter(limit=limit, sample=sample) if self.memory_reporter else {}
+
+    def trace_report(self, limit: int = 50) -> Dict:
+        return self.trace_reporter(limit=limit) if self.trace_reporter else {}
+
+    def shutdown(self) -> None:
+        """Stop every pipeline and release the shared-memory rings."""
+        with self._lock:
+            for session_id in list(self.sessions):
+                self._close_locked(session_id)
@@ -1,21 +1,41 @@
-from flask import Flask, render_template, Response, jsonify, send_file, request, redirect, url_for, flash, g
+from flask import Flask, render_template, Response, jsonify, send_file, send_from_directory, request, redirect, url_for, flash, g
 from detector import PersonTracker
-from repoet_generator import generate_pdf
+from uploads import UploadStore, UploadError
+from transcoder import ProxyTranscoder, load_proxy_config
+import metrics
+from metrics import stage_timer
+from profiler import ProfilerBusy
+from analysis import SessionRegistry, SessionError, EMPTY_DATA
+from framering import FrameRing
+from ipc import RemoteError
+from purge import PurgeManager, load_purge_config
+from retention import AlertRetention, load_retention_config
+from encoder import RAW_SUFFIX, load_output_config
+from hls import FILE_PATTERN, PLAYLIST, TOKEN_PATTERN, hls_available, load_hls_config, mark_watched
+from storage import database_uri, engine_options, install_sqlite_pragmas, load_sqlite_config
+from tracing import tracer
+from hashing import HashingBusy, password_hasher
+from memtelemetry import MemoryTelemetry, load_telemetry_config, sqlalchemy_identity_map_size, gc_object_count
 import cv2
 import logging
-from typing import Generator
+from typing import Dict, Generator, List, Optional, Tuple
 import os
 from werkzeug.utils import secure_filename
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager, create_access_token, set_access_cookies, unset_jwt_cookies, jwt_required, get_jwt_identity, verify_jwt_in_request, get_jwt
 from dotenv import load_dotenv
 import datetime
 import io
+import atexit
 import csv
+import json
+import hmac
+import threading
+import time
 # --- NEW: For admin decorator ---
 from functools import wraps
-from sqlalchemy import func
+from sqlalchemy import func, inspect as sa_inspect, select, text
+from sqlalchemy.orm import joinedload
 # ---
 
 # --- Load environment variables ---
@@ -34,18 +54,17 @@ os.makedirs(PROFILE_PIC_FOLDER, exist_ok=True)
 app = Flask(__name__)
 
 # --- Database Config ---
-DB_USER = os.getenv('DB_USER')
-DB_PASSWORD = os.getenv('DB_PASSWORD')
-DB_HOST = os.getenv('DB_HOST')
-DB_PORT = os.getenv('DB_PORT')
-DB_NAME = os.getenv('DB_NAME')
-DATABASE_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DB_BACKEND=postgresql (DB_* variables) or sqlite (SQLITE_PATH) for single-node edge boxes;
+# DATABASE_URL overrides both (e.g. a local SQLite stand-in for load tests)
+sqlite_config = load_sqlite_config()
+DATABASE_URI = database_uri(sqlite_config)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROFILE_PIC_FOLDER'] = PROFILE_PIC_FOLDER
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
 app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URI, sqlite_config)
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY')
 
 # --- JWT Config ---
@@ -55,12 +74,26 @@ app.config['JWT_ACCESS_COOKIE_PATH'] = '/'
 app.config['JWT_COOKIE_CSRF_PROTECT'] = False
 
 db = SQLAlchemy(app)
-jwt = JWTManager(app)
 
-# --- MODIFIED: Detector initialized later ---
-detector = None
-person_data = {"person_details": {}, "global_metrics": {}}
-active_video_source = None
+# WAL, cache and foreign-key pragmas on every SQLite connection (no-op on PostgreSQL)
+with app.app_context():
+    install_sqlite_pragmas(db.engine, sqlite_config)
+    tracer.init_app(app, db.engine)
+jwt = JWTManager(app)
+upload_store = UploadStore(UPLOAD_FOLDER)
+transcoder = ProxyTranscoder(UPLOAD_FOLDER, load_proxy_config())
+# Tier names offered on the video pages, and where they draw overlays; the pipelines encode them (see encoder.py)
+output_config = load_output_config()
+OUTPUT_TIERS = list(output_config.get('tiers') or {})
+OVERLAY_MODES = ['server', 'client'] if output_config.get('client_overlays', True) else ['server']
+DEFAULT_OVERLAY_MODE = output_config.get('overlay_mode') if output_config.get('overlay_mode') in OVERLAY_MODES else 'server'
+DEFAULT_TIER = output_config.get('default_tier')
+# HLS files are written by whichever process runs the pipelines and served by every web worker
+hls_config = load_hls_config()
+HLS_ENABLED = hls_available(hls_config)
+
+# --- MODIFIED: Detectors live in per-source analysis sessions (see VIDEO ANALYSIS); the model warms up in the background ---
+warmup_state = {"state": "pending", "error": None, "started_at": None, "ready_at": None, "warmup_seconds": None}
 
 # --- DATABASE MODELS ---
 
@@ -78,29 +111,44 @@ class User(db.Model):
     # --- NEW: Role for Admin ---
     role = db.Column(db.String(50), nullable=False, default='user')
     
-    # Relationship to alerts
-    alerts = db.relationship('AlertHistory', backref='user', lazy=True, cascade="all, delete-orphan")
+    # Relationship to alerts. The database deletes them (ON DELETE CASCADE); passive_deletes
+    # stops the ORM from loading and deleting every row itself first.
+    alerts = db.relationship('AlertHistory', backref='user', lazy=True, cascade="all, delete-orphan", passive_deletes=True)
+    alert_stats = db.relationship('UserAlertStats', uselist=False, lazy=True, cascade="all, delete-orphan", passive_deletes=True)
 
 class AlertHistory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, index=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow, index=True)
     alert_type = db.Column(db.String(50), nullable=False)
     message = db.Column(db.String(255), nullable=False)
 
+# --- NEW: Per-user alert totals, kept current by log_alerts so the admin panel never scans AlertHistory ---
+class UserAlertStats(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), primary_key=True)
+    alert_count = db.Column(db.Integer, nullable=False, default=0)
+    last_alert_at = db.Column(db.DateTime, nullable=True)
+
 # --- NEW: System-wide settings table ---
 class SystemSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(50), unique=True, nullable=False)
     value = db.Column(db.String(100), nullable=False)
 
+# --- NEW: System events (memory alarms etc.), not tied to a user ---
+class SystemEvent(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    timestamp = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    event_type = db.Column(db.String(50), nullable=False)
+    message = db.Column(db.String(255), nullable=False)
+
 # --- HELPER FUNCTIONS ---
 
 def get_system_settings_from_db():
     """Fetches system settings from DB or returns defaults."""
     try:
         settings = SystemSettings.query.all()
-        settings_dict = {s.key: int(s.value) for s in settings}
+        settings_dict = {s.key: int(s.value) for s in settings if s.value.lstrip('-').isdigit()}
         defaults = {
             'person_threshold': settings_dict.get('person_threshold', 10),
             'zone_threshold': settings_dict.get('zone_threshold', 5),
@@ -120,7 +168,9 @@ def initialize_system_settings():
     defaults = {
         'person_threshold': '10',
         'zone_threshold': '5',
-        'overall_threshold': '20'
+        'overall_threshold': '20',
+        'retention_months': '0',    # Keep alerts this many whole months; 0 keeps them forever
+        'retention_archive': '1'    # 1: write expired months to .csv.gz before dropping them
     }
     try:
         for key, value in defaults.items():
@@ -133,6 +183,66 @@ def initialize_system_settings():
         db.session.rollback()
         logger.error(f"Could not initialize system settings: {e}")
 
+def migrate_cascade_foreign_keys():
+    """Give existing user_id foreign keys ON DELETE CASCADE (PostgreSQL; create_all() never alters a table)."""
+    if db.engine.dialect.name != 'postgresql':
+        return
+    inspector = sa_inspect(db.engine)
+    for table in ('alert_history', 'user_alert_stats'):
+        for fk in inspector.get_foreign_keys(table):
+            if fk['referred_table'] != 'user' or (fk.get('options') or {}).get('ondelete', '').upper() == 'CASCADE':
+                continue
+            name = fk['name']
+            # NOT VALID + VALIDATE: the long check of existing rows runs without blocking writes
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{name}"'))
+                conn.execute(text(f'ALTER TABLE {table} ADD CONSTRAINT "{name}" FOREIGN KEY (user_id) '
+                                  f'REFERENCES "user" (id) ON DELETE CASCADE NOT VALID'))
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table} VALIDATE CONSTRAINT "{name}"'))
+            logger.info(f"Foreign key {table}.{name} now cascades deletes")
+
+def backfill_alert_stats():
+    """Create UserAlertStats rows for users that have none (one GROUP BY over just those users)."""
+    try:
+        missing = [uid for (uid,) in db.session.query(User.id).outerjoin(UserAlertStats)
+                   .filter(UserAlertStats.user_id.is_(None)).all()]
+        if not missing:
+            return
+        totals = {}
+        for start in range(0, len(missing), 500):
+            chunk = missing[start:start + 500]
+            totals.update({uid: (count, last) for uid, count, last in db.session.query(
+                AlertHistory.user_id, func.count(AlertHistory.id), func.max(AlertHistory.timestamp)
+            ).filter(AlertHistory.user_id.in_(chunk)).group_by(AlertHistory.user_id)})
+        for uid in missing:
+            count, last = totals.get(uid, (0, None))
+            db.session.add(UserAlertStats(user_id=uid, alert_count=count, last_alert_at=last))
+        db.session.commit()
+        logger.info(f"Backfilled alert totals for {len(missing)} users")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Could not backfill alert stats: {e}")
+
+def bump_alert_stats(user_id: int, delta: int, last_alert_at: Optional[datetime.datetime] = None):
+    """Adjust a user's cached alert total inside the caller's transaction (negative when alerts are deleted)."""
+    values = {UserAlertStats.alert_count: UserAlertStats.alert_count + delta}
+    if last_alert_at is not None:
+        values[UserAlertStats.last_alert_at] = last_alert_at
+    # A single UPDATE ... SET alert_count = alert_count + n, so concurrent pipelines don't lose counts
+    updated = UserAlertStats.query.filter_by(user_id=user_id).update(values, synchronize_session=False)
+    if not updated:
+        db.session.add(UserAlertStats(user_id=user_id, alert_count=max(delta, 0), last_alert_at=last_alert_at))
+
+# --- ALERT RETENTION ---
+alert_retention = AlertRetention(db, bump_alert_stats, load_retention_config())
+
+def get_retention_policy() -> Tuple[int, bool]:
+    """``(months, archive)`` as set by admins in SystemSettings."""
+    values = {s.key: s.value for s in SystemSettings.query.filter(
+        SystemSettings.key.in_(['retention_months', 'retention_archive'])).all()}
+    return int(values.get('retention_months', 0)), values.get('retention_archive', '1') == '1'
+
 # --- NEW: Admin Decorator ---
 def admin_required():
     def wrapper(fn):
@@ -148,19 +258,150 @@ def admin_required():
         return decorator
     return wrapper
 
+def log_system_event(event_type: str, message: str):
+    """Persist a system-level event such as a memory growth alarm."""
+    with app.app_context():
+        try:
+            db.session.add(SystemEvent(event_type=event_type, message=message[:255]))
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error logging system event: {e}")
+
+memory_telemetry = MemoryTelemetry(load_telemetry_config(), on_alarm=log_system_event)
+memory_telemetry.register_probe('track_data', lambda: sessions.stats()['active_tracks'])
+memory_telemetry.register_probe('heatmap_points', lambda: sessions.stats()['heatmap_points'])
+memory_telemetry.register_probe('person_details', lambda: sessions.stats()['person_details'])
+memory_telemetry.register_probe('analysis_sessions', lambda: sessions.stats()['sessions'])
+memory_telemetry.register_probe('sqlalchemy_identity_map', sqlalchemy_identity_map_size)
+memory_telemetry.register_probe('gc_objects', gc_object_count)
+
+def memory_report(limit: int = 120, sample: bool = False) -> dict:
+    """Telemetry report for this process, optionally taking a fresh sample first."""
+    if sample:
+        memory_telemetry.sample()
+    return memory_telemetry.report(limit=limit)
+
+def detector_required(api: bool = False):
+    """Reject requests that need the detector until background warm-up has finished."""
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            if sessions.ready():
+                return fn(*args, **kwargs)
+            if api:
+                return jsonify({"error": "Detector is warming up", "warmup": warmup_state}), 503
+            flash("The detector is still starting up. Please try again in a few seconds.")
+            return redirect(url_for('dashboard'))
+        return decorator
+    return wrapper
+
+def build_detector() -> PersonTracker:
+    """Load the model (importing ultralytics/torch), warm it up and make it the template for new sessions."""
+    warmup_state.update(state="loading", started_at=time.time())
+    with app.app_context():
+        tracker = PersonTracker(system_settings=get_system_settings_from_db())
+    warmup_state["warmup_seconds"] = round(tracker.warmup(), 3)
+    # Pick up any threshold change an admin saved while we were loading
+    with app.app_context():
+        system_settings = get_system_settings_from_db()
+    tracker.update_thresholds(system_settings)
+    sessions.update_thresholds(system_settings)
+    sessions.set_template(tracker)
+    warmup_state.update(state="ready", ready_at=time.time())
+    return tracker
+
+def warm_up_detector():
+    """Run build_detector off the request path, recording failures for /ready."""
+    try:
+        build_detector()
+        logger.info(f"Detector ready after {warmup_state['ready_at'] - warmup_state['started_at']:.1f}s")
+    except Exception as e:
+        warmup_state.update(state="failed", error=str(e))
+        logger.error(f"Detector warm-up failed: {e}")
+
 # --- APP INITIALIZATION ---
-def create_app():
+def init_database():
+    """Create tables and default settings (also called by serve.py before forking workers)."""
     with app.app_context():
         db.create_all()
+        migrate_cascade_foreign_keys()
+        try:
+            alert_retention.ensure_partitioned()
+            alert_retention.ensure_partitions()
+        except Exception as e:
+            logger.error(f"Could not partition {AlertHistory.__tablename__}: {e}")
+        # create_all() skips tables that already exist, so add indexes introduced since
+        for index in AlertHistory.__table__.indexes:
+            index.create(db.engine, checkfirst=True)
         initialize_system_settings()
-        
-        # --- MODIFIED: Initialize detector with settings from DB ---
-        global detector
-        system_settings = get_system_settings_from_db()
-        detector = PersonTracker(system_settings=system_settings)
-        logger.info(f"Detector initialized with settings: {system_settings}")
+        backfill_alert_stats()
+
+def create_app():
+    password_hasher.start()  # Forks the hashing processes, so before any thread starts
+    init_database()
+    memory_telemetry.start()
+    resume_alert_purges()
+    alert_retention.start(app, get_retention_policy)
+
+    # --- MODIFIED: Detector loads in the background so pages are served immediately ---
+    threading.Thread(target=warm_up_detector, name='detector-warmup', daemon=True).start()
     return app
 
+# --- ACCOUNT DELETION ---
+
+DELETING_ROLE = 'deleting'  # Set while a background purge removes the user's alerts
+purges = PurgeManager(load_purge_config())
+
+def _remove_profile_pic(user):
+    if user.profile_pic != 'default.png':
+        pic_path = os.path.join(app.config['PROFILE_PIC_FOLDER'], user.profile_pic)
+        if os.path.exists(pic_path):
+            os.remove(pic_path)
+
+def start_alert_purge(user_id: int, username: str, total: int):
+    """Delete a user's alerts in bounded batches in the background, then the user row itself."""
+    def delete_batch(limit: int) -> int:
+        with app.app_context():
+            batch = select(AlertHistory.id).where(AlertHistory.user_id == user_id).limit(limit).scalar_subquery()
+            deleted = AlertHistory.query.filter(AlertHistory.id.in_(batch)).delete(synchronize_session=False)
+            bump_alert_stats(user_id, -deleted)
+            db.session.commit()
+            return deleted
+
+    def finish():
+        with app.app_context():
+            user = db.session.get(User, user_id)
+            if user:
+                _remove_profile_pic(user)
+                db.session.delete(user)  # Alerts logged meanwhile go with it (ON DELETE CASCADE)
+                db.session.commit()
+
+    return purges.start(f"user-{user_id}", username, total, delete_batch, finish)
+
+def delete_user_account(user) -> bool:
+    """Delete a user and their alert history.
+
+    Returns True if the user is gone now, False if the history was large enough
+    to hand to a background purge (the account is locked until it finishes).
+    """
+    total = user.alert_stats.alert_count if user.alert_stats else 0
+    if total <= int(purges.config['background_threshold']):
+        _remove_profile_pic(user)
+        db.session.delete(user)  # One DELETE; the database cascades to the alerts
+        db.session.commit()
+        return True
+    user.role = DELETING_ROLE
+    db.session.commit()
+    start_alert_purge(user.id, user.username, total)
+    return False
+
+def resume_alert_purges():
+    """Restart purges interrupted by a restart (users still marked as deleting)."""
+    with app.app_context():
+        for user in User.query.options(joinedload(User.alert_stats)).filter_by(role=DELETING_ROLE).all():
+            start_alert_purge(user.id, user.username, user.alert_stats.alert_count if user.alert_stats else 0)
+
 # --- USER & CONTEXT ---
 
 @app.before_request
@@ -171,6 +412,9 @@ def load_user():
         username = get_jwt_identity()
         if username:
             g.user = User.query.filter_by(username=username).first()
+            # An account whose history is still being purged is already gone for its owner
+            if g.user and g.user.role == DELETING_ROLE:
+                g.user = None
         else:
             g.user = None
     except Exception as e:
@@ -195,7 +439,13 @@ def login():
         username = request.form.get('username')
         password = request.form.get('password')
         user = User.query.filter_by(username=username).first()
-        if user and check_password_hash(user.password_hash, password):
+        try:
+            valid = user is not None and user.role != DELETING_ROLE and password_hasher.verify(user.password_hash, password)
+        except HashingBusy as e:
+            logger.warning(f"Login for {username} turned away: {e}")
+            flash('Too many sign-ins right now. Please try again in a moment.')
+            return render_template('login.html'), 503
+        if valid:
             # --- NEW: Add user role to JWT claims ---
             access_token = create_access_token(
                 identity=username, 
@@ -222,7 +472,12 @@ def register():
         if existing_user:
             flash('Username already exists.')
         else:
-            password_hash = generate_password_hash(password)
+            try:
+                password_hash = password_hasher.hash(password)
+            except HashingBusy as e:
+                logger.warning(f"Registration of {username} turned away: {e}")
+                flash('Too many sign-ins right now. Please try again in a moment.')
+                return render_template('register.html'), 503
             
             # --- NEW: Make the first user an admin ---
             is_first_user = User.query.count() == 0
@@ -230,6 +485,7 @@ def register():
             # ---
             
             new_user = User(username=username, password_hash=password_hash, role=role)
+            new_user.alert_stats = UserAlertStats(alert_count=0)
             db.session.add(new_user)
             db.session.commit()
             
@@ -255,6 +511,13 @@ def logout():
 def index():
     return redirect(url_for('login'))
 
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once the detector is loaded and warmed up, 503 before that."""
+    is_ready = sessions.ready()
+    body = dict(warmup_state, ready=is_ready)
+    return jsonify(body), (200 if is_ready else 503)
+
 @app.route('/favicon.ico')
 def favicon():
     return '', 204
@@ -263,20 +526,24 @@ def favicon():
 @jwt_required()
 def dashboard():
     """Render the 'New Analysis' page."""
-    return render_template('dashboard.html')
+    return render_template('dashboard.html', cameras=sessions.cameras())
 
 @app.route('/overview')
 @jwt_required()
 def overview():
     """Render the main dashboard page with video feed."""
-    global active_video_source
-    return render_template('overview.html', video_source=active_video_source)
+    session_id = requested_session()
+    video_source = url_for('session_video_feed', session_id=session_id) if session_id else None
+    return render_template('overview.html', video_source=video_source, session_id=session_id,
+                           sessions=visible_sessions(), tiers=OUTPUT_TIERS,
+                           default_tier=DEFAULT_TIER, overlay_modes=OVERLAY_MODES, overlay_mode=DEFAULT_OVERLAY_MODE,
+                           hls_enabled=HLS_ENABLED)
 
 @app.route('/summary')
 @jwt_required()
 def summary():
     """Render the summary dashboard page with charts."""
-    return render_template('summary.html')
+    return render_template('summary.html', session_id=requested_session())
 
 @app.route('/history')
 @jwt_required()
@@ -369,7 +636,7 @@ def profile():
             
             if password:
                 if password == confirm_password:
-                    g.user.password_hash = generate_password_hash(password)
+                    g.user.password_hash = password_hasher.hash(password)
                     flash('Password updated successfully!')
                 else:
                     flash('Passwords do not match.', 'error')
@@ -417,17 +684,10 @@ def delete_profile():
                 flash('You are the only admin. Cannot delete account. Promote another user first.', 'error')
                 return redirect(url_for('profile'))
 
-        # cascade="all, delete-orphan" on User.alerts handles deleting alerts
-        
-        if user_to_delete.profile_pic != 'default.png':
-            pic_path = os.path.join(app.config['PROFILE_PIC_FOLDER'], user_to_delete.profile_pic)
-            if os.path.exists(pic_path):
-                os.remove(pic_path)
-
-        db.session.delete(user_to_delete)
-        db.session.commit()
-        
-        flash('Your account has been permanently deleted.')
+        if delete_user_account(user_to_delete):
+            flash('Your account has been permanently deleted.')
+        else:
+            flash('Your account has been closed. Its alert history is being deleted in the background.')
         resp = redirect(url_for('login'))
         unset_jwt_cookies(resp)
         return resp
@@ -448,124 +708,214 @@ def log_alerts(new_alerts: list, user_id: int):
             logger.warning("Could not log alert: No user_id provided.")
             return
         if new_alerts:
+            with stage_timer('db_alert_write'):
+                for alert in new_alerts:
+                    db_alert = AlertHistory(
+                        user_id=user_id,
+                        alert_type=alert['type'],
+                        message=alert['message']
+                    )
+                    db.session.add(db_alert)
+                bump_alert_stats(user_id, len(new_alerts), datetime.datetime.utcnow())
+                db.session.commit()
             for alert in new_alerts:
-                db_alert = AlertHistory(
-                    user_id=user_id,
-                    alert_type=alert['type'],
-                    message=alert['message']
-                )
-                db.session.add(db_alert)
-            db.session.commit()
+                metrics.ALERTS_LOGGED.labels(alert['type']).inc()
             logger.info(f"Logged {len(new_alerts)} new alerts for user {user_id}")
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error logging alerts to database: {e}")
 
-def generate_live_frames(user_id: int) -> Generator[bytes, None, None]:
-    """Generate video frames for streaming from the webcam."""
-    cap = cv2.VideoCapture(0)
-    if not cap.isOpened():
-        logger.error("Failed to open webcam.")
-        return
+def log_pipeline_alerts(new_alerts: list, user_id: int):
+    """Alert callback for the analysis pipeline thread, which runs outside any request."""
+    with app.app_context(), tracer.trace('log_alerts'):
+        log_alerts(new_alerts, user_id)
 
-    try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            
-            processed, data, new_alerts = detector.process_frame(frame)
-            
-            if new_alerts:
-                with app.app_context():
-                    log_alerts(new_alerts, user_id)
+sessions = SessionRegistry(on_alerts=log_pipeline_alerts, resolve_path=transcoder.resolve)
+sessions.memory_reporter = memory_report
+sessions.trace_reporter = tracer.report
+atexit.register(sessions.shutdown)
 
-            global person_data
-            person_data = data 
+# Raised locally, or re-raised from the master under serve.py; both carry an HTTP status
+SESSION_ERRORS = (SessionError, RemoteError)
 
-            _, buffer = cv2.imencode('.jpg', processed)
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-    except Exception as e:
-        logger.error(f"Error in live frame generation: {e}")
-    finally:
-        cap.release()
-        logger.info("Webcam released.")
+def session_error_response(e: Exception):
+    return jsonify({"error": str(e)}), getattr(e, 'status', 500)
 
-def generate_video_frames(filename: str, user_id: int) -> Generator[bytes, None, None]:
-    """Generate video frames for streaming from a video file."""
-    video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        logger.error(f"Failed to open video file: {video_path}")
-        return
+def can_access_upload(filename: str) -> bool:
+    """Whether the current user uploaded this stored file (or is an admin)."""
+    if not g.user:
+        return False
+    return g.user.role == 'admin' or upload_store.is_owner(filename, get_jwt_identity())
+
+def session_visible(info: dict) -> bool:
+    """Whether the current user may see a session: any camera, or a file session they opened (admins: all)."""
+    if g.user and g.user.role == 'admin':
+        return True
+    return info['kind'] != 'file' or (bool(g.user) and info['owner_id'] == g.user.id)
+
+def visible_sessions() -> List[dict]:
+    return [info for info in sessions.list_sessions() if session_visible(info)]
+
+def current_session() -> Optional[str]:
+    """The current user's most recently active session, if they have one."""
+    return sessions.latest_for(g.user.id) if g.user else None
+
+def requested_session() -> Optional[str]:
+    """The session a page should show: ?session=<id> if the user may see it, else their current one."""
+    session_id = request.args.get('session')
+    if session_id:
+        try:
+            if session_visible(sessions.describe(session_id)):
+                return session_id
+        except SESSION_ERRORS:
+            pass
+    return current_session()
+
+def require_session_manager(session_id: str) -> None:
+    """Raise a 403 SessionError unless the current user opened the session or is an admin."""
+    is_admin = bool(g.user) and g.user.role == 'admin'
+    if not sessions.can_manage(session_id, g.user.id if g.user else None, is_admin):
+        raise SessionError("Only the user who opened this session (or an admin) can change it", 403)
+
+_session_rings: Dict[Tuple[str, Optional[str]], FrameRing] = {}
+
+def session_ring(session_id: str, name: Optional[str] = None, tier: Optional[str] = None) -> FrameRing:
+    """This process's view of a session's shared-memory frame ring for one output tier (default: the metrics ring)."""
+    key = (session_id, tier)
+    ring = _session_rings.get(key)
+    if ring is None or ring.retired or (name and ring.name != name):
+        # Drop views of sessions that have since been closed
+        for stale_key, stale in list(_session_rings.items()):
+            if stale.retired or stale_key == key:
+                if not stale.owner and stale.buf is not None and \
+                        not any(other is stale for k, other in _session_rings.items() if k != stale_key):
+                    stale.close()  # In single-process mode this is the session's own ring
+                del _session_rings[stale_key]
+        ring = FrameRing.attach(name or sessions.ring_name(session_id, tier))
+        _session_rings[key] = ring
+    return ring
+
+def session_person_data(session_id: Optional[str]) -> dict:
+    """Latest metrics snapshot of a session, read straight from its frame ring."""
+    if session_id is None:
+        return EMPTY_DATA
+    latest = session_ring(session_id).latest(want_chunk=False)
+    if latest is None or not latest[2]:
+        return EMPTY_DATA
+    return json.loads(latest[2])
+
+def relay_frames(session_id: str, stream: dict, tier: Optional[str] = None) -> Generator[bytes, None, None]:
+    """Relay the frames a session's pipeline publishes to one MJPEG viewer of ``tier``."""
+    ring = session_ring(session_id, stream['ring'], tier)
+    seq = stream['seq']
+    try:
+        while True:
+            result = ring.wait_next(seq, stream['generation'], timeout=5.0)
+            if result is None:
+                break  # Pipeline ended (end of file, source lost, or session stopped)
+            seq, chunk = result
+            if chunk:
+                yield chunk
+    except Exception as e:
+        logger.error(f"Error relaying frames for session {session_id}: {e}")
 
+def relay_overlays(session_id: str, stream: dict, tier: str) -> Generator[str, None, None]:
+    """Relay the overlay of each frame on a ``-raw`` tier as server-sent events, keyed by the frame's seq."""
+    ring = session_ring(session_id, stream['ring'], tier)
+    seq = stream['seq']
     try:
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+        while True:
+            result = ring.wait_next(seq, stream['generation'], timeout=5.0, want_meta=True)
+            if result is None:
                 break
+            seq, meta = result
+            if meta is None:
+                yield ': keepalive\n\n'  # Lets a closed connection be noticed while the video is paused
+            elif meta:
+                yield f"data: {meta.decode()}\n\n"
+    except Exception as e:
+        logger.error(f"Error relaying overlays for session {session_id}: {e}")
+
+def default_camera_id() -> Optional[str]:
+    return next(iter(sessions.cameras()), None)
+
+def render_session(session_id: str):
+    """Analysis page for one session."""
+    return render_template('analysis.html', session_id=session_id,
+                           video_source=url_for('session_video_feed', session_id=session_id), tiers=OUTPUT_TIERS,
+                           default_tier=DEFAULT_TIER, overlay_modes=OVERLAY_MODES, overlay_mode=DEFAULT_OVERLAY_MODE,
+                           hls_enabled=HLS_ENABLED)
+
+def draw_zone_interactively(window: str, read_frame) -> Optional[Tuple[Tuple[int, int], Tuple[int, int]]]:
+    """Let the operator drag the red zone in a local cv2 window; returns its corners or None."""
+    points = {}
+
+    def on_mouse(event: int, x: int, y: int, flags: int, param) -> None:
+        if event == cv2.EVENT_LBUTTONDOWN:
+            points.clear()
+            points['start'] = (x, y)
+        elif event == cv2.EVENT_LBUTTONUP and 'start' in points:
+            points['end'] = (x, y)
+
+    cv2.namedWindow(window)
+    cv2.setMouseCallback(window, on_mouse)
+    try:
+        while True:
+            frame = read_frame()
+            if frame is None:
+                return None
+            if 'end' not in points:
+                cv2.putText(frame, "Draw RED Zone with mouse, then press ANY key to start",
+                            (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            else:
+                cv2.rectangle(frame, points['start'], points['end'], (0, 0, 255), 2)
+                cv2.putText(frame, "Zone set. Press ANY key to start analysis.",
+                            (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
-            processed, data, new_alerts = detector.process_frame(frame)
-            
-            if new_alerts:
-                with app.app_context():
-                    log_alerts(new_alerts, user_id)
-
-            global person_data
-            person_data = data
+            cv2.imshow(window, frame)
 
-            _, buffer = cv2.imencode('.jpg', processed)
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + buffer.tobytes() + b'\r\n')
-    except Exception as e:
-        logger.error(f"Error in video file frame generation: {e}")
+            if cv2.waitKey(1) != -1 and 'end' in points:
+                return points['start'], points['end']
     finally:
-        cap.release()
-        logger.info("Video file released.")
+        cv2.destroyWindow(window)
 
 @app.route('/live')
+@app.route('/live/<camera_id>')
 @jwt_required()
-def live():
-    """Start live webcam analysis session."""
-    detector.reset() # Reset tracker for a new session
-    global person_data
-    person_data = {"person_details": {}, "global_metrics": {}}
+@detector_required()
+def live(camera_id: Optional[str] = None):
+    """Start a live analysis session for a configured camera (the first one by default)."""
+    camera_id = camera_id or default_camera_id()
+    try:
+        session_id = sessions.open_camera(camera_id, g.user.id if g.user else None)
+        manager = sessions.can_manage(session_id, g.user.id if g.user else None,
+                                      bool(g.user) and g.user.role == 'admin')
+        if not manager:
+            # Someone else's camera session: watch it as it is
+            return render_session(session_id)
+        sessions.reset(session_id) # Reset tracker for a new session
+    except SESSION_ERRORS as e:
+        flash(f"Could not start camera session: {e}")
+        return redirect(url_for('dashboard'))
 
     # --- REMOVED: apply_user_settings block ---
     # Detector now uses system defaults automatically
     
-    cap = cv2.VideoCapture(0)
+    cap = cv2.VideoCapture(sessions.cameras()[camera_id]['source'])
     if not cap.isOpened():
-        logger.error("Failed to open webcam.")
+        logger.error(f"Failed to open camera {camera_id}.")
         return "Error: Could not open webcam.", 500
 
-    cv2.namedWindow("Draw Zone on Webcam")
-    cv2.setMouseCallback("Draw Zone on Webcam", detector.mouse_callback)
-
-    while True:
+    def read_frame():
         ret, frame = cap.read()
-        if not ret:
-            break
-        
-        if not detector.red_zone.ready:
-             cv2.putText(frame, "Draw RED Zone with mouse, then press ANY key to start",
-                         (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-        else:
-             detector.red_zone.draw(frame)
-             cv2.putText(frame, "Zone set. Press ANY key to start analysis.",
-                         (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+        return frame if ret else None
 
-        cv2.imshow("Draw Zone on Webcam", frame)
-        
-        if cv2.waitKey(1) != -1 and detector.red_zone.ready:
-            break
-    
+    zone = draw_zone_interactively(f"Draw Zone on {camera_id}", read_frame)
     cap.release()
-    cv2.destroyAllWindows()
-    
-    global active_video_source
-    active_video_source = url_for('video_feed_live')
-    
-    return render_template('analysis.html', video_source=url_for('video_feed_live'))
+    if zone:
+        sessions.set_zone(session_id, *zone)
+
+    return render_session(session_id)
 
 @app.route('/upload', methods=['POST'])
 @jwt_required()
@@ -577,152 +927,475 @@ def upload_video():
     if file.filename == '':
         return "No selected file", 400
     if file:
-        filename = secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        try:
+            # Stored under its content hash so users can't overwrite each other's files
+            filename, _ = upload_store.save_stream(file.stream, secure_filename(file.filename),
+                                                   owner=get_jwt_identity())
+        except OSError as e:
+            logger.error(f"Error saving uploaded video: {e}")
+            return "File upload failed", 500
+        transcoder.submit(filename)
         return redirect(url_for('analyze_video', filename=filename))
     return "File upload failed", 500
 
+# --- CHUNKED UPLOAD ROUTES ---
+
+def _upload_error_response(e: UploadError):
+    body = {"error": str(e)}
+    if e.offset is not None:
+        body["offset"] = e.offset
+    headers = {'Retry-After': str(e.retry_after)} if e.retry_after is not None else {}
+    return jsonify(body), e.status, headers
+
+@app.route('/upload/chunked', methods=['POST'])
+@jwt_required()
+def upload_chunked_begin():
+    """Start a resumable upload. Returns the upload id, or the stored file if the hash is already known."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        result = upload_store.begin(
+            secure_filename(payload.get('filename', '')),
+            int(payload.get('size', -1)),
+            owner=get_jwt_identity(),
+            digest=payload.get('sha256')
+        )
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid upload size"}), 400
+    except UploadError as e:
+        return _upload_error_response(e)
+    if result['complete']:
+        transcoder.submit(result['filename'])
+        result['redirect'] = url_for('analyze_video', filename=result['filename'])
+    return jsonify(result)
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET'])
+@jwt_required()
+def upload_chunked_status(upload_id: str):
+    """Report the received byte offset so a client can resume."""
+    try:
+        return jsonify(upload_store.status(upload_id, owner=get_jwt_identity()))
+    except UploadError as e:
+        return _upload_error_response(e)
+
+@app.route('/upload/chunked/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunked_append(upload_id: str):
+    """Append one chunk. The body is streamed straight to disk (Content-Range: bytes start-end/total)."""
+    content_range = request.headers.get('Content-Range', '')
+    try:
+        start = int(content_range.split(' ')[1].split('-')[0]) if content_range else 0
+    except (IndexError, ValueError):
+        return jsonify({"error": "Malformed Content-Range header"}), 400
+    length = request.content_length
+    if length is None:
+        return jsonify({"error": "Content-Length is required"}), 411
+    try:
+        offset = upload_store.append(upload_id, start, request.stream, length, owner=get_jwt_identity())
+    except UploadError as e:
+        return _upload_error_response(e)
+    return jsonify({"upload_id": upload_id, "offset": offset})
+
+@app.route('/upload/chunked/<upload_id>/complete', methods=['POST'])
+@jwt_required()
+def upload_chunked_complete(upload_id: str):
+    """Finish an upload: verify the size, hash-address the file and de-duplicate it."""
+    try:
+        filename, deduplicated = upload_store.finish(upload_id, owner=get_jwt_identity())
+    except UploadError as e:
+        return _upload_error_response(e)
+    transcoder.submit(filename)
+    return jsonify({
+        "filename": filename,
+        "deduplicated": deduplicated,
+        "redirect": url_for('analyze_video', filename=filename)
+    })
+
 @app.route('/analyze_video/<filename>')
 @jwt_required()
+@detector_required()
 def analyze_video(filename: str):
     """Start video file analysis session."""
-    detector.reset() # Reset tracker
-    global person_data
-    person_data = {"person_details": {}, "global_metrics": {}}
+    if not can_access_upload(filename):
+        flash("Video not found.")
+        return redirect(url_for('dashboard'))
+    # Prefer the analysis proxy if it has finished building; the original is kept for export
+    video_path = transcoder.resolve(filename)
+    try:
+        session_id = sessions.open_file(filename, video_path, g.user.id if g.user else None)
+        require_session_manager(session_id)
+        sessions.reset(session_id) # Reset tracker
+    except SESSION_ERRORS as e:
+        flash(f"Could not start analysis: {e}")
+        return redirect(url_for('dashboard'))
 
     # --- REMOVED: apply_user_settings block ---
     # Detector now uses system defaults automatically
     
-    video_source = url_for('video_feed_file', filename=filename)
-    video_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     cap = cv2.VideoCapture(video_path)
     
     if cap.isOpened():
         ret, frame = cap.read()
         if ret:
-            cv2.namedWindow("Draw Zone on Video")
-            cv2.setMouseCallback("Draw Zone on Video", detector.mouse_callback)
-            
-            while True:
-                display_frame = frame.copy()
-                if not detector.red_zone.ready:
-                    cv2.putText(display_frame, "Draw RED Zone with mouse, then press ANY key to start", 
-                                (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-                else:
-                    detector.red_zone.draw(display_frame)
-                    cv2.putText(display_frame, "Zone set. Press ANY key to start analysis.",
-                                (40, 40), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
-
-                cv2.imshow("Draw Zone on Video", display_frame)
-                
-                if cv2.waitKey(1) != -1 and detector.red_zone.ready:
-                    break
-            
-            cv2.destroyWindow("Draw Zone on Video")
+            zone = draw_zone_interactively("Draw Zone on Video", frame.copy)
+            if zone:
+                sessions.set_zone(session_id, *zone)
         cap.release()
-        
-    global active_video_source
-    active_video_source = video_source
 
-    return render_template('analysis.html', video_source=video_source)
+    return render_session(session_id)
+
+@app.route('/proxy_status/<filename>')
+@jwt_required()
+def proxy_status(filename: str):
+    """Report whether the analysis proxy for an upload is ready."""
+    return jsonify({"filename": filename, "proxy": transcoder.get_status(filename)})
+
+@app.route('/download_original/<filename>')
+@jwt_required()
+def download_original(filename: str):
+    """Download the untouched original upload (evidence export); only its uploaders and admins may."""
+    if not can_access_upload(filename):
+        return jsonify({"error": "Not found"}), 404
+    return send_from_directory(app.config['UPLOAD_FOLDER'], filename, as_attachment=True)
+
+# --- SESSION ROUTES ---
+
+@app.route('/sessions')
+@jwt_required()
+def list_sessions():
+    """List analysis sessions and the configured cameras."""
+    return jsonify({
+        "sessions": visible_sessions(),
+        "cameras": sessions.cameras(),
+        "active": current_session()
+    })
+
+@app.route('/sessions/<session_id>')
+@jwt_required()
+def session_info(session_id: str):
+    try:
+        info = sessions.describe(session_id)
+        if not session_visible(info):
+            raise SessionError(f"No such session: {session_id}", 404)
+        return jsonify(info)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+@jwt_required()
+def session_close(session_id: str):
+    """Stop a session's pipeline and free its tracker state and frame ring."""
+    try:
+        require_session_manager(session_id)
+        sessions.close(session_id)
+        return jsonify({"status": "closed", "session": session_id})
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+
+@app.route('/sessions/<session_id>/video_feed')
+@jwt_required()
+@detector_required(api=True)
+def session_video_feed(session_id: str):
+    """Stream a session's frames, starting its pipeline if needed: ?tier=full|720p|360p, or <tier>-raw for
+    frames without overlays (see config.yaml output)."""
+    if not g.user:
+        return "Unauthorized", 401
+    tier = request.args.get('tier') or None
+    try:
+        stream = sessions.start(session_id, g.user.id, tier)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    return Response(relay_frames(session_id, stream, tier), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/sessions/<session_id>/overlay_feed')
+@jwt_required()
+@detector_required(api=True)
+def session_overlay_feed(session_id: str):
+    """Server-sent events with the boxes, ids, zone and alert flags of each frame on ?tier=<tier>-raw."""
+    if not g.user:
+        return "Unauthorized", 401
+    tier = request.args.get('tier') or ''
+    if not tier.endswith(RAW_SUFFIX):
+        return jsonify({"error": f"Overlays are sent for raw tiers only (e.g. full{RAW_SUFFIX})"}), 400
+    try:
+        stream = sessions.start(session_id, g.user.id, tier)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    return Response(relay_overlays(session_id, stream, tier), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/sessions/<session_id>/hls')
+@jwt_required()
+@detector_required(api=True)
+def session_hls(session_id: str):
+    """Start (or keep) a session's HLS output; returns the playlist URL and whether it has segments yet."""
+    if not g.user:
+        return "Unauthorized", 401
+    try:
+        stream = sessions.start_hls(session_id, g.user.id)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    return jsonify({"playlist": url_for('hls_file', token=stream['token'], filename=PLAYLIST),
+                    "ready": stream['ready']})
+
+@app.route('/hls/<token>/<filename>')
+def hls_file(token: str, filename: str):
+    """Serve an HLS playlist or segment as a static file.
+
+    No login: the random token in the path is the capability (it comes from
+    /sessions/<id>/hls), so shared HTTP caches can serve one copy to every viewer.
+    Segment names are never reused and are cached long; the live playlist briefly.
+    """
+    if not TOKEN_PATTERN.match(token) or not FILE_PATTERN.match(filename):
+        return jsonify({"error": "Not found"}), 404
+    directory = os.path.join(hls_config['directory'], token)
+    if not os.path.isdir(directory):
+        return jsonify({"error": "Not found"}), 404
+    if filename == PLAYLIST:
+        mark_watched(directory)  # Keeps the encoder running while someone (or a cache) follows the stream
+        response = send_from_directory(directory, filename, mimetype='application/vnd.apple.mpegurl')
+        response.headers['Cache-Control'] = f"public, max-age={max(1, int(float(hls_config['segment_s']) // 2))}"
+    else:
+        response = send_from_directory(directory, filename, mimetype='video/mp4')
+        response.headers['Cache-Control'] = f"public, max-age={int(hls_config['segment_max_age_s'])}, immutable"
+    return response
+
+@app.route('/sessions/<session_id>/stop', methods=['POST'])
+@jwt_required()
+def session_stop(session_id: str):
+    """Stop a session's pipeline but keep its tracker state."""
+    try:
+        require_session_manager(session_id)
+        sessions.stop(session_id)
+        return jsonify({"status": "stopped", "session": session_id})
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+
+@app.route('/sessions/<session_id>/person_data')
+@jwt_required()
+def session_data(session_id: str):
+    """Return a session's current person tracking data for the JS frontend."""
+    try:
+        return jsonify(session_person_data(session_id))
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+
+@app.route('/sessions/<session_id>/reset')
+@jwt_required()
+@detector_required(api=True)
+def session_reset(session_id: str):
+    """Reset a session's tracker and zone."""
+    try:
+        require_session_manager(session_id)
+        sessions.reset(session_id)
+        logger.info(f"Tracker and zones reset for session {session_id}")
+        return jsonify({"status": "Tracker and zones reset"})
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+
+@app.route('/sessions/<session_id>/download_pdf/<person_id>')
+@jwt_required()
+def session_download_pdf(session_id: str, person_id: str):
+    """Generate and download a PDF report for a person seen in a session."""
+    try:
+        person_info = session_person_data(session_id).get("person_details", {}).get(person_id)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    if person_info is None:
+        return jsonify({"error": "Person not found"}), 404
+    try:
+        # reportlab is only needed here, so it isn't imported at startup
+        from repoet_generator import generate_pdf
+        filepath = generate_pdf(person_id, person_info)
+        return send_file(filepath, as_attachment=True)
+    except Exception as e:
+        logger.error(f"Error generating PDF for {person_id}: {e}")
+        return jsonify({"error": "Failed to generate PDF"}), 500
+
+# --- Single-source routes: the default camera, one upload, or the user's current session ---
 
 @app.route('/video_feed_live')
 @jwt_required()
+@detector_required(api=True)
 def video_feed_live():
     """Stream live webcam feed."""
     try:
-        if not g.user:
-            return "Unauthorized", 401
-        return Response(generate_live_frames(g.user.id), mimetype='multipart/x-mixed-replace; boundary=frame')
-    except Exception as e:
-        logger.error(f"Error in video_feed_live: {e}")
-        return "Internal Server Error", 500
+        session_id = sessions.open_camera(default_camera_id(), g.user.id if g.user else None)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    return session_video_feed(session_id)
 
 @app.route('/video_feed_file/<filename>')
 @jwt_required()
+@detector_required(api=True)
 def video_feed_file(filename: str):
     """Stream uploaded video feed."""
+    if not can_access_upload(filename):
+        return jsonify({"error": "Not found"}), 404
     try:
-        if not g.user:
-            return "Unauthorized", 401
-        return Response(generate_video_frames(filename, g.user.id), mimetype='multipart/x-mixed-replace; boundary=frame')
-    except Exception as e:
-        logger.error(f"Error in video_feed_file: {e}")
-        return "Internal Server Error", 500
+        session_id = sessions.open_file(filename, owner_id=g.user.id if g.user else None)
+    except SESSION_ERRORS as e:
+        return session_error_response(e)
+    return session_video_feed(session_id)
 
 @app.route('/person_data')
 @jwt_required()
 def get_data():
-    """Return current person tracking data for JS frontend."""
-    return jsonify(person_data)
+    """Return current person tracking data of the user's current session."""
+    session_id = current_session()
+    if session_id is None:
+        return jsonify(EMPTY_DATA)
+    return redirect(url_for('session_data', session_id=session_id))
 
 @app.route('/download_pdf/<person_id>')
 @jwt_required()
 def download_pdf(person_id: str):
-    """Generate and download a PDF report for a person."""
-    if person_id not in person_data.get("person_details", {}):
+    """Generate and download a PDF report for a person in the user's current session."""
+    session_id = current_session()
+    if session_id is None:
         return jsonify({"error": "Person not found"}), 404
-    try:
-        person_info = person_data["person_details"][person_id]
-        filepath = generate_pdf(person_id, person_info)
-        return send_file(filepath, as_attachment=True)
-    except Exception as e:
-        logger.error(f"Error generating PDF for {person_id}: {e}")
-        return jsonify({"error": "Failed to generate PDF"}), 500
+    return redirect(url_for('session_download_pdf', session_id=session_id, person_id=person_id))
 
 @app.route('/reset')
 @jwt_required()
+@detector_required(api=True)
 def reset():
-    """Reset tracker and clear video source."""
-    try:
-        detector.reset()
-        global person_data
-        person_data = {"person_details": {}, "global_metrics": {}}
-        global active_video_source
-        active_video_source = None
-        logger.info("Tracker and zones reset")
+    """Reset the user's current session's tracker and zone."""
+    session_id = current_session()
+    if session_id is None:
         return jsonify({"status": "Tracker and zones reset"})
-    except Exception as e:
-        logger.error(f"Error resetting tracker: {e}")
-        return jsonify({"error": "Failed to reset tracker"}), 500
+    return redirect(url_for('session_reset', session_id=session_id))
+
+# --- METRICS ---
+
+# Callback gauges are only evaluated when /metrics is scraped
+metrics.REGISTRY.gauge('crowdcount_active_tracks', 'People currently tracked by the detector.',
+                       callback=lambda: sessions.stats()['active_tracks'])
+metrics.REGISTRY.gauge('crowdcount_heatmap_points', 'Points held for the heatmap overlay.',
+                       callback=lambda: sessions.stats()['heatmap_points'])
+metrics.REGISTRY.gauge('crowdcount_running_sessions', 'Analysis sessions with a running pipeline.',
+                       callback=lambda: sessions.stats()['running_sessions'])
+metrics.REGISTRY.gauge('crowdcount_proxy_queue_depth', 'Uploads waiting for an analysis proxy.',
+                       callback=transcoder.queue_depth)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Expose pipeline metrics in the Prometheus text format."""
+    token = os.getenv('METRICS_TOKEN')
+    if token:
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied, f"Bearer {token}"):
+            return "Unauthorized", 401
+    # Pipeline metrics live in the process that owns the sessions (the master under serve.py)
+    return Response(sessions.metrics_text(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 # --- ADMIN PANEL ROUTES ---
 
 @app.route('/admin')
 @admin_required()
 def admin_panel():
-    """Render the main admin panel page."""
+    """Render the main admin panel page (users and alerts are fetched page by page by admin.js)."""
     try:
-        all_users = User.query.all()
-        # Get 100 most recent alerts from all users
-        all_alerts = AlertHistory.query.order_by(AlertHistory.timestamp.desc()).limit(100).all()
-        
         # Get system settings to pre-fill the form
         settings = get_system_settings_from_db()
-
-        return render_template(
-            'adminpanel.html', 
-            all_users=all_users, 
-            all_alerts=all_alerts,
-            settings=settings
-        )
+        retention_months, retention_archive = get_retention_policy()
+        return render_template('adminpanel.html', settings=settings,
+                               retention={'months': retention_months, 'archive': retention_archive})
     except Exception as e:
         logger.error(f"Error loading admin panel: {e}")
         flash("Error loading admin panel.", "error")
         return redirect(url_for('overview'))
 
+def _page_args(default_size: int = 50, max_size: int = 200) -> Tuple[int, int]:
+    """``(page, per_page)`` from the query string, clamped to sane bounds."""
+    page = max(1, request.args.get('page', 1, type=int))
+    per_page = min(max_size, max(1, request.args.get('per_page', default_size, type=int)))
+    return page, per_page
+
+@app.route('/admin/data/users')
+@admin_required()
+def admin_users_data():
+    """One page of users with their alert totals: ?page=1&per_page=50&q=<username prefix>"""
+    try:
+        page, per_page = _page_args()
+        query = User.query
+        q = request.args.get('q', '').strip()
+        if q:
+            query = query.filter(User.username.ilike(q.replace('%', r'\%').replace('_', r'\_') + '%', escape='\\'))
+        total = query.count()
+        users = (query.options(joinedload(User.alert_stats))
+                 .order_by(User.username)
+                 .offset((page - 1) * per_page).limit(per_page).all())
+        return jsonify({
+            'page': page,
+            'per_page': per_page,
+            'total': total,
+            'users': [{
+                'id': u.id,
+                'username': u.username,
+                'email': u.email,
+                'role': u.role,
+                'profile_pic': u.profile_pic,
+                'alert_count': u.alert_stats.alert_count if u.alert_stats else 0,
+            } for u in users]
+        })
+    except Exception as e:
+        logger.error(f"Error listing users: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/data/alerts')
+@admin_required()
+def admin_alerts_data():
+    """Newest alerts first, keyset-paginated: ?per_page=100&before=<id of the last alert already shown>"""
+    try:
+        _, per_page = _page_args(default_size=100, max_size=500)
+        # Seeking on the primary key stays fast at any depth, unlike OFFSET over millions of rows
+        query = AlertHistory.query.options(joinedload(AlertHistory.user))
+        before = request.args.get('before', type=int)
+        if before:
+            query = query.filter(AlertHistory.id < before)
+        alerts = query.order_by(AlertHistory.id.desc()).limit(per_page).all()
+        return jsonify({
+            'alerts': [{
+                'id': a.id,
+                'timestamp': a.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+                'username': a.user.username if a.user else None,
+                'alert_type': a.alert_type,
+                'message': a.message,
+            } for a in alerts],
+            'next_before': alerts[-1].id if len(alerts) == per_page else None,
+        })
+    except Exception as e:
+        logger.error(f"Error listing alerts: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/data/purges')
+@admin_required()
+def admin_purges_data():
+    """Progress of background user deletions: users still being purged plus jobs run by this process."""
+    try:
+        jobs = {job['key']: job for job in purges.jobs()}
+        # Remaining counts come from the database, so any worker can report on any purge
+        for user in User.query.options(joinedload(User.alert_stats)).filter_by(role=DELETING_ROLE).all():
+            key = f"user-{user.id}"
+            jobs.setdefault(key, {'key': key, 'label': user.username, 'state': 'running'})
+            jobs[key]['remaining'] = user.alert_stats.alert_count if user.alert_stats else 0
+        return jsonify(purges=list(jobs.values()))
+    except Exception as e:
+        logger.error(f"Error reading purge progress: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/admin/data/alert_stats')
 @admin_required()
 def admin_alert_stats():
-    """API endpoint to get alert counts for all users."""
+    """Alert totals of the users with the most alerts (?limit=25), from the UserAlertStats summary."""
     try:
-        # Query to count alerts per user
+        limit = min(200, max(1, request.args.get('limit', 25, type=int)))
         stats = db.session.query(
-            User.username, 
-            func.count(AlertHistory.id)
+            User.username,
+            UserAlertStats.alert_count
         ).join(
-            AlertHistory, User.id == AlertHistory.user_id, isouter=True
-        ).group_by(User.username).all()
+            UserAlertStats, User.id == UserAlertStats.user_id
+        ).order_by(UserAlertStats.alert_count.desc(), User.username).limit(limit).all()
         
         # Format for Chart.js
         labels = [s[0] for s in stats]
@@ -749,17 +1422,16 @@ def admin_delete_user(user_id):
             flash('Cannot delete the last admin.', 'error')
             return redirect(url_for('admin_panel'))
             
+    if user_to_delete.role == DELETING_ROLE:
+        flash(f"User '{user_to_delete.username}' is already being deleted.")
+        return redirect(url_for('admin_panel'))
+            
     try:
-        # Delete profile pic
-        if user_to_delete.profile_pic != 'default.png':
-            pic_path = os.path.join(app.config['PROFILE_PIC_FOLDER'], user_to_delete.profile_pic)
-            if os.path.exists(pic_path):
-                os.remove(pic_path)
-        
-        # Alerts are deleted by cascade="all, delete-orphan"
-        db.session.delete(user_to_delete)
-        db.session.commit()
-        flash(f"User '{user_to_delete.username}' deleted successfully.")
+        username = user_to_delete.username
+        if delete_user_account(user_to_delete):
+            flash(f"User '{username}' deleted successfully.")
+        else:
+            flash(f"User '{username}' has a large alert history; it is being deleted in the background.")
     except Exception as e:
         db.session.rollback()
         logger.error(f"Error deleting user: {e}")
@@ -776,6 +1448,10 @@ def admin_toggle_admin(user_id):
         flash("User not found.", "error")
         return redirect(url_for('admin_panel'))
     
+    if user_to_toggle.role == DELETING_ROLE:
+        flash(f"User '{user_to_toggle.username}' is being deleted.", "error")
+        return redirect(url_for('admin_panel'))
+    
     try:
         if user_to_toggle.role == 'user':
             user_to_toggle.role = 'admin'
@@ -830,6 +1506,136 @@ def admin_download_csv(user_id):
         flash("Could not generate CSV file.")
         return redirect(url_for('admin_panel'))
 
+@app.route('/admin/profile')
+@admin_required()
+def admin_profile():
+    """Sample pipeline thread stacks: ?seconds=10&hz=100&threads=pipeline|all&format=json|collapsed"""
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        hz = int(request.args.get('hz', 100))
+    except ValueError:
+        return jsonify({"error": "seconds and hz must be numbers"}), 400
+    pipeline_only = request.args.get('threads', 'pipeline') != 'all'
+    try:
+        # Samples the process that runs the pipelines, which may not be this worker
+        result = sessions.profile(seconds, hz, pipeline_only=pipeline_only)
+    except (ProfilerBusy, RemoteError) as e:
+        return jsonify({"error": str(e)}), 409
+    if pipeline_only and not result['stack_samples']:
+        return jsonify({"error": "No pipeline threads are running. Use threads=all to sample everything."}), 409
+
+    if request.args.get('format') == 'collapsed':
+        stamp = datetime.datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        return Response(
+            result['collapsed'] + '\n',
+            mimetype='text/plain',
+            headers={"Content-Disposition": f"attachment;filename=profile_{stamp}.collapsed"}
+        )
+    return jsonify(result)
+
+@app.route('/admin/memory')
+@admin_required()
+def admin_memory():
+    """Memory telemetry: RSS history, structure sizes, tracemalloc diffs and recent alarms."""
+    try:
+        report = sessions.memory_report(limit=int(request.args.get('limit', 120)),
+                                        sample=bool(request.args.get('sample')))
+        events = SystemEvent.query.order_by(SystemEvent.timestamp.desc()).limit(50).all()
+        report['events'] = [{
+            'timestamp': e.timestamp.strftime('%Y-%m-%d %H:%M:%S'),
+            'type': e.event_type,
+            'message': e.message
+        } for e in events]
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Error building memory report: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/tracing')
+@admin_required()
+def admin_tracing():
+    """Slowest sampled requests, slowest queries and per-statement totals (parameters redacted)."""
+    try:
+        limit = min(200, max(1, request.args.get('limit', 50, type=int)))
+        report = tracer.report(limit=limit)
+        # Under serve.py the pipeline's background writes are traced in the master process
+        if not isinstance(sessions, SessionRegistry):
+            report['master'] = sessions.trace_report(limit=limit)
+        return jsonify(report)
+    except Exception as e:
+        logger.error(f"Error building trace report: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/tracing/reset', methods=['POST'])
+@admin_required()
+def admin_tracing_reset():
+    """Forget the traces collected by this process."""
+    try:
+        tracer.clear()
+        return jsonify({"status": "cleared"})
+    except Exception as e:
+        logger.error(f"Error clearing traces: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/scheduler')
+@admin_required()
+def admin_scheduler():
+    """Current core/thread budget of every running pipeline."""
+    try:
+        return jsonify(sessions.core_budgets())
+    except Exception as e:
+        logger.error(f"Error reading core budgets: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/inference')
+@admin_required()
+def admin_inference():
+    """Shared inference pool: queue depth and latency against the SLO of each priority class."""
+    try:
+        return jsonify(sessions.inference_report())
+    except Exception as e:
+        logger.error(f"Error reading inference pool state: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/data/retention')
+@admin_required()
+def admin_retention_data():
+    """Retention policy, partitions (PostgreSQL) and the outcome of the last retention run."""
+    try:
+        months, archive = get_retention_policy()
+        status = alert_retention.status()
+        status['policy'] = {'months': months, 'archive': archive}
+        return jsonify(status)
+    except Exception as e:
+        logger.error(f"Error reading retention status: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/admin/retention', methods=['POST'])
+@admin_required()
+def admin_update_retention():
+    """Save the alert retention policy; ?run=1 (or the form's run field) also applies it now."""
+    try:
+        months = max(0, int(request.form.get('retention_months', 0)))
+        archive = '1' if request.form.get('retention_archive') else '0'
+        for key, value in (('retention_months', str(months)), ('retention_archive', archive)):
+            setting = SystemSettings.query.filter_by(key=key).first()
+            if setting:
+                setting.value = value
+            else:
+                db.session.add(SystemSettings(key=key, value=value))
+        db.session.commit()
+        if request.form.get('run') or request.args.get('run'):
+            alert_retention.run_in_background(app, months, archive == '1')
+            flash("Retention policy saved; expiring old alerts in the background.")
+        else:
+            flash("Retention policy saved. It is applied daily.")
+        logger.info(f"Admin set alert retention to {months} months (archive={archive})")
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error updating retention policy: {e}")
+        flash(f"Error updating retention policy: {e}", "error")
+    return redirect(url_for('admin_panel'))
+
 @app.route('/admin/settings', methods=['POST'])
 @admin_required()
 def admin_update_settings():
@@ -844,13 +1650,12 @@ def admin_update_settings():
         
         db.session.commit()
         
-        # --- IMPORTANT: Reload detector with new settings ---
-        global detector
+        # --- IMPORTANT: Apply new thresholds to the running detector (no model reload) ---
         system_settings = get_system_settings_from_db()
-        detector = PersonTracker(system_settings=system_settings)
+        sessions.update_thresholds(system_settings)
         # ---
         
-        flash("System-wide alert settings updated. Detector has been reloaded.")
+        flash("System-wide alert settings updated.")
         logger.info(f"Admin updated system settings to: {system_settings}")
         
     except Exception as e:
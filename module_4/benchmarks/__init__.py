@@ -0,0 +1,4 @@
+"""Offline, CPU-only benchmarks for the crowd monitoring pipeline.
+
+Run from the ``module_4`` directory, e.g. ``python -m benchmarks.bench_detector``.
+"""
@@ -0,0 +1,184 @@
+"""Micro-benchmarks for `PersonTracker` using synthetic scenes and a stub model.
+
+Usage (from module_4)::
+
+    python -m benchmarks.bench_detector --output bench.json
+    python -m benchmarks.bench_detector --compare bench.json --tolerance 0.10
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+import cv2
+import numpy as np
+
+from benchmarks.stub_model import StubYOLO
+from benchmarks.synthetic import SyntheticScene
+from detector import PersonTracker
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config.yaml')
+# Thresholds high enough that alert logging never runs inside the timed loop
+BENCH_SETTINGS = {'person_threshold': 10 ** 6, 'zone_threshold': 10 ** 6, 'overall_threshold': 10 ** 6}
+
+
+def _summarise(case: str, resolution: str, people: int, samples: List[float]) -> Dict:
+    ms = np.array(samples) * 1000.0
+    return {
+        'case': case,
+        'resolution': resolution,
+        'people': people,
+        'iterations': len(samples),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'min_ms': round(float(ms.min()), 4),
+    }
+
+
+def _time(fn: Callable[[int], object], iterations: int, warmup: int) -> List[float]:
+    for i in range(warmup):
+        fn(i)
+    samples = []
+    for i in range(warmup, warmup + iterations):
+        start = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def make_tracker(scene: SyntheticScene, inference_delay: float = 0.0) -> PersonTracker:
+    """A tracker wired to the stub model with a zone covering the centre of the frame."""
+    tracker = PersonTracker(BENCH_SETTINGS, config_path=CONFIG_PATH, model=StubYOLO(scene, inference_delay))
+    w, h = scene.width, scene.height
+    tracker.red_zone.set_points((w // 4, h // 4), (3 * w // 4, 3 * h // 4))
+    return tracker
+
+
+def bench_case(width: int, height: int, people: int, iterations: int, warmup: int,
+               inference_delay: float, seed: int) -> List[Dict]:
+    resolution = f"{width}x{height}"
+    scene = SyntheticScene(width, height, people, seed)
+    frames = [scene.frame(i) for i in range(warmup + iterations)]
+    results = []
+
+    # Full process_frame with the stub standing in for YOLO
+    tracker = make_tracker(scene, inference_delay)
+    results.append(_summarise('process_frame', resolution, people,
+                              _time(lambda i: tracker.process_frame(frames[i]), iterations, warmup)))
+
+    # The same without drawing, as for viewers that draw the overlays in the browser
+    raw = make_tracker(scene, inference_delay)
+    results.append(_summarise('process_frame_raw', resolution, people,
+                              _time(lambda i: raw.process_frame(frames[i], annotate=False), iterations, warmup)))
+
+    # Heatmap overlay with a full point buffer (process_frame keeps the last 500)
+    heat = make_tracker(scene)
+    rng = np.random.default_rng(seed)
+    points = list(zip(rng.integers(0, width, 500).tolist(), rng.integers(0, height, 500).tolist()))
+
+    def heatmap(i):
+        heat.heatmap_points = list(points)
+        heat._apply_heatmap(frames[i])
+    results.append(_summarise('apply_heatmap', resolution, people, _time(heatmap, iterations, warmup)))
+
+    # Zone membership for every person centre in the frame
+    zone = tracker.red_zone
+    centres = [[((x1 + x2) // 2, (y1 + y2) // 2) for x1, y1, x2, y2 in scene.boxes(i)]
+               for i in range(warmup + iterations)]
+    results.append(_summarise('zone_membership', resolution, people,
+                              _time(lambda i: [zone.is_inside(x, y) for x, y in centres[i]], iterations, warmup)))
+
+    # JPEG encode of an annotated frame, as the MJPEG generators do
+    annotated = make_tracker(scene).process_frame(frames[0])[0]
+    results.append(_summarise('jpeg_encode', resolution, people,
+                              _time(lambda i: cv2.imencode('.jpg', annotated), iterations, warmup)))
+    return results
+
+
+def environment() -> Dict:
+    return {
+        'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def compare(current: List[Dict], baseline_path: str, tolerance: float) -> List[Dict]:
+    """Return the cases whose mean time regressed by more than ``tolerance`` against a baseline."""
+    with open(baseline_path, 'r') as f:
+        baseline = {(r['case'], r['resolution'], r['people']): r for r in json.load(f)['results']}
+    regressions = []
+    for result in current:
+        old = baseline.get((result['case'], result['resolution'], result['people']))
+        if not old or not old['mean_ms']:
+            continue
+        ratio = result['mean_ms'] / old['mean_ms']
+        result['baseline_mean_ms'] = old['mean_ms']
+        result['ratio'] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(result)
+    return regressions
+
+
+def parse_resolutions(value: str) -> List[tuple]:
+    return [tuple(int(v) for v in item.lower().split('x')) for item in value.split(',')]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--resolutions', default='640x480,1280x720,1920x1080', type=parse_resolutions)
+    parser.add_argument('--densities', default='5,25,100', type=lambda v: [int(x) for x in v.split(',')])
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--inference-delay-ms', type=float, default=0.0,
+                        help='CPU time the stub model burns per call, to emulate real inference')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write JSON results to this file (default: stdout)')
+    parser.add_argument('--compare', help='Baseline JSON to compare against; exits 1 on regression')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Allowed slowdown before a case regresses')
+    args = parser.parse_args(argv)
+
+    # Keep per-frame logging out of the timings
+    logging.getLogger('detector').setLevel(logging.WARNING)
+
+    results = []
+    for width, height in args.resolutions:
+        for people in args.densities:
+            results.extend(bench_case(width, height, people, args.iterations, args.warmup,
+                                      args.inference_delay_ms / 1000.0, args.seed))
+            print(f"{width}x{height} people={people}: "
+                  f"process_frame {results[-5]['mean_ms']:.2f} ms, "
+                  f"raw {results[-4]['mean_ms']:.2f} ms", file=sys.stderr)
+
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else []
+    settings = dict(vars(args), resolutions=[f"{w}x{h}" for w, h in args.resolutions])
+    report = {'environment': environment(), 'settings': settings,
+              'results': results, 'regressions': regressions}
+    output = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    for r in regressions:
+        print(f"REGRESSION {r['case']} {r['resolution']} people={r['people']}: "
+              f"{r['baseline_mean_ms']} -> {r['mean_ms']} ms", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
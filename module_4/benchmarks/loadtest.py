@@ -0,0 +1,369 @@
+"""End-to-end HTTP load test for MJPEG viewers and dashboard pollers.
+
+Starts the Flask app in a subprocess against a local SQLite database (or any
+``--database-url``), a file-backed video and the stub detector, logs in
+simulated users via /login, then opens N ``/sessions/<id>/video_feed``
+consumers and M ``/sessions/<id>/person_data`` pollers of the one zoned session. Reports delivered FPS per viewer, poll latency
+percentiles and server CPU/RSS.
+
+Usage (from module_4)::
+
+    python -m benchmarks.loadtest --viewers 4 --pollers 20 --duration 30
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from typing import Dict, List, Optional
+
+import numpy as np
+
+MODULE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LOADTEST_PASSWORD = 'loadtest-password'
+
+logger = logging.getLogger(__name__)
+
+
+# --- Server side ---
+
+def write_synthetic_video(path: str, width: int, height: int, people: int, frames: int, fps: float = 25.0) -> None:
+    """Render a synthetic scene to an MJPG file the app can stream."""
+    import cv2
+    from benchmarks.synthetic import SyntheticScene
+
+    scene = SyntheticScene(width, height, people)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), fps, (width, height))
+    for i in range(frames):
+        writer.write(scene.frame(i))
+    writer.release()
+
+
+def serve(args) -> int:
+    """Run the app with the stub detector (invoked in the server subprocess)."""
+    import cv2
+    import app as webapp
+    from benchmarks.bench_detector import BENCH_SETTINGS, make_tracker
+    from benchmarks.synthetic import SyntheticScene
+
+    with webapp.app.app_context():
+        webapp.db.create_all()
+        webapp.initialize_system_settings()
+
+    with open(args.video, 'rb') as f:
+        filename, _ = webapp.upload_store.save_stream(f, os.path.basename(args.video))
+    cap = cv2.VideoCapture(args.video)
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    cap.release()
+
+    scene = SyntheticScene(width, height, args.people)
+    template = make_tracker(scene, args.inference_delay_ms / 1000.0)
+    webapp.sessions.update_thresholds(BENCH_SETTINGS)
+    webapp.sessions.set_template(template)
+    webapp.warmup_state.update(state='ready', ready_at=time.time())
+
+    def open_session() -> None:
+        session_id = webapp.sessions.open_file(filename, os.path.join(webapp.app.config['UPLOAD_FOLDER'], filename))
+        webapp.sessions.set_zone(session_id, *template.red_zone.points)
+        # The parent reads this line to learn which session every viewer and poller should use
+        print(json.dumps({'filename': filename, 'session_id': session_id}), flush=True)
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    logging.getLogger('detector').setLevel(logging.WARNING)
+    if args.workers > 1:
+        import serve as preforking
+        # Opening the session starts threads, so it happens after the workers are forked
+        return preforking.run('127.0.0.1', args.port, args.workers, after_fork=open_session)
+    else:
+        webapp.password_hasher.start()
+        open_session()
+        webapp.app.run(host='127.0.0.1', port=args.port, threaded=True, use_reloader=False)
+        return 0
+
+
+# --- Client side ---
+
+class Session:
+    """A logged-in simulated user over a dedicated HTTP connection."""
+
+    def __init__(self, host: str, port: int, timeout: float = 30.0):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.cookie = ''
+
+    def connection(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def request(self, method: str, path: str, body: Optional[Dict] = None) -> http.client.HTTPResponse:
+        conn = self.connection()
+        headers = {'Cookie': self.cookie} if self.cookie else {}
+        data = None
+        if body is not None:
+            data = urllib.parse.urlencode(body)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        conn.request(method, path, body=data, headers=headers)
+        return conn.getresponse()
+
+    def login(self, username: str, password: str) -> None:
+        self.request('POST', '/register', {'username': username, 'password': password}).read()
+        response = self.request('POST', '/login', {'username': username, 'password': password})
+        response.read()
+        for header, value in response.getheaders():
+            if header.lower() == 'set-cookie' and value.startswith('access_token_cookie='):
+                self.cookie = value.split(';', 1)[0]
+        if not self.cookie:
+            raise RuntimeError(f"Login failed for {username} (HTTP {response.status})")
+
+
+def mjpeg_viewer(session: Session, path: str, stop: threading.Event, stats: Dict) -> None:
+    """Consume an MJPEG stream, counting complete frames; reconnect when the video ends."""
+    stats.update(frames=0, bytes=0, reconnects=0, errors=0)
+    boundary = b'--frame'
+    while not stop.is_set():
+        try:
+            response = session.request('GET', path)
+            if response.status != 200:
+                stats['errors'] += 1
+                response.read()
+                time.sleep(0.5)
+                continue
+            tail = b''
+            while not stop.is_set():
+                chunk = response.read1(65536)
+                if not chunk:
+                    break
+                stats['bytes'] += len(chunk)
+                data = tail + chunk
+                stats['frames'] += data.count(boundary)
+                tail = data[-(len(boundary) - 1):]
+            response.close()
+            stats['reconnects'] += 1
+        except (OSError, http.client.HTTPException):
+            stats['errors'] += 1
+            time.sleep(0.5)
+
+
+def poller(session: Session, path: str, interval: float, stop: threading.Event, latencies: List[float],
+           stats: Dict) -> None:
+    """Poll a session's person_data like the dashboard JS does."""
+    stats.update(requests=0, errors=0)
+    conn = session.connection()
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            conn.request('GET', path, headers={'Cookie': session.cookie})
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                stats['errors'] += 1
+            latencies.append(time.perf_counter() - start)
+            stats['requests'] += 1
+        except (OSError, http.client.HTTPException):
+            stats['errors'] += 1
+            conn.close()
+            conn = session.connection()
+        stop.wait(max(0.0, interval - (time.perf_counter() - start)))
+
+
+class ProcessSampler(threading.Thread):
+    """Samples CPU% and RSS of a process from /proc (or psutil where available)."""
+
+    def __init__(self, pid: int, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pid, self.interval = pid, interval
+        self.cpu: List[float] = []
+        self.rss: List[int] = []
+        self.stop_event = threading.Event()
+
+    def _cpu_seconds(self) -> float:
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+    def _rss_bytes(self) -> int:
+        with open(f'/proc/{self.pid}/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+    def run(self) -> None:
+        try:
+            import psutil
+            proc = psutil.Process(self.pid)
+            proc.cpu_percent()
+            read = lambda: (proc.cpu_percent(), proc.memory_info().rss)
+        except ImportError:
+            last = [self._cpu_seconds(), time.monotonic()]
+
+            def read():
+                cpu, now = self._cpu_seconds(), time.monotonic()
+                pct = 100.0 * (cpu - last[0]) / max(now - last[1], 1e-6)
+                last[:] = [cpu, now]
+                return pct, self._rss_bytes()
+        while not self.stop_event.wait(self.interval):
+            try:
+                cpu, rss = read()
+            except Exception:
+                break
+            self.cpu.append(cpu)
+            self.rss.append(rss)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_server(port: int, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/login')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    return round(float(np.percentile(values, q)) * 1000.0, 3) if values else None
+
+
+def start_server(args, workdir: str, video: str, port: int) -> (subprocess.Popen, str):
+    """Launch the server subprocess and return it with the id of the zoned session it set up."""
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_URL': args.database_url or f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+        'SECRET_KEY': env.get('SECRET_KEY', 'loadtest-secret'),
+        'JWT_SECRET_KEY': env.get('JWT_SECRET_KEY', 'loadtest-jwt-secret'),
+        'PYTHONPATH': os.pathsep.join(filter(None, [MODULE_DIR, env.get('PYTHONPATH')])),
+    })
+    cmd = [sys.executable, '-m', 'benchmarks.loadtest', 'serve', '--port', str(port), '--video', video,
+           '--people', str(args.people), '--inference-delay-ms', str(args.inference_delay_ms),
+           '--workers', str(args.workers)]
+    # Run from a scratch directory so uploads/ and reports/ don't land in the repo
+    proc = subprocess.Popen(cmd, cwd=workdir, env=env, stdout=subprocess.PIPE, text=True)
+    session_id = json.loads(proc.stdout.readline())['session_id']
+    _wait_for_server(port, proc)
+    return proc, session_id
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='crowdcount-loadtest-')
+    video = args.video
+    if not video:
+        video = os.path.join(workdir, 'synthetic.avi')
+        write_synthetic_video(video, args.width, args.height, args.people, args.video_frames)
+
+    port = args.port or _free_port()
+    proc, session_id = start_server(args, workdir, video, port)
+    stop = threading.Event()
+    try:
+        sessions = []
+        for i in range(args.users):
+            session = Session('127.0.0.1', port)
+            session.login(f"loadtest_user_{i}", LOADTEST_PASSWORD)
+            sessions.append(session)
+
+        feed_path = f'/sessions/{session_id}/video_feed' + (f'?tier={args.tier}' if args.tier else '')
+        viewer_stats = [{} for _ in range(args.viewers)]
+        poll_stats = [{} for _ in range(args.pollers)]
+        latencies: List[float] = []
+        threads = [threading.Thread(target=mjpeg_viewer, daemon=True,
+                                    args=(sessions[i % len(sessions)], feed_path, stop, viewer_stats[i]))
+                   for i in range(args.viewers)]
+        threads += [threading.Thread(target=poller, daemon=True,
+                                     args=(sessions[i % len(sessions)], f'/sessions/{session_id}/person_data',
+                                           args.poll_interval, stop, latencies, poll_stats[i]))
+                    for i in range(args.pollers)]
+
+        sampler = ProcessSampler(proc.pid)
+        sampler.start()
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        time.sleep(args.duration)
+        stop.set()
+        elapsed = time.perf_counter() - started
+        sampler.stop_event.set()
+        for t in threads:
+            t.join(timeout=5)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    viewers = [{'fps': round(s.get('frames', 0) / elapsed, 2), **s} for s in viewer_stats]
+    return {
+        'settings': {k: v for k, v in vars(args).items() if k != 'command'},
+        'duration_s': round(elapsed, 2),
+        'viewers': viewers,
+        'viewer_fps_total': round(sum(v['fps'] for v in viewers), 2),
+        'polls': {
+            'requests': sum(s.get('requests', 0) for s in poll_stats),
+            'errors': sum(s.get('errors', 0) for s in poll_stats),
+            'per_second': round(len(latencies) / elapsed, 2),
+            'p50_ms': _percentile(latencies, 50),
+            'p99_ms': _percentile(latencies, 99),
+            'max_ms': _percentile(latencies, 100),
+        },
+        'server': {
+            'cpu_percent_mean': round(float(np.mean(sampler.cpu)), 1) if sampler.cpu else None,
+            'cpu_percent_max': round(float(np.max(sampler.cpu)), 1) if sampler.cpu else None,
+            'rss_mb_max': round(max(sampler.rss) / 2 ** 20, 1) if sampler.rss else None,
+        },
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', nargs='?', default='run', choices=['run', 'serve'])
+    parser.add_argument('--viewers', type=int, default=2, help='Concurrent MJPEG consumers')
+    parser.add_argument('--pollers', type=int, default=10, help='Concurrent /person_data pollers')
+    parser.add_argument('--users', type=int, default=2, help='Distinct logged-in users shared by clients')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds to hold the load')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds between polls (dashboard uses 1s)')
+    parser.add_argument('--video', help='Video file to stream (default: generate a synthetic one)')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--people', type=int, default=25)
+    parser.add_argument('--video-frames', type=int, default=250)
+    parser.add_argument('--inference-delay-ms', type=float, default=20.0,
+                        help='CPU time the stub detector burns per frame')
+    parser.add_argument('--tier', help="Output tier viewers request, e.g. 360p or full-raw (default: the default tier)")
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLite in a temp dir)')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Serve through serve.py with this many forked HTTP workers')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--keep-workdir', action='store_true')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.command == 'serve':
+        return serve(args)
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
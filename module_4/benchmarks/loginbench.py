@@ -0,0 +1,180 @@
+"""Login storm benchmark: sign-in throughput and its impact on MJPEG viewers.
+
+Starts the app like loadtest.py (SQLite, synthetic video, stub detector),
+registers ``--operators`` users, then measures two phases of ``--duration``
+seconds each: viewers alone, and viewers while every operator signs in over
+and over (a shift change). Reports logins/sec, login latency percentiles,
+503s from the bounded hashing queue and the viewer FPS lost to hashing.
+
+Usage (from module_4)::
+
+    python -m benchmarks.loginbench --operators 24 --viewers 2 --duration 15
+    python -m benchmarks.loginbench --inline          # hash on request threads, for comparison
+    python -m benchmarks.loginbench --method pbkdf2:sha256:600000 --hash-workers 1
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import numpy as np
+import yaml
+
+from benchmarks.loadtest import (LOADTEST_PASSWORD, ProcessSampler, Session, _free_port, _percentile,
+                                 mjpeg_viewer, start_server, write_synthetic_video)
+
+
+def login_storm(session: Session, username: str, stop: threading.Event, latencies: List[float], stats: Dict) -> None:
+    """Sign in as ``username`` back to back until stopped."""
+    stats.update(ok=0, busy=0, errors=0)
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            response = session.request('POST', '/login', {'username': username, 'password': LOADTEST_PASSWORD})
+            response.read()
+        except (OSError, http.client.HTTPException):
+            stats['errors'] += 1
+            continue
+        if response.status == 302:
+            stats['ok'] += 1
+            latencies.append(time.perf_counter() - start)
+        elif response.status == 503:
+            stats['busy'] += 1
+        else:
+            stats['errors'] += 1
+
+
+def measure(port: int, session_id: str, viewers: List[Session], operators: List[str],
+            duration: float, server_pid: int) -> Dict:
+    stop = threading.Event()
+    viewer_stats = [{} for _ in viewers]
+    login_stats = [{} for _ in operators]
+    latencies: List[float] = []
+    threads = [threading.Thread(target=mjpeg_viewer, daemon=True,
+                                args=(session, f'/sessions/{session_id}/video_feed', stop, viewer_stats[i]))
+               for i, session in enumerate(viewers)]
+    threads += [threading.Thread(target=login_storm, daemon=True,
+                                 args=(Session('127.0.0.1', port), username, stop, latencies, login_stats[i]))
+                for i, username in enumerate(operators)]
+    sampler = ProcessSampler(server_pid)
+    sampler.start()
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    elapsed = time.perf_counter() - started
+    sampler.stop_event.set()
+    for t in threads:
+        t.join(timeout=15)
+
+    fps = [round(s.get('frames', 0) / elapsed, 2) for s in viewer_stats]
+    result = {
+        'viewer_fps': fps,
+        'viewer_fps_total': round(sum(fps), 2),
+        # The hashing pool's processes are children of the server, so this is request handling only
+        'server_cpu_percent_mean': round(float(np.mean(sampler.cpu)), 1) if sampler.cpu else None,
+    }
+    if operators:
+        ok = sum(s.get('ok', 0) for s in login_stats)
+        result['logins'] = {
+            'ok': ok,
+            'busy_503': sum(s.get('busy', 0) for s in login_stats),
+            'errors': sum(s.get('errors', 0) for s in login_stats),
+            'per_second': round(ok / elapsed, 2),
+            'p50_ms': _percentile(latencies, 50),
+            'p99_ms': _percentile(latencies, 99),
+            'max_ms': _percentile(latencies, 100),
+        }
+    return result
+
+
+def run(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix='crowdcount-loginbench-')
+    # The server runs from workdir and reads its hashing settings from there
+    with open(os.path.join(workdir, 'config.yaml'), 'w') as f:
+        yaml.safe_dump({'password_hashing': {
+            'enabled': not args.inline,
+            'workers': args.hash_workers,
+            'max_pending': args.max_pending,
+            'method': args.method,
+        }}, f)
+    video = args.video
+    if not video:
+        video = os.path.join(workdir, 'synthetic.avi')
+        write_synthetic_video(video, args.width, args.height, args.people, args.video_frames)
+
+    port = args.port or _free_port()
+    proc, session_id = start_server(args, workdir, video, port)
+    try:
+        viewers = []
+        for i in range(args.viewers):
+            session = Session('127.0.0.1', port)
+            session.login(f"viewer_{i}", LOADTEST_PASSWORD)
+            viewers.append(session)
+        operators = [f"operator_{i}" for i in range(args.operators)]
+        for username in operators:
+            Session('127.0.0.1', port).login(username, LOADTEST_PASSWORD)
+
+        baseline = measure(port, session_id, viewers, [], args.duration, proc.pid)
+        storm = measure(port, session_id, viewers, operators, args.duration, proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    lost = baseline['viewer_fps_total'] - storm['viewer_fps_total']
+    return {
+        'settings': {k: v for k, v in vars(args).items() if k != 'command'},
+        'baseline': baseline,
+        'login_storm': storm,
+        'viewer_fps_lost_percent': round(100.0 * lost / baseline['viewer_fps_total'], 1)
+        if baseline['viewer_fps_total'] else None,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--operators', type=int, default=24, help='Concurrent users signing in repeatedly')
+    parser.add_argument('--viewers', type=int, default=2, help='Concurrent MJPEG consumers')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per phase')
+    parser.add_argument('--inline', action='store_true', help='Hash on the request threads (no pool)')
+    parser.add_argument('--hash-workers', type=int, default=2)
+    parser.add_argument('--max-pending', type=int, default=32)
+    parser.add_argument('--method', default='scrypt', help='werkzeug hash method, i.e. the cost parameters')
+    parser.add_argument('--video', help='Video file to stream (default: generate a synthetic one)')
+    parser.add_argument('--width', type=int, default=1280)
+    parser.add_argument('--height', type=int, default=720)
+    parser.add_argument('--people', type=int, default=25)
+    parser.add_argument('--video-frames', type=int, default=250)
+    parser.add_argument('--inference-delay-ms', type=float, default=20.0,
+                        help='CPU time the stub detector burns per frame')
+    parser.add_argument('--database-url', help='SQLAlchemy URL (default: SQLite in a temp dir)')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Serve through serve.py with this many forked HTTP workers')
+    parser.add_argument('--output', help='Write the JSON report here (default: stdout)')
+    parser.add_argument('--keep-workdir', action='store_true')
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report)
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
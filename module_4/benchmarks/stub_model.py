@@ -0,0 +1,64 @@
+import time
+import numpy as np
+from typing import List, Optional
+
+from benchmarks.synthetic import SyntheticScene
+
+
+class _Array:
+    """Mimics the `.cpu().numpy()` chain of an ultralytics tensor."""
+
+    def __init__(self, data: np.ndarray):
+        self.data = data
+
+    def cpu(self) -> '_Array':
+        return self
+
+    def numpy(self) -> np.ndarray:
+        return self.data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+
+class _Boxes:
+    def __init__(self, xyxy: np.ndarray, ids: Optional[np.ndarray]):
+        self.xyxy = _Array(xyxy)
+        self.id = _Array(ids) if ids is not None else None
+        self.conf = _Array(np.full(len(xyxy), 0.9, dtype=np.float32))
+        self.cls = _Array(np.zeros(len(xyxy), dtype=np.float32))
+
+
+class _Result:
+    def __init__(self, boxes: _Boxes):
+        self.boxes = boxes
+
+
+class StubYOLO:
+    """Drop-in stand-in for `ultralytics.YOLO` that returns a scene's ground truth.
+
+    Each call advances one frame, so ids are stable and boxes move exactly as
+    in the synthetic scene. An optional fixed delay emulates inference cost.
+    """
+
+    def __init__(self, scene: SyntheticScene, inference_delay: float = 0.0):
+        self.scene = scene
+        self.inference_delay = inference_delay
+        self.index = 0
+
+    def _result(self) -> List[_Result]:
+        if self.inference_delay:
+            # Busy-wait keeps the cost on the CPU, unlike time.sleep()
+            end = time.perf_counter() + self.inference_delay
+            while time.perf_counter() < end:
+                pass
+        boxes = np.array(self.scene.boxes(self.index), dtype=np.float32).reshape(-1, 4)
+        ids = np.arange(1, len(boxes) + 1, dtype=np.float32) if len(boxes) else None
+        self.index += 1
+        return [_Result(_Boxes(boxes, ids))]
+
+    def track(self, frame: np.ndarray, persist: bool = True, verbose: bool = False, classes=None) -> List[_Result]:
+        return self._result()
+
+    def predict(self, frame: np.ndarray, verbose: bool = False, classes=None) -> List[_Result]:
+        return self._result()
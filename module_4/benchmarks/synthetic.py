@@ -0,0 +1,47 @@
+import numpy as np
+import cv2
+from typing import List, Tuple
+
+Box = Tuple[int, int, int, int]
+
+
+class SyntheticScene:
+    """Deterministic crowd scene: a textured background with people walking across it.
+
+    Boxes move on fixed trajectories derived from the seed, so the same
+    (resolution, density, seed) always produces the same frames and boxes.
+    """
+
+    def __init__(self, width: int, height: int, people: int, seed: int = 0):
+        self.width = width
+        self.height = height
+        self.people = people
+        rng = np.random.default_rng(seed)
+
+        # Static background: gradient plus low-amplitude noise so JPEG has real work to do
+        gradient = np.linspace(40, 160, width, dtype=np.float32)[None, :, None]
+        noise = rng.normal(0, 12, (height, width, 3)).astype(np.float32)
+        self.background = np.clip(gradient + noise, 0, 255).astype(np.uint8)
+
+        # Person size scales with frame height, like a fixed overhead camera
+        self.box_h = max(8, height // 8)
+        self.box_w = max(4, self.box_h // 3)
+        self.start = rng.uniform((0, 0), (width - self.box_w, height - self.box_h), (people, 2))
+        self.velocity = rng.uniform(-4, 4, (people, 2)) * (height / 480.0)
+        self.colors = rng.integers(0, 255, (people, 3))
+
+    def boxes(self, index: int) -> List[Box]:
+        """Person boxes (x1, y1, x2, y2) at frame ``index``, bouncing off the frame edges."""
+        span = np.array([self.width - self.box_w, self.height - self.box_h], dtype=np.float64)
+        pos = self.start + self.velocity * index
+        # Reflect into [0, span] so people stay in frame
+        pos = np.abs(np.mod(pos, 2 * span) - span)
+        pos = span - pos
+        return [(int(x), int(y), int(x) + self.box_w, int(y) + self.box_h) for x, y in pos]
+
+    def frame(self, index: int) -> np.ndarray:
+        """Render frame ``index`` as a BGR image."""
+        frame = self.background.copy()
+        for (x1, y1, x2, y2), color in zip(self.boxes(index), self.colors):
+            cv2.rectangle(frame, (x1, y1), (x2, y2), tuple(int(c) for c in color), -1)
+        return frame
@@ -1,10 +1,11 @@
+import copy
 import cv2
 import time
-from ultralytics import YOLO
 import yaml
 import logging
 from typing import Tuple, Dict, Optional, List
 import numpy as np
+from metrics import observe_stage, MOTION_GATE
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -39,11 +40,61 @@ class Zone:
             cv2.putText(frame, self.label, (self.points[0][0], self.points[0][1] - 10),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.6, self.color, 2)
 
+class MotionGate:
+    """Decides whether a frame changed enough since the last detection to be worth running the model on.
+
+    Compares a small blurred grayscale copy of the frame with the one the last
+    detection ran on, so slow changes accumulate instead of slipping under the
+    threshold frame by frame. Detection is forced every ``max_skip_s`` anyway.
+    """
+    def __init__(self, config: Dict):
+        self.enabled = bool(config.get('enabled', True))
+        self.width = int(config.get('downscale_width', 160))
+        self.pixel_threshold = int(config.get('pixel_threshold', 25))
+        self.min_changed_ratio = float(config.get('min_changed_ratio', 0.002))
+        self.max_skip = float(config.get('max_skip_s', 2.0))
+        self.reference: Optional[np.ndarray] = None
+        self.last_detection = 0.0
+
+    def _thumbnail(self, frame: np.ndarray) -> np.ndarray:
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, height * self.width // width))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(cv2.cvtColor(small, cv2.COLOR_BGR2GRAY), (5, 5), 0)
+
+    def should_detect(self, frame: np.ndarray, now: float) -> bool:
+        if not self.enabled:
+            return True
+        small = self._thumbnail(frame)
+        moved = (self.reference is None or self.reference.shape != small.shape
+                 or now - self.last_detection >= self.max_skip)
+        if not moved:
+            _, changed = cv2.threshold(cv2.absdiff(small, self.reference), self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            moved = cv2.countNonZero(changed) >= self.min_changed_ratio * changed.size
+        if moved:
+            self.reference = small
+            self.last_detection = now
+        return moved
+
+    def reset(self) -> None:
+        self.reference = None
+
+def shared_model(model):
+    """A model handle that shares ``model``'s weights but keeps its own predictor and track state.
+
+    ultralytics keeps tracker state on the predictor, so each session needs its
+    own; the network itself (the memory-heavy part) is shared.
+    """
+    clone = copy.copy(model)
+    if hasattr(clone, 'predictor'):
+        clone.predictor = None
+    return clone
+
 class PersonTracker:
     """Tracks people and their time spent in red or green zones."""
     
     # --- MODIFIED: Init now only takes system settings from DB ---
-    def __init__(self, system_settings: dict, config_path: str = "config.yaml"):
+    def __init__(self, system_settings: dict, config_path: str = "config.yaml", model: Optional[object] = None):
         
         # 1. Load config.yaml for non-DB settings (model path, heatmap)
         try:
@@ -57,14 +108,24 @@ class PersonTracker:
                 'heatmap_alpha': 0.4
             }
             
-        try:
-            self.model = YOLO(self.config['model']['path'])
-        except Exception as e:
-            logger.error(f"Failed to load YOLO model: {e}")
-            raise
+        # An injected model (e.g. the benchmark stub) skips loading weights
+        if model is not None:
+            self.model = model
+        else:
+            try:
+                self.model = self._load_model(self.config['model']['path'])
+            except Exception as e:
+                logger.error(f"Failed to load YOLO model: {e}")
+                raise
             
         self.red_zone = Zone('red', (0, 0, 255), self.config['zones']['red']['label'])
         self.heatmap_alpha = self.config.get('heatmap_alpha', 0.4)
+        self.max_tracks = int(self.config.get('max_tracks', 2000))
+        # Set by analysis sessions to run inference in the shared pool (an inference.SessionRunner)
+        self.runner = None
+        self.track_associator = None  # Per-session ultralytics tracker used with batched detection
+        self.motion_gate = MotionGate(self.config.get('motion_gate') or {})
+        self.last_results = None  # Reused on frames the motion gate skips
         
         # 2. Load system-wide thresholds directly
         self.person_alert_threshold = system_settings.get('person_threshold', 10)
@@ -78,10 +139,52 @@ class PersonTracker:
         self.heatmap_points: List[Tuple[int, int]] = []
         self.zone_alert_active = False
         self.overall_alert_active = False
+        # What process_frame drew (or would have drawn) on the last frame, for browsers drawing overlays themselves
+        self.overlay: Dict = self._overlay([], False, False, 0, 0)
         
         logger.info(f"Detector initialized with settings: Person={self.person_alert_threshold}, Zone={self.zone_population_threshold}, Overall={self.overall_population_threshold}")
         # --- END OF MODIFIED INIT ---
 
+    @staticmethod
+    def _load_model(path: str):
+        """Load YOLO weights. ultralytics (and torch) are imported here, not at module import."""
+        from ultralytics import YOLO
+        return YOLO(path)
+
+    def warmup(self) -> float:
+        """Run one dummy inference at the configured size so the first real frame isn't slow."""
+        imgsz = int(self.config['model'].get('imgsz', 640))
+        start = time.perf_counter()
+        # predict() rather than track() so no tracker state is created for the dummy frame
+        self.model.predict(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False, classes=[0])
+        elapsed = time.perf_counter() - start
+        logger.info(f"Model warm-up inference at {imgsz}px took {elapsed:.2f}s")
+        return elapsed
+
+    def spawn(self) -> 'PersonTracker':
+        """A tracker with fresh state and no zone that shares this one's model weights and settings."""
+        sibling = copy.copy(self)
+        sibling.model = shared_model(self.model)
+        sibling.red_zone = Zone(self.red_zone.name, self.red_zone.color, self.red_zone.label)
+        sibling.drawing = False
+        sibling.start_point = None
+        sibling.track_data = {}
+        sibling.heatmap_points = []
+        sibling.zone_alert_active = False
+        sibling.overall_alert_active = False
+        sibling.runner = None
+        sibling.track_associator = None
+        sibling.motion_gate = MotionGate(self.config.get('motion_gate') or {})
+        sibling.last_results = None
+        return sibling
+
+    def update_thresholds(self, system_settings: dict) -> None:
+        """Apply new system-wide thresholds without reloading the model."""
+        self.person_alert_threshold = system_settings.get('person_threshold', 10)
+        self.zone_population_threshold = system_settings.get('zone_threshold', 5)
+        self.overall_population_threshold = system_settings.get('overall_threshold', 20)
+        logger.info(f"Detector thresholds updated: Person={self.person_alert_threshold}, Zone={self.zone_population_threshold}, Overall={self.overall_population_threshold}")
+
     def mouse_callback(self, event: int, x: int, y: int, flags: int, param: any) -> None:
         """Handle mouse events to draw the red zone."""
         if event == cv2.EVENT_LBUTTONDOWN:
@@ -101,6 +204,9 @@ class PersonTracker:
         self.heatmap_points.clear()
         self.zone_alert_active = False
         self.overall_alert_active = False
+        self.track_associator = None
+        self.motion_gate.reset()
+        self.last_results = None
         
         # --- REMOVED: apply_user_settings call ---
         
@@ -118,7 +224,7 @@ class PersonTracker:
                     heatmap_acc[y, x] += 1
             
             heatmap_blurred = cv2.GaussianBlur(heatmap_acc, (91, 91), 0)
-            heatmap_norm = cv2.normalize(heatmap_blurred, None, 0, 255, cv2.NORM_MINMAX, dtype=np.CV_8U)
+            heatmap_norm = cv2.normalize(heatmap_blurred, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U)
             heatmap_color = cv2.applyColorMap(heatmap_norm, cv2.COLORMAP_JET)
             mask = cv2.inRange(heatmap_color, np.array([0,0,0]), np.array([0,0,0]))
             mask_inv = cv2.bitwise_not(mask)
@@ -132,29 +238,103 @@ class PersonTracker:
             logger.error(f"Error applying heatmap: {e}")
             return frame
 
-    def process_frame(self, frame: np.ndarray) -> Tuple[np.ndarray, Dict, List[Dict]]:
-        """Process a frame to detect and track people, calculate zone times, and generate alerts."""
-        annotated = frame.copy()
+    @property
+    def supports_batching(self) -> bool:
+        """Batched detection needs a real ultralytics model (list predict + Results.update)."""
+        return type(self.model).__module__.split('.')[0] == 'ultralytics'
+
+    def _make_associator(self):
+        """The tracker ``model.track`` would create for this session, built from the configured yaml."""
+        from ultralytics.trackers.track import TRACKER_MAP
+        from ultralytics.utils import IterableSimpleNamespace
+        from ultralytics.utils.checks import check_yaml
+        with open(check_yaml(self.config['model'].get('tracker', 'bytetrack.yaml'))) as f:
+            cfg = IterableSimpleNamespace(**yaml.safe_load(f))
+        return TRACKER_MAP[cfg.tracker_type](args=cfg, frame_rate=30)
+
+    def _associate(self, result):
+        """Assign this session's track ids to one frame's detections (what ``model.track`` does internally)."""
+        import torch
+        if self.track_associator is None:
+            self.track_associator = self._make_associator()
+        tracks = self.track_associator.update(result.boxes.cpu().numpy(), result.orig_img)
+        if len(tracks):
+            result.update(boxes=torch.as_tensor(tracks[:, :-1]))
+        return result
+
+    def _track(self, frame: np.ndarray):
+        """Detect and track people in ``frame``; returns a list holding one ultralytics Results."""
+        if self.runner is None:
+            return self.model.track(frame, persist=True, verbose=False, classes=[0])
+        if self.runner.batching and self.supports_batching:
+            # Detection may share a forward pass with other sessions; association stays per session
+            return [self._associate(self.runner.detect(self.model, frame))]
+        return self.runner.run(lambda: self.model.track(frame, persist=True, verbose=False, classes=[0]))
+
+    def _prune_tracks(self) -> None:
+        """Forget the longest-unseen tracks so a long session's memory stays bounded."""
+        keep = sorted(self.track_data, key=lambda t: self.track_data[t]["last_time"], reverse=True)[:self.max_tracks // 2]
+        self.track_data = {t: self.track_data[t] for t in keep}
+
+    def _overlay(self, people: List, population_alert: bool, overall_population_alert: bool,
+                 red_zone_count: int, total_count: int) -> Dict:
+        """The annotations of one frame as data: boxes are [x1, y1, x2, y2, track_id, zone, alerted]."""
+        zone = self.red_zone
+        return {
+            "zone": {"points": zone.points, "label": zone.label} if zone.ready else None,
+            "people": people,
+            "alerts": {
+                "population_alert": population_alert,
+                "overall_population_alert": overall_population_alert,
+                "red_zone_count": red_zone_count,
+                "total_count": total_count,
+            },
+        }
+
+    def process_frame(self, frame: np.ndarray, annotate: bool = True) -> Tuple[np.ndarray, Dict, List[Dict]]:
+        """Process a frame to detect and track people, calculate zone times, and generate alerts.
+
+        With ``annotate=False`` nothing is drawn and ``frame`` itself is returned;
+        the boxes, zone and alerts are still available as data in ``self.overlay``.
+        """
+        annotated = frame.copy() if annotate else frame
         person_details_summary = {}
         frame_height, frame_width = frame.shape[:2]
         new_alerts_to_log: List[Dict] = []
+        self.overlay = self._overlay([], False, False, 0, 0)
 
         if not self.red_zone.ready:
-            cv2.putText(annotated, "Draw RED Zone with mouse", (40, 40),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+            if annotate:
+                cv2.putText(annotated, "Draw RED Zone with mouse", (40, 40),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
             return annotated, {"person_details": {}, "global_metrics": {}}, []
 
-        self.red_zone.draw(annotated)
+        stage_start = time.perf_counter()
+        if annotate:
+            self.red_zone.draw(annotated)
+        annotation_time = time.perf_counter() - stage_start
 
-        try:
-            results = self.model.track(annotated, persist=True, verbose=False, classes=[0])
-        except Exception as e:
-            logger.error(f"Error in YOLO tracking: {e}")
-            return annotated, {"person_details": {}, "global_metrics": {}}, []
+        stage_start = time.perf_counter()
+        # Nothing moved: reuse the last detections; dwell times still advance below
+        if self.last_results is not None and not self.motion_gate.should_detect(frame, time.time()):
+            results = self.last_results
+            MOTION_GATE.labels('skip').inc()
+            observe_stage('motion_gate', time.perf_counter() - stage_start)
+        else:
+            try:
+                results = self._track(frame)  # The clean frame: detections must not depend on what is drawn
+            except Exception as e:
+                logger.error(f"Error in YOLO tracking: {e}")
+                return annotated, {"person_details": {}, "global_metrics": {}}, []
+            self.last_results = results
+            MOTION_GATE.labels('detect').inc()
+            observe_stage('inference', time.perf_counter() - stage_start)
 
+        stage_start = time.perf_counter()
         current_time = time.time()
         total_count = 0
         red_zone_count = 0
+        to_draw = []
         
         if results[0].boxes.id is not None:
             ids = results[0].boxes.id.cpu().numpy().astype(int)
@@ -195,13 +375,7 @@ class PersonTracker:
                     new_alerts_to_log.append({'type': 'Per-Person', 'message': msg})
                     logger.warning(msg)
 
-                color = (0, 0, 255) if current_zone == "red" else (0, 255, 0)
-                cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                cv2.putText(annotated, f"P{track_id}", (x1, y1 - 10),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
-                if person["alerted"]:
-                    cv2.putText(annotated, "ALERT!", (x1, y1 - 30),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+                to_draw.append((x1, y1, x2, y2, track_id, current_zone, person["alerted"]))
 
                 person_details_summary[f"P{track_id}"] = {
                     "Label": label,
@@ -213,6 +387,9 @@ class PersonTracker:
                     "Location": (cx, cy)
                 }
         
+        if len(self.track_data) > self.max_tracks:
+            self._prune_tracks()
+
         green_zone_count = total_count - red_zone_count
         
         # --- Zone Population Alert ---
@@ -223,10 +400,6 @@ class PersonTracker:
             new_alerts_to_log.append({'type': 'Zone Population', 'message': msg})
         elif not population_alert and self.zone_alert_active:
             self.zone_alert_active = False
-            
-        if population_alert:
-            cv2.putText(annotated, f"ZONE POPULATION ALERT: {red_zone_count} in Zone!", (40, 80),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 3)
 
         # --- Overall Population Alert ---
         overall_population_alert = total_count > self.overall_population_threshold
@@ -236,13 +409,8 @@ class PersonTracker:
             new_alerts_to_log.append({'type': 'Overall Population', 'message': msg})
         elif not overall_population_alert and self.overall_alert_active:
             self.overall_alert_active = False
-            
-        if overall_population_alert:
-            cv2.putText(annotated, f"OVERALL POPULATION ALERT: {total_count} people!", (40, 120),
-                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 0, 255), 3)
+        observe_stage('tracking', time.perf_counter() - stage_start)
 
-        annotated = self._apply_heatmap(annotated)
-        
         final_data = {
             "person_details": person_details_summary,
             "global_metrics": {
@@ -255,5 +423,35 @@ class PersonTracker:
                 "frame_height": frame_height
             }
         }
+        self.overlay = self._overlay([[x1, y1, x2, y2, int(track_id), current_zone, alerted]
+                                      for x1, y1, x2, y2, track_id, current_zone, alerted in to_draw],
+                                     population_alert, overall_population_alert, red_zone_count, total_count)
+        if not annotate:
+            self.heatmap_points = self.heatmap_points[-500:]  # _apply_heatmap trims them otherwise
+            observe_stage('annotation', annotation_time)
+            return annotated, final_data, new_alerts_to_log
+
+        # --- Annotation ---
+        stage_start = time.perf_counter()
+        for x1, y1, x2, y2, track_id, current_zone, alerted in to_draw:
+            color = (0, 0, 255) if current_zone == "red" else (0, 255, 0)
+            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
+            cv2.putText(annotated, f"P{track_id}", (x1, y1 - 10),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
+            if alerted:
+                cv2.putText(annotated, "ALERT!", (x1, y1 - 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 0, 255), 2)
+
+        if population_alert:
+            cv2.putText(annotated, f"ZONE POPULATION ALERT: {red_zone_count} in Zone!", (40, 80),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 255), 3)
+        if overall_population_alert:
+            cv2.putText(annotated, f"OVERALL POPULATION ALERT: {total_count} people!", (40, 120),
+                        cv2.FONT_HERSHEY_SIMPLEX, 1.0, (255, 0, 255), 3)
+        observe_stage('annotation', annotation_time + time.perf_counter() - stage_start)
+
+        stage_start = time.perf_counter()
+        annotated = self._apply_heatmap(annotated)
+        observe_stage('heatmap', time.perf_counter() - stage_start)
 
         return annotated, final_data, new_alerts_to_log
\ No newline at end of file
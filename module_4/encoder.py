@@ -0,0 +1,112 @@
+import logging
+from typing import Dict, Iterable, Optional, Tuple
+import cv2
+import numpy as np
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+RAW_SUFFIX = '-raw'
+
+DEFAULT_OUTPUT_CONFIG = {
+    'backend': 'opencv',      # 'turbojpeg' encodes with libjpeg-turbo via PyTurboJPEG, if installed
+    'default_tier': 'full',   # Tier viewers get without ?tier=; its ring also carries the metrics
+    'watch_window_s': 2.0,    # A tier no viewer has read for this long isn't encoded
+    'client_overlays': True,  # Also offer each tier unannotated as '<tier>-raw', for pages drawing overlays themselves
+    'overlay_mode': 'server', # Where the video pages draw boxes and zones by default: 'server' or 'client'
+    'tiers': {
+        'full': {'height': 0, 'quality': 85},    # height 0 = the frame as analysed
+        '720p': {'height': 720, 'quality': 80},
+        '360p': {'height': 360, 'quality': 70},
+    },
+}
+
+
+def load_output_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `output` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_OUTPUT_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('output') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load output config: {e}. Using defaults.")
+    return config
+
+
+class TierEncoder:
+    """JPEG-encodes each processed frame once per watched output tier.
+
+    A tier is a target height (never upscaled) and a JPEG quality. Tiers that
+    resolve to the same size and quality share one encode, and each size is
+    resized once (INTER_AREA) however many qualities use it. Encoded buffers
+    are returned as-is (a numpy view or bytes) so the frame ring can copy them
+    straight into shared memory without an intermediate ``tobytes()``.
+
+    With ``client_overlays`` every tier has an unannotated twin, ``<tier>-raw``,
+    encoded from the frame as decoded; the browser draws the boxes and zone from
+    the overlay metadata instead. The tracker only draws while an annotated tier
+    is being watched (see ``needs_annotation``).
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_OUTPUT_CONFIG)
+        # name -> (height, quality, annotated)
+        self.tiers: Dict[str, Tuple[int, int, bool]] = {
+            name: (int(tier.get('height') or 0), int(tier.get('quality', 85)), True)
+            for name, tier in (self.config.get('tiers') or {}).items()
+        }
+        self.default_tier = str(self.config['default_tier'])
+        if self.default_tier not in self.tiers:
+            self.tiers[self.default_tier] = (0, 85, True)
+        if self.config.get('client_overlays', True):
+            for name, (height, quality, _) in list(self.tiers.items()):
+                self.tiers[name + RAW_SUFFIX] = (height, quality, False)
+        self.watch_window = float(self.config['watch_window_s'])
+        self._turbo = None
+        if self.config.get('backend') == 'turbojpeg':
+            try:
+                from turbojpeg import TurboJPEG
+                self._turbo = TurboJPEG()
+            except Exception as e:
+                logger.warning(f"turbojpeg backend unavailable ({e}); encoding with OpenCV")
+        self.backend = 'turbojpeg' if self._turbo is not None else 'opencv'
+        logger.info(f"Output tiers ({self.backend}): " +
+                    ', '.join(f"{n}={h or 'full'}@q{q}" for n, (h, q, _) in self.tiers.items()))
+
+    def _encode(self, image: np.ndarray, quality: int):
+        if self._turbo is not None:
+            return self._turbo.encode(image, quality=quality)
+        ok, buffer = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise RuntimeError("JPEG encoding failed")
+        return buffer.reshape(-1)  # A view; the ring copies it into shared memory directly
+
+    def needs_annotation(self, tiers: Iterable[str]) -> bool:
+        """Whether any of ``tiers`` shows frames with the overlays drawn in."""
+        return any(self.tiers[name][2] for name in tiers)
+
+    def encode(self, frame: np.ndarray, tiers: Iterable[str], raw: Optional[np.ndarray] = None) -> Dict[str, object]:
+        """JPEG buffer per requested tier name; ``-raw`` tiers encode ``raw`` (default: ``frame``)."""
+        height, width = frame.shape[:2]
+        resized: Dict[Tuple[int, int, int], np.ndarray] = {}
+        encoded: Dict[Tuple[int, int, int, int], object] = {}
+        out = {}
+        for name in tiers:
+            target, quality, annotated = self.tiers[name]
+            source = frame if annotated or raw is None else raw
+            if not target or target >= height:
+                size = (width, height)
+            else:
+                size = (max(2, int(round(width * target / height / 2)) * 2), target)
+            key = (id(source),) + size + (quality,)
+            if key not in encoded:
+                image = source
+                if size != (width, height):
+                    image = resized.get(key[:3])
+                    if image is None:
+                        image = resized[key[:3]] = cv2.resize(source, size, interpolation=cv2.INTER_AREA)
+                encoded[key] = self._encode(image, quality)
+            out[name] = encoded[key]
+        return out
@@ -0,0 +1,228 @@
+import logging
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_RING_CONFIG = {
+    'slots': 4,                 # A reader has roughly slots / fps seconds to copy a frame out
+    'slot_bytes': 2 * 2 ** 20,  # Encoded frame + metrics JSON; larger frames are dropped
+    'poll_interval_ms': 5,      # How often waiting readers check for a new frame
+}
+
+MAGIC = b'CCR1'
+# magic, slots, slot_bytes, closed, generation, head_seq, last_read (unix time)
+HEADER = struct.Struct('<4sIIIQQd')
+HEADER_SIZE = 64
+# seq_begin, seq_end, chunk_len, meta_len. A slot is consistent iff begin == end.
+SLOT_HEADER = struct.Struct('<QQII')
+_HEAD_OFFSET = 24
+_LAST_READ_OFFSET = 32
+
+
+def load_ring_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `frame_ring` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_RING_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('frame_ring') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load frame ring config: {e}. Using defaults.")
+    return config
+
+
+class FrameRing:
+    """Single-writer, many-reader ring of encoded frames and metric snapshots in shared memory.
+
+    The pipeline publishes each annotated MJPEG part together with a JSON metrics
+    snapshot under an increasing sequence number. Readers (web workers, possibly
+    in other processes) attach by name and copy slots out under a seqlock, so
+    they never take a lock the writer needs: a slow or stalled viewer can only
+    miss frames, never delay the pipeline. A stream is one ``generation``;
+    closing it tells readers to finish.
+    """
+
+    _attached: Dict[str, 'FrameRing'] = {}
+    _attach_lock = threading.Lock()
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool, poll_interval: float):
+        self.shm = shm
+        self.buf = shm.buf
+        self.owner = owner
+        self.poll_interval = poll_interval
+        magic, self.slots, self.slot_bytes = HEADER.unpack_from(self.buf, 0)[:3]
+        if magic != MAGIC:
+            raise ValueError(f"{shm.name} is not a frame ring")
+        self._slot_stride = SLOT_HEADER.size + self.slot_bytes
+        self._write_lock = threading.Lock()  # Writers all live in the owning process; readers never take it
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, config: Optional[Dict] = None) -> 'FrameRing':
+        config = config or DEFAULT_RING_CONFIG
+        slots, slot_bytes = int(config['slots']), int(config['slot_bytes'])
+        size = HEADER_SIZE + slots * (SLOT_HEADER.size + slot_bytes)
+        shm = shared_memory.SharedMemory(create=True, size=size)
+        HEADER.pack_into(shm.buf, 0, MAGIC, slots, slot_bytes, 1, 0, 0, time.time())
+        ring = cls(shm, owner=True, poll_interval=float(config['poll_interval_ms']) / 1000.0)
+        with cls._attach_lock:
+            cls._attached[ring.name] = ring
+        logger.info(f"Frame ring {ring.name} created: {slots} x {slot_bytes / 2 ** 20:.1f} MB")
+        return ring
+
+    @classmethod
+    def attach(cls, name: str, poll_interval_ms: float = DEFAULT_RING_CONFIG['poll_interval_ms']) -> 'FrameRing':
+        """Open an existing ring by name, reusing this process's mapping if it has one."""
+        with cls._attach_lock:
+            ring = cls._attached.get(name)
+            if ring is None:
+                try:
+                    shm = shared_memory.SharedMemory(name=name, track=False)
+                except TypeError:
+                    # Python < 3.13 tracks attached segments too and would unlink this one
+                    # when the reader exits; only the owner may do that.
+                    from multiprocessing import resource_tracker
+                    shm = shared_memory.SharedMemory(name=name)
+                    resource_tracker.unregister(shm._name, 'shared_memory')
+                ring = cls(shm, owner=False, poll_interval=poll_interval_ms / 1000.0)
+                cls._attached[name] = ring
+            return ring
+
+    def close(self) -> None:
+        """Detach; the owner also marks the ring retired and removes it."""
+        if self.buf is None:
+            return
+        with self._attach_lock:
+            if self._attached.get(self.name) is self:
+                del self._attached[self.name]
+        if self.owner:
+            self.end_stream()
+            self.buf[:4] = b'DEAD'  # Readers still attached see this and re-resolve
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    @property
+    def retired(self) -> bool:
+        """True once the owner has closed this ring (its session is gone)."""
+        return self.buf is None or bytes(self.buf[:4]) != MAGIC
+
+    # --- Header fields ---
+
+    @property
+    def head(self) -> int:
+        return struct.unpack_from('<Q', self.buf, _HEAD_OFFSET)[0]
+
+    @property
+    def generation(self) -> int:
+        return struct.unpack_from('<Q', self.buf, 16)[0]
+
+    @property
+    def closed(self) -> bool:
+        return bool(struct.unpack_from('<I', self.buf, 12)[0])
+
+    @property
+    def last_read(self) -> float:
+        return struct.unpack_from('<d', self.buf, _LAST_READ_OFFSET)[0]
+
+    def touch(self) -> None:
+        """Record that a viewer is still reading (lets the writer stop when nobody is)."""
+        struct.pack_into('<d', self.buf, _LAST_READ_OFFSET, time.time())
+
+    # --- Writer ---
+
+    def begin_stream(self) -> Tuple[int, int]:
+        """Start a new generation; returns ``(generation, head)`` for readers to start from."""
+        generation = self.generation + 1
+        struct.pack_into('<IQ', self.buf, 12, 0, generation)
+        self.touch()
+        return generation, self.head
+
+    def end_stream(self) -> None:
+        struct.pack_into('<I', self.buf, 12, 1)
+
+    def publish(self, chunk, meta: bytes = b'') -> int:
+        """Write one frame (may be empty) and its metrics; returns its sequence number or 0 if too large.
+
+        ``chunk`` may be a tuple of byte buffers (e.g. part header, JPEG, trailer):
+        they are written back to back, so a frame is never concatenated first.
+        """
+        parts = chunk if isinstance(chunk, tuple) else (chunk,)
+        sizes = [memoryview(part).nbytes for part in parts]
+        chunk_len = sum(sizes)
+        if chunk_len + len(meta) > self.slot_bytes:
+            return 0
+        with self._write_lock:
+            seq = self.head + 1
+            offset = HEADER_SIZE + (seq % self.slots) * self._slot_stride
+            data = offset + SLOT_HEADER.size
+            struct.pack_into('<Q', self.buf, offset, seq)  # Marks the slot as being rewritten
+            position = data
+            for part, size in zip(parts, sizes):
+                self.buf[position:position + size] = part
+                position += size
+            self.buf[position:position + len(meta)] = meta
+            struct.pack_into('<II', self.buf, offset + 16, chunk_len, len(meta))
+            struct.pack_into('<Q', self.buf, offset + 8, seq)
+            struct.pack_into('<Q', self.buf, _HEAD_OFFSET, seq)
+        return seq
+
+    # --- Readers ---
+
+    def read(self, seq: int, want_chunk: bool = True) -> Optional[Tuple[bytes, bytes]]:
+        """Copy slot ``seq`` out as ``(chunk, meta)``; None if it has already been overwritten."""
+        offset = HEADER_SIZE + (seq % self.slots) * self._slot_stride
+        data = offset + SLOT_HEADER.size
+        _, end, chunk_len, meta_len = SLOT_HEADER.unpack_from(self.buf, offset)
+        if end != seq:
+            return None
+        # WSGI needs bytes, so this slice copy is the one copy a frame makes on its way out
+        chunk = bytes(self.buf[data:data + chunk_len]) if want_chunk else b''
+        meta = bytes(self.buf[data + chunk_len:data + chunk_len + meta_len])
+        begin = struct.unpack_from('<Q', self.buf, offset)[0]
+        return (chunk, meta) if begin == seq else None
+
+    def latest(self, want_chunk: bool = True) -> Optional[Tuple[int, bytes, bytes]]:
+        """Newest consistent ``(seq, chunk, meta)``, or None if nothing was published yet."""
+        for _ in range(self.slots):
+            seq = self.head
+            if seq == 0:
+                return None
+            item = self.read(seq, want_chunk)
+            if item is not None:
+                return (seq,) + item
+        return None
+
+    def wait_next(self, after_seq: int, generation: int, timeout: float,
+                  want_meta: bool = False) -> Optional[Tuple[int, Optional[bytes]]]:
+        """Wait for a frame newer than ``after_seq`` in ``generation``.
+
+        Returns ``(seq, chunk)`` (``(seq, meta)`` with ``want_meta``, without
+        copying the chunk), ``(after_seq, None)`` on timeout, or ``None`` once
+        the stream has ended (closed or superseded by a newer generation).
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            self.touch()
+            if self.generation != generation:
+                return None
+            if self.head > after_seq:
+                item = self.latest(want_chunk=not want_meta)
+                if item is not None and item[0] > after_seq:
+                    seq, chunk, meta = item
+                    return seq, meta if want_meta else chunk
+            elif self.closed:
+                return None
+            if time.monotonic() >= deadline:
+                return after_seq, None
+            time.sleep(self.poll_interval)
@@ -0,0 +1,183 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+import yaml
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import metrics
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_HASHING_CONFIG = {
+    'enabled': True,       # False hashes inline on the request thread
+    'workers': 2,          # Hashing processes per HTTP worker process
+    'max_pending': 32,     # Hashes queued or running before new sign-ins are turned away
+    'timeout_s': 10,       # Longest a request waits for its hash
+    'nice': 10,            # Lower the hashing processes' CPU priority so video pipelines win under contention
+    'method': 'scrypt',    # werkzeug method string, e.g. 'scrypt:32768:8:1' or 'pbkdf2:sha256:600000'
+    'salt_length': 16,
+}
+
+HASH_SECONDS = metrics.REGISTRY.histogram(
+    'crowdcount_password_hash_seconds', 'Queue wait plus hashing time per password operation.', ('operation',))
+HASH_REJECTED = metrics.REGISTRY.counter(
+    'crowdcount_password_hash_rejected_total', 'Password operations refused because the hashing queue was full.',
+    ('operation',))
+
+
+def load_hashing_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `password_hashing` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_HASHING_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('password_hashing') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load password hashing config: {e}. Using defaults.")
+    return config
+
+
+class HashingBusy(Exception):
+    """Raised when a password operation can't be queued or didn't finish in time."""
+
+
+def _watch_parent(parent: int) -> None:
+    # A killed parent never shuts the pool down; don't linger as an orphan
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    os._exit(0)
+
+
+def _init_worker(nice: int) -> None:
+    if nice and hasattr(os, 'nice'):
+        os.nice(nice)
+    threading.Thread(target=_watch_parent, args=(os.getppid(),), daemon=True).start()
+
+
+def _noop() -> None:
+    return None
+
+
+class PasswordHasher:
+    """Runs PBKDF2/scrypt password hashing on a small, bounded pool of processes.
+
+    Hashing is deliberately CPU-expensive. Done inline, a burst of sign-ins
+    (a shift change) runs one hash per request thread at once and starves the
+    video pipelines of cores. Here at most ``workers`` hashes run at a time,
+    at reduced priority (``nice``), and at most ``max_pending`` wait; beyond
+    that ``HashingBusy`` is raised so the route can answer 503 instead of
+    queueing without bound.
+
+    Processes are forked, so call ``start()`` before the process starts
+    threads (``create_app`` and each serve.py worker do); otherwise the pool
+    starts on first use. Where fork isn't available a thread pool is used:
+    hashlib releases the GIL, so the bound still holds.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_HASHING_CONFIG)
+        self.enabled = bool(self.config.get('enabled', True))
+        self.workers = max(1, int(self.config['workers']))
+        self.max_pending = max(1, int(self.config['max_pending']))
+        self.timeout = float(self.config['timeout_s'])
+        self.method = str(self.config['method'])
+        self.salt_length = int(self.config['salt_length'])
+        self._executor: Optional[Executor] = None
+        self._pid: Optional[int] = None
+        self._pending = 0
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Create the pool in this process (a forked child drops the parent's) and spawn its workers now."""
+        if not self.enabled:
+            return
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                return
+            if 'fork' in multiprocessing.get_all_start_methods():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+                    initializer=_init_worker, initargs=(int(self.config['nice']),))
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+            self._pid = os.getpid()
+            executor = self._executor
+        # A fork-context pool starts all its processes on the first submit
+        executor.submit(_noop).result()
+        logger.info(f"Password hashing pool started with {self.workers} workers ({self.method})")
+
+    def _pool(self) -> Executor:
+        """This process's executor, starting it on first use."""
+        with self._lock:
+            executor = self._executor if self._pid == os.getpid() else None
+        if executor is None:
+            self.start()
+            with self._lock:
+                executor = self._executor
+        if executor is None:  # Another request saw the pool break in the meantime
+            raise HashingBusy("Password hashing pool restarted")
+        return executor
+
+    def _release(self, _future=None) -> None:
+        with self._lock:
+            self._pending -= 1
+
+    def _reset(self, executor: Executor) -> None:
+        # A hashing process died (e.g. OOM-killed); rebuild the pool for the next request
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+
+    def _run(self, operation: str, fn: Callable, *args):
+        if not self.enabled:
+            return fn(*args)
+        executor = self._pool()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                HASH_REJECTED.labels(operation).inc()
+                raise HashingBusy("Too many sign-ins at once")
+            self._pending += 1
+        started = time.perf_counter()
+        try:
+            try:
+                future = executor.submit(fn, *args)
+            except BrokenProcessPool:
+                self._release()
+                self._reset(executor)
+                raise HashingBusy("Password hashing pool restarted")
+            # The slot stays taken until the job is really done, not just until this request gives up
+            future.add_done_callback(self._release)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                future.cancel()  # Drops it if still queued; a running hash can't be interrupted
+                HASH_REJECTED.labels(operation).inc()
+                raise HashingBusy("Password check timed out")
+            except BrokenProcessPool:
+                self._reset(executor)
+                raise HashingBusy("Password hashing pool restarted")
+        finally:
+            HASH_SECONDS.labels(operation).observe(time.perf_counter() - started)
+
+    def hash(self, password: str) -> str:
+        return self._run('hash', generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run('verify', check_password_hash, pwhash, password)
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {'enabled': self.enabled, 'workers': self.workers, 'method': self.method,
+                    'pending': self._pending, 'max_pending': self.max_pending, 'rejected': self._rejected}
+
+
+password_hasher = PasswordHasher(load_hashing_config())
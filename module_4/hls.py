@@ -0,0 +1,232 @@
+import logging
+import os
+import re
+import secrets
+import shutil
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+import cv2
+import numpy as np
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_HLS_CONFIG = {
+    'enabled': True,
+    'ffmpeg': 'ffmpeg',           # FFmpeg binary (name on PATH or a full path); HLS is unavailable without it
+    'directory': 'uploads/hls',   # One subdirectory per stream, named by its random token
+    'fps': 15,                    # Constant output rate; the newest annotated frame is repeated or skipped to hold it
+    'max_height': 720,            # Downscale taller frames before encoding; 0 = as analysed
+    'codec': 'libx264',
+    'preset': 'veryfast',
+    'crf': 28,
+    'segment_s': 2,               # Segment length (a keyframe starts every segment)
+    'playlist_segments': 6,       # Segments in the rolling live playlist
+    'keep_segments': False,       # Keep every segment and list them all: the stream doubles as a recording
+    'idle_timeout_s': 20,         # Stop encoding when nobody has fetched the playlist for this long
+    'segment_max_age_s': 86400,   # Cache lifetime of segments (their names are never reused)
+}
+
+PLAYLIST = 'index.m3u8'
+INIT_SEGMENT = 'init.mp4'
+WATCH_MARKER = '.watched'
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,64}$')
+FILE_PATTERN = re.compile(r'^(index\.m3u8|init\.mp4|seg_\d{6}\.m4s)$')
+
+
+def load_hls_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `hls` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_HLS_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('hls') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load HLS config: {e}. Using defaults.")
+    return config
+
+
+def hls_available(config: Dict) -> bool:
+    """Whether HLS output is enabled and FFmpeg can be found."""
+    if not config.get('enabled', True):
+        return False
+    if shutil.which(config['ffmpeg']) is None:
+        logger.warning(f"HLS output disabled: FFmpeg not found ({config['ffmpeg']})")
+        return False
+    return True
+
+
+def mark_watched(directory: str) -> None:
+    """Record a playlist fetch; web workers call this, the stream's owner reads it (no RPC needed)."""
+    marker = os.path.join(directory, WATCH_MARKER)
+    with open(marker, 'a'):
+        os.utime(marker)
+
+
+class HlsStream:
+    """Encodes one session's annotated frames to fragmented-MP4 HLS segments with FFmpeg.
+
+    The pipeline only hands over its newest frame (``offer``); a feeder thread
+    writes raw frames to FFmpeg at a constant ``fps``, so a slow encoder can
+    never hold the pipeline up. FFmpeg writes ``init.mp4``, ``seg_NNNNNN.m4s``
+    and a rolling ``index.m3u8`` into a directory named by a random token.
+    Those are plain files: any HTTP server or cache can serve and fan them
+    out, and the token in the URL is what grants access to them.
+
+    A stream starts on ``request`` (a viewer asked for it) and stops once no
+    playlist fetch has been seen for ``idle_timeout_s`` or the pipeline ends.
+    """
+
+    def __init__(self, session_id: str, config: Dict):
+        self.session_id = session_id
+        self.config = config
+        self.fps = float(config['fps'])
+        self.idle_timeout = float(config['idle_timeout_s'])
+        self.token: Optional[str] = None
+        self.directory: Optional[str] = None
+        self.requested_at = 0.0
+        self.process: Optional[subprocess.Popen] = None
+        self._latest: Optional[np.ndarray] = None
+        self._feeder: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- Viewer side ---
+
+    def request(self) -> Dict:
+        """Start the stream unless it is running; returns its token and whether the playlist exists yet."""
+        with self._lock:
+            if self.token is None:
+                previous = self.directory
+                self.token = secrets.token_urlsafe(24)
+                self.directory = os.path.join(self.config['directory'], self.token)
+                os.makedirs(self.directory, exist_ok=True)
+                self._stop_event.clear()
+                if previous and not self.config.get('keep_segments'):
+                    shutil.rmtree(previous, ignore_errors=True)
+                logger.info(f"HLS stream requested for session {self.session_id}")
+            self.requested_at = time.time()
+            mark_watched(self.directory)
+            return {'token': self.token, 'ready': os.path.exists(os.path.join(self.directory, PLAYLIST))}
+
+    @property
+    def last_request(self) -> float:
+        """When the playlist was last fetched (or the stream requested)."""
+        if self.directory is None:
+            return 0.0
+        try:
+            return max(self.requested_at, os.path.getmtime(os.path.join(self.directory, WATCH_MARKER)))
+        except OSError:
+            return self.requested_at
+
+    @property
+    def live(self) -> bool:
+        """Whether frames should be offered; stops a stream nobody has fetched lately."""
+        if self.token is None:
+            return False
+        if time.time() - self.last_request > self.idle_timeout:
+            logger.info(f"HLS stream of session {self.session_id} idle, stopping")
+            self.finish()
+            return False
+        return True
+
+    # --- Pipeline side ---
+
+    def offer(self, frame: np.ndarray) -> None:
+        """Hand over the newest annotated frame; FFmpeg starts on the first one (it fixes the size)."""
+        self._latest = frame
+        if self.process is None:
+            with self._lock:
+                if self.process is None and self.token is not None:
+                    self._spawn(frame)
+
+    def _output_size(self, frame: np.ndarray):
+        height, width = frame.shape[:2]
+        max_height = int(self.config.get('max_height') or 0)
+        if max_height and height > max_height:
+            width, height = int(round(width * max_height / height / 2)) * 2, max_height
+        # 4:2:0 chroma needs even dimensions
+        return width - width % 2, height - height % 2
+
+    def _command(self, width: int, height: int) -> List[str]:
+        config = self.config
+        fps = self.fps
+        gop = max(1, int(round(fps * float(config['segment_s']))))
+        flags = ['independent_segments', 'program_date_time']
+        if config.get('keep_segments'):
+            playlist = ['-hls_list_size', '0', '-hls_playlist_type', 'event']
+        else:
+            playlist = ['-hls_list_size', str(int(config['playlist_segments']))]
+            flags.append('delete_segments')
+        return [
+            config['ffmpeg'], '-hide_banner', '-loglevel', 'error', '-y',
+            '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f'{width}x{height}', '-r', f'{fps:g}', '-i', 'pipe:0',
+            '-an', '-c:v', config['codec'], '-preset', str(config['preset']), '-tune', 'zerolatency',
+            '-crf', str(config['crf']), '-pix_fmt', 'yuv420p',
+            '-g', str(gop), '-keyint_min', str(gop), '-sc_threshold', '0',
+            '-f', 'hls', '-hls_time', f"{float(config['segment_s']):g}", *playlist,
+            '-hls_flags', '+'.join(flags), '-hls_segment_type', 'fmp4',
+            '-hls_fmp4_init_filename', INIT_SEGMENT,
+            '-hls_segment_filename', os.path.join(self.directory, 'seg_%06d.m4s'),
+            os.path.join(self.directory, PLAYLIST),
+        ]
+
+    def _spawn(self, frame: np.ndarray) -> None:
+        width, height = self._output_size(frame)
+        try:
+            self.process = subprocess.Popen(self._command(width, height), stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            logger.error(f"Failed to start FFmpeg for session {self.session_id}: {e}")
+            self.token = None
+            return
+        self._feeder = threading.Thread(target=self._feed, args=(self.process, (width, height)),
+                                        name=f"hls-{self.session_id}", daemon=True)
+        self._feeder.start()
+        logger.info(f"HLS encoding started for session {self.session_id} ({width}x{height} @ {self.fps:g} fps)")
+
+    def _feed(self, process: subprocess.Popen, size) -> None:
+        interval = 1.0 / self.fps
+        next_due = time.monotonic()
+        try:
+            while not self._stop_event.is_set():
+                frame = self._latest
+                if frame.shape[1::-1] != size:
+                    frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+                process.stdin.write(np.ascontiguousarray(frame).data)
+                next_due += interval
+                delay = next_due - time.monotonic()
+                if delay > 0:
+                    self._stop_event.wait(delay)
+                else:
+                    next_due = time.monotonic()  # Encoder fell behind; don't try to catch up
+        except (BrokenPipeError, ValueError, OSError) as e:
+            error = process.stderr.read().decode(errors='replace').strip() if process.stderr else ''
+            logger.error(f"HLS encoder for session {self.session_id} stopped: {error or e}")
+
+    def finish(self) -> None:
+        """Stop encoding; FFmpeg finishes the last segment and ends the playlist."""
+        with self._lock:
+            process, feeder = self.process, self._feeder
+            self.process = None
+            self._feeder = None
+            self.token = None
+            self._stop_event.set()
+        if feeder is not None:
+            feeder.join(timeout=5)
+        if process is not None:
+            try:
+                process.stdin.close()
+                process.wait(timeout=10)
+            except (OSError, subprocess.TimeoutExpired):
+                process.kill()
+            logger.info(f"HLS encoding stopped for session {self.session_id}")
+
+    def close(self) -> None:
+        """Stop and, unless segments are kept as a recording, delete this session's files."""
+        self.finish()
+        if self.directory and not self.config.get('keep_segments'):
+            shutil.rmtree(self.directory, ignore_errors=True)
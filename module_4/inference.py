@@ -0,0 +1,288 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import yaml
+
+import metrics
+from scheduler import scheduler
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first
+LIVE = 'live'
+OFFLINE = 'offline'
+CLASSES = (LIVE, OFFLINE)
+
+DEFAULT_INFERENCE_CONFIG = {
+    'workers': 2,                 # Threads running model inference for every session
+    'reserved_live_workers': 1,   # Workers offline jobs may never occupy, so a live frame never waits behind an upload
+    'slo_ms': {LIVE: 150, OFFLINE: 2000},  # Queue wait + inference, per class
+    'max_batch': 4,               # Frames from different sessions run in one forward pass (1 = no batching)
+    'max_wait_ms': 10,            # How long a worker holds a batch open for more sessions' frames
+}
+
+INFERENCE_SECONDS = metrics.REGISTRY.histogram(
+    'crowdcount_inference_seconds', 'Queue wait plus inference time per frame.', ('class',))
+INFERENCE_SLO_MISSES = metrics.REGISTRY.counter(
+    'crowdcount_inference_slo_misses_total', 'Frames whose inference latency exceeded the class SLO.', ('class',))
+INFERENCE_REJECTED = metrics.REGISTRY.counter(
+    'crowdcount_inference_rejected_total', 'Frames refused by admission control.', ('class',))
+INFERENCE_BATCH_SIZE = metrics.REGISTRY.histogram(
+    'crowdcount_inference_batch_size', 'Frames per batched forward pass.', ('class',),
+    buckets=(1, 2, 3, 4, 6, 8, 12, 16))
+
+
+def load_inference_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `inference` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_INFERENCE_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('inference') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load inference config: {e}. Using defaults.")
+    config['slo_ms'] = dict(DEFAULT_INFERENCE_CONFIG['slo_ms'], **(config.get('slo_ms') or {}))
+    return config
+
+
+class _Job:
+    __slots__ = ('klass', 'stream_id', 'fn', 'model', 'frame', 'batch_key', 'enqueued', 'done', 'result', 'error')
+
+    def __init__(self, klass: str, stream_id: str, fn: Optional[Callable[[], object]] = None,
+                 model=None, frame=None):
+        self.klass = klass
+        self.stream_id = stream_id
+        self.fn = fn
+        # Detection jobs (fn is None) on the same weights can share one forward pass
+        self.model = model
+        self.frame = frame
+        self.batch_key = (klass, id(getattr(model, 'model', model))) if fn is None else None
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error: Optional[BaseException] = None
+
+
+class InferencePool:
+    """Runs every session's model inference on a few shared threads, live cameras first.
+
+    Jobs wait in one priority queue: a queued live frame always runs before any
+    queued offline (upload) frame, and offline jobs never occupy the
+    ``reserved_live_workers``, so live work waits for at most its own class.
+    Offline sessions soak up whatever capacity is left.
+
+    Admission control keeps live alerts real-time: ``admit(LIVE)`` refuses a
+    frame whose predicted latency would exceed the live SLO, and the pipeline
+    skips it rather than fall behind the camera. Offline frames are never
+    refused; they just wait.
+
+    Detection jobs (``detect``) are micro-batched: a worker that picks one up
+    holds it for up to ``max_wait_ms`` while other sessions of the same class
+    submit frames, then runs them all through the shared weights in a single
+    ``predict`` call and hands each session its own result. It only waits while
+    another recently active session could still contribute, so a lone stream
+    pays no batching delay.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_INFERENCE_CONFIG)
+        self.workers = max(1, int(self.config['workers']))
+        self.offline_limit = max(1, self.workers - int(self.config['reserved_live_workers']))
+        self.slo = {klass: float(ms) / 1000.0 for klass, ms in self.config['slo_ms'].items()}
+        self.max_batch = max(1, int(self.config['max_batch']))
+        self.max_wait = float(self.config['max_wait_ms']) / 1000.0
+        self._queue: List = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._busy = {klass: 0 for klass in CLASSES}
+        self._queued = {klass: 0 for klass in CLASSES}
+        self._service = {klass: 0.0 for klass in CLASSES}  # Smoothed inference time
+        self._latencies = {klass: deque(maxlen=512) for klass in CLASSES}
+        self._batch_sizes = {klass: deque(maxlen=512) for klass in CLASSES}
+        self._submitters: Dict[tuple, Dict[str, float]] = {}  # batch_key -> stream -> last submit
+        self._threads: List[threading.Thread] = []
+
+    def _start(self) -> None:
+        """Start the workers on first use (never before serve.py forks)."""
+        with self._cond:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"inference-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"Inference pool started with {self.workers} workers")
+
+    # --- Submitting work ---
+
+    def admit(self, klass: str) -> bool:
+        """Whether a new ``klass`` frame can be expected to finish within its SLO."""
+        if klass != LIVE:
+            return True
+        with self._cond:
+            service = self._service[LIVE]
+            if not service:
+                return True
+            ahead = self._queued[LIVE]
+            free = self.workers - self._busy[LIVE] - self._busy[OFFLINE]
+            predicted = service * (1 + ahead / self.workers) + (0 if free > ahead else service)
+        if predicted <= self.slo[LIVE]:
+            return True
+        INFERENCE_REJECTED.labels(klass).inc()
+        return False
+
+    @property
+    def batching(self) -> bool:
+        return self.max_batch > 1
+
+    def run(self, klass: str, stream_id: str, fn: Callable[[], object]):
+        """Run ``fn`` on a pool worker at ``klass`` priority and return its result (or raise its error)."""
+        return self._submit(_Job(klass, stream_id, fn))
+
+    def detect(self, klass: str, stream_id: str, model, frame):
+        """Person detections for ``frame`` (one ultralytics Results), possibly batched with other sessions."""
+        return self._submit(_Job(klass, stream_id, model=model, frame=frame))
+
+    def _submit(self, job: _Job):
+        if not self._threads:
+            self._start()
+        with self._cond:
+            heapq.heappush(self._queue, (CLASSES.index(job.klass), next(self._counter), job))
+            self._queued[job.klass] += 1
+            if job.batch_key is not None:
+                self._submitters.setdefault(job.batch_key, {})[job.stream_id] = job.enqueued
+            self._cond.notify_all()
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def bind(self, klass: str, stream_id: str) -> 'SessionRunner':
+        return SessionRunner(self, klass, stream_id)
+
+    # --- Workers ---
+
+    def _next_job(self) -> _Job:
+        """Pop the most urgent job this worker may run (caller holds the condition)."""
+        while True:
+            if self._queue:
+                klass = self._queue[0][2].klass
+                if klass == LIVE or self._busy[OFFLINE] < self.offline_limit:
+                    job = heapq.heappop(self._queue)[2]
+                    self._queued[job.klass] -= 1
+                    self._busy[job.klass] += 1
+                    return job
+            self._cond.wait()
+
+    def _gather(self, lead: _Job) -> List[_Job]:
+        """Collect more detection jobs to run with ``lead`` (caller holds the condition)."""
+        batch = [lead]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            matches = [entry for entry in self._queue if entry[2].batch_key == lead.batch_key]
+            for entry in matches[:self.max_batch - len(batch)]:
+                self._queue.remove(entry)
+                self._queued[lead.klass] -= 1
+                batch.append(entry[2])
+            if matches:
+                heapq.heapify(self._queue)
+            # Only hold the batch open while another recently active session may still submit
+            now = time.perf_counter()
+            members = {job.stream_id for job in batch}
+            submitters = self._submitters.get(lead.batch_key, {})
+            for stream_id in [s for s, t in submitters.items() if now - t > 1.0]:
+                del submitters[stream_id]
+            if len(batch) >= self.max_batch or now >= deadline or not set(submitters) - members:
+                break
+            self._cond.wait(deadline - now)
+        return batch
+
+    def _execute(self, batch: List[_Job]) -> None:
+        lead = batch[0]
+        try:
+            if lead.fn is not None:
+                lead.result = lead.fn()
+            else:
+                results = lead.model.predict([job.frame for job in batch], verbose=False, classes=[0])
+                for job, result in zip(batch, results):
+                    job.result = result
+        except BaseException as e:
+            for job in batch:
+                job.error = e
+
+    def _worker(self) -> None:
+        applied = (None, -1)
+        while True:
+            with self._cond:
+                lead = self._next_job()
+                batch = self._gather(lead) if lead.batch_key is not None and self.batching else [lead]
+            # Inference now runs here, so this thread adopts the submitting stream's core budget
+            if applied != (lead.stream_id, scheduler.generation):
+                applied = (lead.stream_id, scheduler.apply(lead.stream_id, -1))
+            started = time.perf_counter()
+            self._execute(batch)
+            finished = time.perf_counter()
+            klass = lead.klass
+            latencies = [finished - job.enqueued for job in batch]
+            with self._cond:
+                self._busy[klass] -= 1
+                previous = self._service[klass]
+                self._service[klass] = (finished - started) if not previous else \
+                    0.8 * previous + 0.2 * (finished - started)
+                self._latencies[klass].extend(latencies)
+                self._batch_sizes[klass].append(len(batch))
+                self._cond.notify_all()
+            INFERENCE_BATCH_SIZE.labels(klass).observe(len(batch))
+            for job, latency in zip(batch, latencies):
+                INFERENCE_SECONDS.labels(klass).observe(latency)
+                if latency > self.slo[klass]:
+                    INFERENCE_SLO_MISSES.labels(klass).inc()
+                job.done.set()
+
+    # --- Reporting ---
+
+    def report(self) -> Dict:
+        with self._cond:
+            classes = {}
+            for klass in CLASSES:
+                samples = sorted(self._latencies[klass])
+                pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))] * 1000, 1) if samples else None
+                classes[klass] = {
+                    'slo_ms': round(self.slo[klass] * 1000),
+                    'queued': self._queued[klass],
+                    'running': self._busy[klass],
+                    'p50_ms': pick(0.5),
+                    'p95_ms': pick(0.95),
+                    'inference_ms': round(self._service[klass] * 1000, 1),
+                    'mean_batch': round(sum(self._batch_sizes[klass]) / len(self._batch_sizes[klass]), 2)
+                    if self._batch_sizes[klass] else None,
+                }
+            return {'workers': self.workers, 'offline_limit': self.offline_limit,
+                    'max_batch': self.max_batch, 'max_wait_ms': round(self.max_wait * 1000, 1), 'classes': classes}
+
+
+class SessionRunner:
+    """One session's handle on the pool, at that session's priority class."""
+
+    def __init__(self, pool: InferencePool, klass: str, stream_id: str):
+        self.pool = pool
+        self.klass = klass
+        self.stream_id = stream_id
+
+    @property
+    def batching(self) -> bool:
+        return self.pool.batching
+
+    def run(self, fn: Callable[[], object]):
+        return self.pool.run(self.klass, self.stream_id, fn)
+
+    def detect(self, model, frame):
+        return self.pool.detect(self.klass, self.stream_id, model, frame)
+
+
+inference_pool = InferencePool(load_inference_config())
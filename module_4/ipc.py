@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Any, Iterable, Optional
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+class RemoteError(Exception):
+    """An exception raised by the target object on the other side of an RPC call.
+
+    ``status`` carries the original exception's ``status`` attribute (an HTTP
+    status code) when it had one, so callers can answer the same way locally.
+    """
+
+    def __init__(self, message: str, status: int = 500):
+        super().__init__(message)
+        self.status = status
+
+
+class RpcServer:
+    """Exposes selected methods of one object over a local `multiprocessing.connection` socket.
+
+    Each client connection is served by its own thread, so a slow call (such as
+    waiting for the next frame) never blocks other clients.
+    """
+
+    def __init__(self, target: Any, address: str, authkey: bytes, methods: Iterable[str]):
+        self.target = target
+        self.address = address
+        self.authkey = authkey
+        self.methods = frozenset(methods)
+        self.listener: Optional[Listener] = None
+
+    def start(self) -> None:
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        threading.Thread(target=self._accept_loop, name='rpc-accept', daemon=True).start()
+        logger.info(f"State RPC listening on {self.address}")
+
+    def close(self) -> None:
+        """Stop accepting connections and remove the socket file."""
+        if self.listener is not None:
+            self.listener.close()
+            self.listener = None
+
+    def _accept_loop(self) -> None:
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                break
+            except Exception as e:
+                logger.warning(f"Rejected RPC connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), name='rpc-conn', daemon=True).start()
+
+    def _serve(self, conn: Connection) -> None:
+        try:
+            while True:
+                try:
+                    name, args, kwargs = conn.recv()
+                except (EOFError, OSError):
+                    break
+                if name not in self.methods:
+                    conn.send(('error', (f"Method not allowed: {name}", 500)))
+                    continue
+                try:
+                    conn.send(('ok', getattr(self.target, name)(*args, **kwargs)))
+                except Exception as e:
+                    conn.send(('error', (str(e), getattr(e, 'status', 500))))
+        finally:
+            conn.close()
+
+
+class RpcClient:
+    """Proxy whose allowed methods forward to an RpcServer. One connection per thread."""
+
+    def __init__(self, address: str, authkey: bytes, methods: Iterable[str], connect_timeout: float = 10.0):
+        self._address = address
+        self._authkey = authkey
+        self._methods = frozenset(methods)
+        self._connect_timeout = connect_timeout
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            deadline = time.monotonic() + self._connect_timeout
+            while True:
+                try:
+                    conn = Client(self._address, family='AF_UNIX', authkey=self._authkey)
+                    break
+                except (FileNotFoundError, ConnectionRefusedError):
+                    # The owner binds after forking workers; wait for it
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.1)
+            self._local.conn = conn
+        return conn
+
+    def call(self, name: str, *args, **kwargs) -> Any:
+        for attempt in (1, 2):
+            conn = self._connection()
+            try:
+                conn.send((name, args, kwargs))
+                break
+            except OSError:
+                # Stale connection (e.g. owner restarted) and nothing was sent: reconnect once
+                self._drop(conn)
+                if attempt == 2:
+                    raise
+        try:
+            status, result = conn.recv()
+        except (EOFError, OSError):
+            # The call may already have run on the other side; retrying could run it twice
+            self._drop(conn)
+            raise
+        if status == 'error':
+            raise RemoteError(*result)
+        return result
+
+    def _drop(self, conn: Connection) -> None:
+        self._local.conn = None
+        try:
+            conn.close()
+        except OSError:
+            pass
+
+    def __getattr__(self, name: str):
+        if name.startswith('_') or name not in self._methods:
+            raise AttributeError(name)
+        return lambda *args, **kwargs: self.call(name, *args, **kwargs)
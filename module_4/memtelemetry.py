@@ -0,0 +1,182 @@
+import collections
+import datetime
+import gc
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from typing import Callable, Deque, Dict, List, Optional
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_TELEMETRY_CONFIG = {
+    'enabled': True,
+    'interval_s': 60,
+    'history': 1440,              # One day of samples at the default interval
+    'tracemalloc': False,         # Costs CPU and memory on every allocation; enable while hunting a leak
+    'tracemalloc_frames': 1,
+    'tracemalloc_top': 10,
+    'rss_growth_mb': 256,         # Alarm if RSS grows this much ...
+    'rss_growth_window_s': 3600,  # ... within this window
+    'alarm_cooldown_s': 3600,
+    'limits': {},                 # probe name -> max value before alarming
+}
+
+
+def load_telemetry_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `memory_telemetry` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_TELEMETRY_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('memory_telemetry') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load memory telemetry config: {e}. Using defaults.")
+    return config
+
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process (Linux /proc, falling back to peak RSS)."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryTelemetry:
+    """Periodically records RSS, object counts from registered probes and tracemalloc diffs.
+
+    Growth alarms are passed to ``on_alarm(event_type, message)`` so the app
+    can persist them; each alarm key is rate-limited by ``alarm_cooldown_s``.
+    """
+
+    def __init__(self, config: Optional[Dict] = None,
+                 on_alarm: Optional[Callable[[str, str], None]] = None):
+        self.config = config or dict(DEFAULT_TELEMETRY_CONFIG)
+        self.on_alarm = on_alarm
+        self.history: Deque[Dict] = collections.deque(maxlen=int(self.config['history']))
+        self._probes: Dict[str, Callable[[], int]] = {}
+        self._last_alarm: Dict[str, float] = {}
+        self._last_snapshot: Optional[tracemalloc.Snapshot] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register_probe(self, name: str, fn: Callable[[], int]) -> None:
+        """Register a callable that returns the current size of some structure."""
+        self._probes[name] = fn
+
+    def start(self) -> None:
+        if not self.config.get('enabled', True) or self._thread is not None:
+            return
+        if self.config.get('tracemalloc') and not tracemalloc.is_tracing():
+            tracemalloc.start(int(self.config['tracemalloc_frames']))
+        self._thread = threading.Thread(target=self._run, name='memory-telemetry', daemon=True)
+        self._thread.start()
+        logger.info(f"Memory telemetry started (every {self.config['interval_s']}s)")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.wait(float(self.config['interval_s'])):
+            try:
+                self.sample()
+            except Exception as e:
+                logger.error(f"Memory telemetry sample failed: {e}")
+
+    # --- Sampling ---
+
+    def sample(self) -> Dict:
+        """Take one sample now, record it and evaluate alarms."""
+        probes = {}
+        for name, fn in list(self._probes.items()):
+            try:
+                probes[name] = int(fn())
+            except Exception as e:
+                logger.warning(f"Memory probe '{name}' failed: {e}")
+        record = {
+            'timestamp': datetime.datetime.utcnow().isoformat() + 'Z',
+            'time': time.time(),
+            'rss_mb': round(current_rss_bytes() / 2 ** 20, 2),
+            'probes': probes,
+        }
+        if tracemalloc.is_tracing():
+            record['tracemalloc_top'] = self._tracemalloc_diff()
+        with self._lock:
+            self.history.append(record)
+        self._check_alarms(record)
+        return record
+
+    def _tracemalloc_diff(self) -> List[Dict]:
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        ))
+        previous, self._last_snapshot = self._last_snapshot, snapshot
+        if previous is None:
+            stats = snapshot.statistics('lineno')[:int(self.config['tracemalloc_top'])]
+            return [{'location': str(s.traceback), 'size_kb': round(s.size / 1024, 1), 'count': s.count} for s in stats]
+        stats = snapshot.compare_to(previous, 'lineno')[:int(self.config['tracemalloc_top'])]
+        return [{
+            'location': str(s.traceback),
+            'size_kb': round(s.size / 1024, 1),
+            'size_diff_kb': round(s.size_diff / 1024, 1),
+            'count_diff': s.count_diff,
+        } for s in stats]
+
+    # --- Alarms ---
+
+    def _alarm(self, key: str, event_type: str, message: str) -> None:
+        now = time.time()
+        if now - self._last_alarm.get(key, 0) < float(self.config['alarm_cooldown_s']):
+            return
+        self._last_alarm[key] = now
+        logger.warning(message)
+        if self.on_alarm:
+            try:
+                self.on_alarm(event_type, message)
+            except Exception as e:
+                logger.error(f"Could not record memory alarm: {e}")
+
+    def _check_alarms(self, record: Dict) -> None:
+        window_start = record['time'] - float(self.config['rss_growth_window_s'])
+        with self._lock:
+            baseline = next((r for r in self.history if r['time'] >= window_start), None)
+        if baseline is not None:
+            growth = record['rss_mb'] - baseline['rss_mb']
+            if growth > float(self.config['rss_growth_mb']):
+                self._alarm('rss', 'Memory Growth',
+                            f"MEMORY ALERT: RSS grew {growth:.0f} MB to {record['rss_mb']:.0f} MB "
+                            f"in {(record['time'] - baseline['time']) / 60:.0f} min")
+
+        for name, limit in (self.config.get('limits') or {}).items():
+            value = record['probes'].get(name)
+            if value is not None and value > int(limit):
+                self._alarm(f"probe:{name}", 'Memory Growth',
+                            f"MEMORY ALERT: {name} holds {value} entries (limit {limit})")
+
+    def report(self, limit: int = 120) -> Dict:
+        with self._lock:
+            history = list(self.history)[-limit:]
+        return {
+            'config': {k: v for k, v in self.config.items() if k != 'enabled'},
+            'tracemalloc': tracemalloc.is_tracing(),
+            'latest': history[-1] if history else None,
+            'history': [{'timestamp': r['timestamp'], 'rss_mb': r['rss_mb'], 'probes': r['probes']} for r in history],
+        }
+
+
+def sqlalchemy_identity_map_size() -> int:
+    """Total objects held in the identity maps of all live SQLAlchemy sessions."""
+    from sqlalchemy.orm.session import _sessions
+    return sum(len(s.identity_map) for s in list(_sessions.values()))
+
+
+def gc_object_count() -> int:
+    return len(gc.get_objects())
@@ -0,0 +1,236 @@
+import abc
+import bisect
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Frame stages are a few ms each; alert writes and stalls can take much longer
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric(abc.ABC):
+    """Base class for a metric family with optional labels."""
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], '_Metric'] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str):
+        """Return (creating on first use) the child for a set of label values."""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    @abc.abstractmethod
+    def _new_child(self) -> '_Metric':
+        """An unlabelled metric of the same kind, holding one label set's value."""
+
+    @abc.abstractmethod
+    def _child_samples(self, key: Tuple[str, ...], names: Sequence[str] = ()) -> List[str]:
+        """Exposition lines for this metric's own value under the label values ``key``."""
+
+    def _samples(self) -> List[str]:
+        if not self.labelnames:
+            return self._child_samples(())
+        lines = []
+        for key, child in list(self._children.items()):
+            lines.extend(child._child_samples(key, self.labelnames))
+        return lines
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _new_child(self):
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _child_samples(self, key, names=()):
+        return [f"{self.name}{_format_labels(names, key)} {self.value}"]
+
+
+class Gauge(_Metric):
+    """Point-in-time value. A callback gauge is only evaluated when scraped."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self.callback = callback
+
+    def _new_child(self):
+        return Gauge(self.name, self.documentation)
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def set_function(self, callback: Callable[[], float]) -> None:
+        self.callback = callback
+
+    def _child_samples(self, key, names=()):
+        value = self.value
+        if self.callback is not None:
+            try:
+                value = self.callback()
+            except Exception as e:
+                logger.warning(f"Gauge {self.name} callback failed: {e}")
+                return []
+        return [f"{self.name}{_format_labels(names, key)} {value}"]
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram in the Prometheus exposition format."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self):
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self) -> 'StageTimer':
+        return StageTimer(self)
+
+    def _child_samples(self, key, names=()):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            le_label = f'le="{le}"'
+            lines.append(f"{self.name}_bucket{_format_labels(names, key, le_label)} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(names, key)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(names, key)} {cumulative}")
+        return lines
+
+
+class StageTimer:
+    """Context manager that observes elapsed wall time into a histogram."""
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self) -> 'StageTimer':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class MetricsRegistry:
+    """Holds metric families and renders them on demand."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              callback: Optional[Callable[[], float]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, callback))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = STAGE_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Render every metric in the Prometheus text exposition format (v0.0.4)."""
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# --- Pipeline metrics shared by detector.py and app.py ---
+STAGE_SECONDS = REGISTRY.histogram(
+    'crowdcount_stage_seconds', 'Time spent in each frame pipeline stage.', ('stage',))
+FRAMES_PROCESSED = REGISTRY.counter(
+    'crowdcount_frames_processed_total', 'Frames processed by the pipeline.', ('source',))
+FRAMES_DROPPED = REGISTRY.counter(
+    'crowdcount_frames_dropped_total', 'Frames that could not be decoded or processed.', ('source', 'reason'))
+PIPELINE_FPS = REGISTRY.gauge(
+    'crowdcount_pipeline_fps', 'Smoothed frames per second delivered by the pipeline.', ('source',))
+ALERTS_LOGGED = REGISTRY.counter(
+    'crowdcount_alerts_logged_total', 'Alerts written to the database.', ('type',))
+MOTION_GATE = REGISTRY.counter(
+    'crowdcount_motion_gate_total', 'Per-frame motion gate decisions (skip = last detections reused).', ('decision',))
+
+
+def stage_timer(stage: str) -> StageTimer:
+    """Time a block of code as one pipeline stage: ``with stage_timer('decode'): ...``."""
+    return StageTimer(STAGE_SECONDS.labels(stage))
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+class FpsMeter:
+    """Exponentially smoothed FPS, published to the `crowdcount_pipeline_fps` gauge."""
+
+    def __init__(self, source: str, smoothing: float = 0.9):
+        self.gauge = PIPELINE_FPS.labels(source)
+        self.counter = FRAMES_PROCESSED.labels(source)
+        self.smoothing = smoothing
+        self.fps = 0.0
+        self._last: Optional[float] = None
+
+    def tick(self) -> None:
+        now = time.perf_counter()
+        if self._last is not None and now > self._last:
+            self.fps = self.smoothing * self.fps + (1 - self.smoothing) / (now - self._last)
+            self.gauge.set(round(self.fps, 2))
+        self._last = now
+        self.counter.inc()
@@ -0,0 +1,123 @@
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+MAX_SECONDS = 60.0
+MAX_HZ = 1000
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+class SamplingProfiler:
+    """Wall-clock stack sampler for the running process.
+
+    Nothing is installed while idle: sampling reads ``sys._current_frames()``
+    from the calling thread only for the requested window, so the detector pays
+    no cost unless a profile is being taken.
+    """
+
+    def __init__(self):
+        self._pipeline_threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._busy = threading.Lock()
+
+    # --- Thread registry ---
+
+    def register_thread(self, label: str) -> None:
+        """Mark the current thread as a pipeline thread so profiles can target it."""
+        with self._lock:
+            self._pipeline_threads[threading.get_ident()] = label
+
+    def unregister_thread(self) -> None:
+        with self._lock:
+            self._pipeline_threads.pop(threading.get_ident(), None)
+
+    def pipeline_threads(self) -> Dict[int, str]:
+        with self._lock:
+            return dict(self._pipeline_threads)
+
+    # --- Sampling ---
+
+    @staticmethod
+    def _frame_label(code) -> str:
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def sample(self, seconds: float, hz: int, pipeline_only: bool = True) -> Dict:
+        """Sample stacks for ``seconds`` at ``hz`` and return collapsed stacks plus self-time totals."""
+        seconds = max(0.1, min(float(seconds), MAX_SECONDS))
+        hz = max(1, min(int(hz), MAX_HZ))
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+
+        stacks: Dict[str, int] = collections.Counter()
+        self_counts: Dict[str, int] = collections.Counter()
+        total_counts: Dict[str, int] = collections.Counter()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        own = threading.get_ident()
+        interval = 1.0 / hz
+        samples = 0
+        started = time.perf_counter()
+        try:
+            deadline = started + seconds
+            next_tick = started
+            while True:
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                targets: Optional[Set[int]] = set(self.pipeline_threads()) if pipeline_only else None
+                for ident, frame in sys._current_frames().items():
+                    if ident == own or (targets is not None and ident not in targets):
+                        continue
+                    stack: List[str] = []
+                    while frame is not None:
+                        stack.append(self._frame_label(frame.f_code))
+                        frame = frame.f_back
+                    if not stack:
+                        continue
+                    stack.reverse()
+                    thread_label = self._pipeline_threads.get(ident) or names.get(ident, str(ident))
+                    stacks[';'.join([thread_label] + stack)] += 1
+                    self_counts[stack[-1]] += 1
+                    for label in set(stack):
+                        total_counts[label] += 1
+                samples += 1
+                next_tick += interval
+                delay = next_tick - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_tick = time.perf_counter()  # Fell behind; don't burst to catch up
+        finally:
+            self._busy.release()
+
+        elapsed = time.perf_counter() - started
+        stack_samples = sum(stacks.values()) or 1
+        top = [{
+            'function': label,
+            'self_samples': count,
+            'self_percent': round(100.0 * count / stack_samples, 2),
+            'total_percent': round(100.0 * total_counts[label] / stack_samples, 2),
+        } for label, count in self_counts.most_common(25)]
+        logger.info(f"Profiled {len(stacks)} unique stacks over {elapsed:.1f}s ({samples} ticks at {hz} Hz)")
+        return {
+            'duration_s': round(elapsed, 3),
+            'hz': hz,
+            'ticks': samples,
+            'stack_samples': sum(stacks.values()),
+            'top_self': top,
+            # Brendan Gregg's collapsed format: feed straight into flamegraph.pl or speedscope
+            'collapsed': '\n'.join(f"{stack} {count}" for stack, count in sorted(stacks.items())),
+        }
+
+
+profiler = SamplingProfiler()
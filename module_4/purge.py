@@ -0,0 +1,109 @@
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_PURGE_CONFIG = {
+    'background_threshold': 10000,  # Users with more alerts than this are deleted by a background purge
+    'batch_size': 5000,             # Rows per DELETE; each batch is its own short transaction
+    'pause_ms': 20,                 # Breather between batches so foreground queries get the locks
+}
+
+
+def load_purge_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `purge` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_PURGE_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('purge') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load purge config: {e}. Using defaults.")
+    return config
+
+
+class PurgeJob(threading.Thread):
+    """Deletes one owner's rows in bounded batches, then runs ``finish`` (e.g. delete the owner itself).
+
+    ``delete_batch(limit)`` must delete and commit at most ``limit`` rows and
+    return how many it deleted; the job stops at the first short batch. Memory
+    and transaction size stay constant however many rows there are.
+    """
+
+    def __init__(self, key: str, label: str, total: int, config: Dict,
+                 delete_batch: Callable[[int], int], finish: Callable[[], None]):
+        super().__init__(name=f"purge-{key}", daemon=True)
+        self.key = key
+        self.label = label
+        self.total = total
+        self.batch_size = int(config['batch_size'])
+        self.pause = float(config['pause_ms']) / 1000.0
+        self.delete_batch = delete_batch
+        self.finish = finish
+        self.deleted = 0
+        self.state = 'running'
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.finished: Optional[float] = None
+
+    def run(self) -> None:
+        try:
+            while True:
+                count = self.delete_batch(self.batch_size)
+                self.deleted += count
+                if count < self.batch_size:
+                    break
+                time.sleep(self.pause)
+            self.finish()
+            self.state = 'done'
+            logger.info(f"Purge {self.key} finished: {self.deleted} rows in {time.time() - self.started:.1f}s")
+        except Exception as e:
+            self.state = 'failed'
+            self.error = str(e)
+            logger.error(f"Purge {self.key} failed after {self.deleted} rows: {e}")
+        finally:
+            self.finished = time.time()
+
+    def progress(self) -> Dict:
+        elapsed = (self.finished or time.time()) - self.started
+        return {
+            'key': self.key,
+            'label': self.label,
+            'state': self.state,
+            'error': self.error,
+            'deleted': self.deleted,
+            'total': self.total,
+            'percent': round(100.0 * min(self.deleted, self.total) / self.total, 1) if self.total else None,
+            'rows_per_second': round(self.deleted / elapsed, 1) if elapsed > 0 else None,
+            'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class PurgeManager:
+    """The background purges started by this process, at most one per key."""
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_PURGE_CONFIG)
+        self._jobs: Dict[str, PurgeJob] = {}
+        self._lock = threading.Lock()
+
+    def start(self, key: str, label: str, total: int,
+              delete_batch: Callable[[int], int], finish: Callable[[], None]) -> PurgeJob:
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.is_alive():
+                return job
+            job = PurgeJob(key, label, total, self.config, delete_batch, finish)
+            self._jobs[key] = job
+        job.start()
+        logger.info(f"Purge {key} started ({total} rows)")
+        return job
+
+    def jobs(self) -> List[Dict]:
+        with self._lock:
+            return [job.progress() for job in self._jobs.values()]
@@ -0,0 +1,291 @@
+import csv
+import datetime
+import gzip
+import logging
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import yaml
+from sqlalchemy import text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_CONFIG = {
+    'archive_dir': os.path.join('archives', 'alerts'),  # Where expired months are written as .csv.gz
+    'premake_months': 2,      # Monthly partitions created ahead of time (PostgreSQL)
+    'check_interval_h': 24,   # How often partitions are created and the retention policy applied
+    'batch_size': 5000,       # Rows per DELETE on backends without partitions (SQLite)
+}
+
+TABLE = 'alert_history'
+COLUMNS = ('id', 'user_id', 'timestamp', 'alert_type', 'message')
+_UPPER_BOUND = re.compile(r"TO \('([^']+)'\)")
+
+
+def load_retention_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `retention` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_RETENTION_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('retention') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load retention config: {e}. Using defaults.")
+    return config
+
+
+def month_start(moment: datetime.datetime, offset: int = 0) -> datetime.datetime:
+    """First instant of the month ``offset`` months from the one containing ``moment``."""
+    index = moment.year * 12 + moment.month - 1 + offset
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(start: datetime.datetime) -> str:
+    return f"{TABLE}_y{start.year}m{start.month:02d}"
+
+
+class AlertRetention:
+    """Monthly partitions for AlertHistory and a retention policy that expires whole months.
+
+    On PostgreSQL the table is range-partitioned by month on ``timestamp`` (the
+    primary key becomes ``(id, timestamp)``); expiring a month archives the
+    partition with COPY into a gzip CSV, then detaches and drops it, so no
+    row-wise DELETE or vacuum debt is involved however large it is. Rows that
+    predate partitioning live in one ``legacy`` partition, expired once all of
+    it is older than the cutoff.
+
+    Other backends (the SQLite stand-in) have no partitions: the same month
+    windows are archived and then deleted in bounded batches.
+
+    ``adjust_counts(user_id, delta)`` keeps the per-user alert totals in step
+    and is called inside the transaction that removes the rows.
+    """
+
+    def __init__(self, db, adjust_counts: Callable[[int, int], None], config: Optional[Dict] = None):
+        self.db = db
+        self.adjust_counts = adjust_counts
+        self.config = config or dict(DEFAULT_RETENTION_CONFIG)
+        self.last_run: Optional[Dict] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def partitioned_backend(self) -> bool:
+        return self.db.engine.dialect.name == 'postgresql'
+
+    # --- Partition layout (PostgreSQL) ---
+
+    def is_partitioned(self) -> bool:
+        if not self.partitioned_backend:
+            return False
+        kind = self.db.session.execute(text(
+            "SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {'name': TABLE}).scalar()
+        return kind == 'p'
+
+    def ensure_partitioned(self) -> None:
+        """Convert a plain alert_history into a partitioned one; existing rows become the legacy partition."""
+        if not self.partitioned_backend or self.is_partitioned():
+            return
+        session = self.db.session
+        newest = session.execute(text(f"SELECT max(timestamp) FROM {TABLE}")).scalar()
+        boundary = month_start(max(newest or datetime.datetime.utcnow(), datetime.datetime.utcnow()), 1)
+        statements = [
+            f"ALTER TABLE {TABLE} RENAME TO {TABLE}_legacy",
+            f"ALTER TABLE {TABLE}_legacy RENAME CONSTRAINT {TABLE}_pkey TO {TABLE}_legacy_pkey",
+            f"ALTER INDEX IF EXISTS ix_{TABLE}_user_id RENAME TO ix_{TABLE}_legacy_user_id",
+            f"ALTER INDEX IF EXISTS ix_{TABLE}_timestamp RENAME TO ix_{TABLE}_legacy_timestamp",
+            f"""CREATE TABLE {TABLE} (
+                id INTEGER NOT NULL DEFAULT nextval('{TABLE}_id_seq'),
+                user_id INTEGER NOT NULL REFERENCES "user" (id) ON DELETE CASCADE,
+                timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                alert_type VARCHAR(50) NOT NULL,
+                message VARCHAR(255) NOT NULL,
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)""",
+            f"ALTER SEQUENCE {TABLE}_id_seq OWNED BY {TABLE}.id",
+            # With the CHECK in place ATTACH doesn't have to scan the legacy rows again
+            f"ALTER TABLE {TABLE}_legacy ADD CONSTRAINT {TABLE}_legacy_bound CHECK (timestamp < '{boundary:%Y-%m-%d}')",
+            f"ALTER TABLE {TABLE} ATTACH PARTITION {TABLE}_legacy FOR VALUES FROM (MINVALUE) TO ('{boundary:%Y-%m-%d}')",
+            f"CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT",
+        ]
+        try:
+            for statement in statements:
+                session.execute(text(statement))
+            session.commit()
+            logger.info(f"{TABLE} is now partitioned by month; rows before {boundary:%Y-%m} kept in {TABLE}_legacy")
+        except Exception:
+            session.rollback()
+            raise
+
+    def ensure_partitions(self) -> List[str]:
+        """Create this month's and the next ``premake_months`` partitions if missing."""
+        if not self.is_partitioned():
+            return []
+        session = self.db.session
+        covered = [bound for _, bound in self.partitions() if bound is not None]
+        latest_bound = max(covered) if covered else None
+        created = []
+        now = datetime.datetime.utcnow()
+        for offset in range(int(self.config['premake_months']) + 1):
+            start, end = month_start(now, offset), month_start(now, offset + 1)
+            if latest_bound is not None and end <= latest_bound:
+                continue  # Already covered (e.g. by the legacy partition)
+            name = partition_name(start)
+            session.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {TABLE} "
+                f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"))
+            created.append(name)
+        session.commit()
+        return created
+
+    def partitions(self) -> List[Tuple[str, Optional[datetime.datetime]]]:
+        """``(name, upper bound)`` of every partition; the default partition has no bound."""
+        rows = self.db.session.execute(text(
+            "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:name) ORDER BY c.relname"),
+            {'name': TABLE}).all()
+        result = []
+        for name, bound in rows:
+            match = _UPPER_BOUND.search(bound or '')
+            result.append((name, datetime.datetime.fromisoformat(match.group(1)) if match else None))
+        return result
+
+    # --- Retention ---
+
+    def _archive_path(self, label: str) -> str:
+        os.makedirs(self.config['archive_dir'], exist_ok=True)
+        return os.path.join(self.config['archive_dir'], f"{TABLE}_{label}.csv.gz")
+
+    def _expire_partition(self, name: str, archive: bool) -> Dict:
+        """Archive (optionally), detach and drop one partition in a single transaction."""
+        session = self.db.session
+        path = None
+        try:
+            if archive:
+                path = self._archive_path(name[len(TABLE) + 1:])
+                cursor = session.connection().connection.cursor()
+                with gzip.open(path, 'wb') as out:
+                    cursor.copy_expert(f"COPY {name} ({', '.join(COLUMNS)}) TO STDOUT WITH (FORMAT csv, HEADER true)", out)
+                    out.flush()
+                    os.fsync(out.fileno())
+            counts = session.execute(text(f"SELECT user_id, count(*) FROM {name} GROUP BY user_id")).all()
+            for user_id, count in counts:
+                self.adjust_counts(user_id, -count)
+            session.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+            session.execute(text(f"DROP TABLE {name}"))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        return {'partition': name, 'rows': sum(c for _, c in counts), 'archive': path}
+
+    def _expire_month_rows(self, start: datetime.datetime, end: datetime.datetime, archive: bool) -> Dict:
+        """Unpartitioned fallback: archive one month's rows, then delete them in batches."""
+        session = self.db.session
+        window = {'start': str(start), 'end': str(end)}
+        where = "timestamp >= :start AND timestamp < :end"
+        path = None
+        if archive:
+            path = self._archive_path(f"{start:%Y-%m}")
+            result = session.execute(text(f"SELECT {', '.join(COLUMNS)} FROM {TABLE} WHERE {where} ORDER BY id"),
+                                     window).yield_per(self.config['batch_size'])
+            with gzip.open(path, 'wt', newline='') as out:
+                writer = csv.writer(out)
+                writer.writerow(COLUMNS)
+                for row in result:
+                    writer.writerow(row)
+            session.commit()
+        deleted = 0
+        limit = int(self.config['batch_size'])
+        while True:
+            rows = session.execute(text(f"SELECT id, user_id FROM {TABLE} WHERE {where} LIMIT {limit}"), window).all()
+            if not rows:
+                break
+            per_user: Dict[int, int] = {}
+            for _, user_id in rows:
+                per_user[user_id] = per_user.get(user_id, 0) + 1
+            ids = [row_id for row_id, _ in rows]
+            session.execute(text(f"DELETE FROM {TABLE} WHERE id IN ({', '.join(str(i) for i in ids)})"))
+            for user_id, count in per_user.items():
+                self.adjust_counts(user_id, -count)
+            session.commit()
+            deleted += len(ids)
+        return {'partition': None, 'month': f"{start:%Y-%m}", 'rows': deleted, 'archive': path}
+
+    def apply(self, months: int, archive: bool) -> Dict:
+        """Expire every whole month older than ``months`` months (0 keeps everything)."""
+        with self._lock:
+            started = time.time()
+            expired: List[Dict] = []
+            cutoff = month_start(datetime.datetime.utcnow(), -months) if months > 0 else None
+            if cutoff is not None:
+                if self.is_partitioned():
+                    for name, bound in self.partitions():
+                        if bound is not None and bound <= cutoff:
+                            expired.append(self._expire_partition(name, archive))
+                else:
+                    oldest = self.db.session.execute(text(f"SELECT min(timestamp) FROM {TABLE}")).scalar()
+                    if isinstance(oldest, str):
+                        oldest = datetime.datetime.fromisoformat(oldest)
+                    start = month_start(oldest) if oldest else cutoff
+                    while start < cutoff:
+                        expired.append(self._expire_month_rows(start, month_start(start, 1), archive))
+                        start = month_start(start, 1)
+            self.last_run = {
+                'at': started,
+                'seconds': round(time.time() - started, 2),
+                'cutoff': cutoff.strftime('%Y-%m-%d') if cutoff else None,
+                'archive': archive,
+                'expired': [e for e in expired if e['rows'] or e['partition']],
+            }
+            if self.last_run['expired']:
+                logger.info(f"Retention expired {sum(e['rows'] for e in expired)} alerts older than {cutoff:%Y-%m}")
+            return self.last_run
+
+    def status(self) -> Dict:
+        partitioned = self.is_partitioned()
+        info = {'partitioned': partitioned, 'last_run': self.last_run, 'partitions': []}
+        if partitioned:
+            sizes = dict(self.db.session.execute(text(
+                "SELECT c.relname, c.reltuples::bigint FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = to_regclass(:name)"), {'name': TABLE}).all())
+            info['partitions'] = [{
+                'name': name,
+                'until': bound.strftime('%Y-%m-%d') if bound else None,
+                'estimated_rows': max(0, sizes.get(name, 0)),
+            } for name, bound in self.partitions()]
+        return info
+
+    # --- Scheduling ---
+
+    def run_in_background(self, app, months: int, archive: bool) -> None:
+        """Apply a policy now without holding up the request that asked for it."""
+        def run():
+            try:
+                with app.app_context():
+                    self.apply(months, archive)
+            except Exception as e:
+                logger.error(f"Alert retention run failed: {e}")
+        threading.Thread(target=run, name='alert-retention-now', daemon=True).start()
+
+    def start(self, app, policy: Callable[[], Tuple[int, bool]]) -> None:
+        """Periodically create upcoming partitions and apply ``policy() -> (months, archive)``."""
+        if self._thread is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    with app.app_context():
+                        self.ensure_partitions()
+                        months, archive = policy()
+                        self.apply(months, archive)
+                except Exception as e:
+                    logger.error(f"Alert retention run failed: {e}")
+                time.sleep(float(self.config['check_interval_h']) * 3600)
+
+        self._thread = threading.Thread(target=loop, name='alert-retention', daemon=True)
+        self._thread.start()
@@ -0,0 +1,151 @@
+import logging
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+import cv2
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCHEDULER_CONFIG = {
+    'enabled': True,
+    'reserved_cores': 1,        # Left free for HTTP workers, decoding threads and the OS
+    'pin_threads': False,       # Also pin each pipeline thread to its own cores (Linux only)
+    'default_target_fps': 15,   # Used to weigh streams that don't set target_fps
+    'camera_priority': 2,
+    'file_priority': 1,
+}
+
+
+def load_scheduler_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `scheduler` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_SCHEDULER_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('scheduler') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load scheduler config: {e}. Using defaults.")
+    return config
+
+
+def available_cpus() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CoreScheduler:
+    """Splits the host's cores between running pipelines by priority x target FPS.
+
+    Without this every pipeline's torch/OpenCV pools size themselves to all
+    cores, so N streams run N x cores threads and thrash. Each pipeline thread
+    calls ``apply()`` once per frame (an integer compare unless the plan changed)
+    and adopts its budget: torch intra-op threads, OpenCV threads and,
+    optionally, CPU affinity. The plan is recomputed whenever a stream starts
+    or stops.
+
+    ``torch.set_num_threads`` is per calling thread only with the OpenMP backend,
+    and ``cv2.setNumThreads`` is always process-wide, so OpenCV gets one thread
+    per pipeline whenever more than one is running.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_SCHEDULER_CONFIG)
+        self.cpus = available_cpus()
+        self.generation = 0
+        self._streams: Dict[str, Dict] = {}
+        self._plan: Dict[str, Dict] = {}
+        self._cv2_threads = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.config.get('enabled', True))
+
+    def default_priority(self, kind: str) -> int:
+        return int(self.config['camera_priority'] if kind == 'camera' else self.config['file_priority'])
+
+    # --- Registration ---
+
+    def register(self, stream_id: str, priority: int, target_fps: float) -> None:
+        with self._lock:
+            self._streams[stream_id] = {'priority': max(1, int(priority)), 'target_fps': float(target_fps or 0)}
+            self._rebalance()
+
+    def unregister(self, stream_id: str) -> None:
+        with self._lock:
+            if self._streams.pop(stream_id, None) is not None:
+                self._rebalance()
+
+    def _rebalance(self) -> None:
+        """Recompute every stream's budget (caller holds the lock)."""
+        reserved = int(self.config['reserved_cores'])
+        usable = self.cpus[:max(1, len(self.cpus) - reserved)]
+        default_fps = float(self.config['default_target_fps'])
+        weights = {sid: s['priority'] * (s['target_fps'] or default_fps) for sid, s in self._streams.items()}
+        order = sorted(weights, key=weights.get, reverse=True)
+        plan: Dict[str, Dict] = {}
+
+        if len(order) >= len(usable):
+            # More streams than cores: one thread each, cores shared round-robin
+            for i, sid in enumerate(order):
+                plan[sid] = {'threads': 1, 'cpus': [usable[i % len(usable)]]}
+        elif order:
+            # Proportional share with at least one core each (largest remainder rounding)
+            total = sum(weights.values())
+            spare = len(usable) - len(order)
+            exact = {sid: spare * weights[sid] / total for sid in order}
+            extra = {sid: int(exact[sid]) for sid in order}
+            leftover = spare - sum(extra.values())
+            for sid in sorted(order, key=lambda s: exact[s] - extra[s], reverse=True)[:leftover]:
+                extra[sid] += 1
+            start = 0
+            for sid in order:
+                count = 1 + extra[sid]
+                plan[sid] = {'threads': count, 'cpus': usable[start:start + count]}
+                start += count
+
+        self._plan = plan
+        self._cv2_threads = plan[order[0]]['threads'] if len(order) == 1 else 1
+        self.generation += 1
+        if plan:
+            logger.info("Core budgets: " + ", ".join(f"{sid}={b['threads']}" for sid, b in plan.items()))
+
+    # --- Applying budgets (called from pipeline threads) ---
+
+    def budget(self, stream_id: str) -> Optional[Dict]:
+        return self._plan.get(stream_id)
+
+    def apply(self, stream_id: str, applied_generation: int) -> int:
+        """Adopt this thread's budget if the plan changed since ``applied_generation``; returns the current one."""
+        generation = self.generation
+        if generation == applied_generation or not self.enabled:
+            return generation
+        budget = self._plan.get(stream_id)
+        if budget is None:
+            return generation
+        torch = sys.modules.get('torch')  # Loaded by ultralytics; never imported just for this
+        if torch is not None:
+            torch.set_num_threads(budget['threads'])
+        cv2.setNumThreads(self._cv2_threads)
+        if self.config.get('pin_threads') and hasattr(os, 'sched_setaffinity'):
+            try:
+                os.sched_setaffinity(0, budget['cpus'])  # pid 0 = the calling thread on Linux
+            except OSError as e:
+                logger.warning(f"Could not pin {stream_id} to cores {budget['cpus']}: {e}")
+        return generation
+
+    def report(self) -> Dict:
+        with self._lock:
+            return {
+                'cpus': self.cpus,
+                'reserved_cores': int(self.config['reserved_cores']),
+                'opencv_threads': self._cv2_threads,
+                'streams': {sid: dict(s, **self._plan.get(sid, {})) for sid, s in self._streams.items()},
+            }
+
+
+scheduler = CoreScheduler(load_scheduler_config())
@@ -0,0 +1,232 @@
+"""Preload-then-fork server for multi-core hosts.
+
+The master process imports the app, creates the tables and loads and warms up
+the detector *before* forking, so every child starts with the model weights
+already in memory and shares those pages copy-on-write instead of loading its
+own copy. Workers share one listening socket and only serve HTTP: the tracker,
+the frame pipelines and the latest metrics stay in the master, which workers
+reach over a local `multiprocessing.connection` socket (see ipc.py). That keeps
+one consistent tracking state no matter which worker a request lands on.
+
+Workers are forked, and replaced when they die, by a small spawner process
+that the master forks before it starts any thread. Forking the threaded
+master itself could hand a new worker a lock (logging, the connection pool,
+the inference queue) held by a thread that doesn't exist in the child. If the
+spawner dies the master stops; leave restarting to the service supervisor.
+
+    python serve.py --workers 4 --port 5000
+
+Use ``python app.py`` for development; it runs everything in one process.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from analysis import ANALYSIS_RPC_METHODS
+from ipc import RpcClient, RpcServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+
+def _exit_with_parent(parent: int) -> None:
+    # A worker whose spawner was killed must not keep serving on its own
+    while os.getppid() == parent:
+        time.sleep(1.0)
+    logger.error(f"Worker spawner (pid {parent}) is gone; worker {os.getpid()} exiting")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _run_worker(webapp, sock: socket.socket, address: str, authkey: bytes, index: int) -> None:
+    """Body of a forked worker: serve HTTP on the shared socket, delegate analysis to the master."""
+    from werkzeug.serving import make_server
+
+    threading.Thread(target=_exit_with_parent, args=(os.getppid(),), name='parent-watch', daemon=True).start()
+
+    # Connections pooled by the master must not be shared across processes
+    with webapp.app.app_context():
+        webapp.db.engine.dispose(close=False)
+    webapp.sessions = RpcClient(address, authkey, ANALYSIS_RPC_METHODS)
+    webapp.password_hasher.start()  # Each worker hashes passwords in its own small process pool
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, webapp.app, threaded=True, fd=sock.fileno())
+    logger.info(f"Worker {index} (pid {os.getpid()}) serving on {host}:{port}")
+    server.serve_forever()
+
+
+def _fork_worker(webapp, sock: socket.socket, address: str, authkey: bytes, index: int) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_IGN)  # The master handles Ctrl+C
+            _run_worker(webapp, sock, address, authkey, index)
+        except Exception as e:
+            logger.error(f"Worker {index} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def _supervise_workers(webapp, sock: socket.socket, address: str, authkey: bytes, workers: int,
+                       master: int) -> None:
+    """Body of the spawner: fork the HTTP workers and replace any that die. Never starts a thread."""
+    children: Dict[int, int] = {}
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The master handles Ctrl+C
+
+    for index in range(workers):
+        children[_fork_worker(webapp, sock, address, authkey, index)] = index
+
+    while children:
+        if not stopping and os.getppid() != master:
+            logger.error("Master process is gone; stopping workers")
+            shutdown(None, None)
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == 0:
+            time.sleep(1)
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+        time.sleep(1)
+        children[_fork_worker(webapp, sock, address, authkey, index)] = index
+
+
+def _fork_spawner(webapp, sock: socket.socket, address: str, authkey: bytes, workers: int) -> int:
+    master = os.getpid()
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _supervise_workers(webapp, sock, address, authkey, workers, master)
+        except Exception as e:
+            logger.error(f"Worker spawner crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def run(host: str, port: int, workers: int, after_fork: Optional[Callable[[], None]] = None) -> int:
+    """Preload the detector, fork ``workers`` HTTP workers and act as the state owner until stopped.
+
+    ``after_fork`` runs in the master once the spawner is forked, for setup that
+    starts threads (e.g. opening sessions). Returns the exit status: non-zero
+    if the worker spawner died.
+    """
+    import app as webapp
+
+    webapp.init_database()
+    if not webapp.sessions.ready():
+        started = time.time()
+        webapp.build_detector()
+        logger.info(f"Detector preloaded in {time.time() - started:.1f}s")
+
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+    address = os.path.join(tempfile.mkdtemp(prefix='crowdcount-'), 'analysis.sock')
+    authkey = os.urandom(32)
+
+    # Nothing pooled or threaded may be inherited: drop DB connections, then move
+    # everything allocated so far (model included) out of the GC's reach so cyclic
+    # collections in the children don't write to, and un-share, those pages.
+    with webapp.app.app_context():
+        webapp.db.engine.dispose()
+    gc.collect()
+    gc.freeze()
+
+    if threading.active_count() > 1:
+        logger.warning(f"Forking workers with {threading.active_count() - 1} extra threads running: "
+                       f"{', '.join(t.name for t in threading.enumerate() if t is not threading.main_thread())}")
+    spawner = _fork_spawner(webapp, sock, address, authkey, workers)
+
+    # The master hosts the analysis sessions for every worker
+    rpc_server = RpcServer(webapp.sessions, address, authkey, ANALYSIS_RPC_METHODS)
+    rpc_server.start()
+    webapp.memory_telemetry.start()
+    webapp.resume_alert_purges()
+    webapp.alert_retention.start(webapp.app, webapp.get_retention_policy)
+    if after_fork is not None:
+        after_fork()
+    logger.info(f"Serving on {host}:{sock.getsockname()[1]} with {workers} workers")
+
+    stopping = False
+
+    def shutdown(signum, frame):
+        nonlocal stopping
+        stopping = True
+        try:
+            os.kill(spawner, signal.SIGTERM)  # It stops the workers, then exits
+        except ProcessLookupError:
+            pass
+
+    signal.signal(signal.SIGTERM, shutdown)
+    signal.signal(signal.SIGINT, shutdown)
+
+    code = 0
+    while True:
+        try:
+            pid, status = os.waitpid(spawner, 0)
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        if pid == spawner:
+            if not stopping:
+                # Don't fork a replacement from this threaded process; let the supervisor restart the service
+                logger.error(f"Worker spawner (pid {pid}) exited with status {status}; shutting down")
+                code = 1
+            break
+
+    rpc_server.close()
+    webapp.sessions.shutdown()
+    os.rmdir(os.path.dirname(address))
+    logger.info("All workers stopped.")
+    return code
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='HTTP worker processes (default: one per CPU)')
+    return parser
+
+
+def main(argv: Optional[list] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return run(args.host, args.port, max(1, args.workers))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
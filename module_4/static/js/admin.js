@@ -60,4 +60,214 @@ document.addEventListener('DOMContentLoaded', () => {
             })
             .catch(err => console.error('Error fetching admin stats:', err));
     }
-});
\ No newline at end of file
+});
+
+// --- Paginated user and alert tables (filled from /admin/data/*) ---
+function escapeHtml(value) {
+    return String(value === null || value === undefined ? '' : value)
+        .replace(/&/g, '&amp;').replace(/</g, '&lt;').replace(/>/g, '&gt;')
+        .replace(/"/g, '&quot;').replace(/'/g, '&#39;');
+}
+
+const userState = { page: 1, perPage: 50, q: '' };
+
+function userRow(u) {
+    const name = escapeHtml(u.username);
+    const roleClass = u.role === 'admin' ? 'role-admin' : 'role-user';
+    const role = escapeHtml(u.role.charAt(0).toUpperCase() + u.role.slice(1));
+    return `
+        <tr>
+            <td>
+                <img src="/static/profile_pics/${encodeURIComponent(u.profile_pic)}" alt="Avatar" style="width: 24px; height: 24px; border-radius: 50%; vertical-align: middle; margin-right: 8px;">
+                ${name}
+            </td>
+            <td>${escapeHtml(u.email || 'N/A')}</td>
+            <td><span class="${roleClass}">${role}</span></td>
+            <td>${u.alert_count}</td>
+            <td class="action-cell">
+                <a href="/admin/download_csv/${u.id}" class="btn-action view">Download CSV</a>
+                <form action="/admin/user/${u.id}/toggle_admin" method="POST" style="margin: 0;">
+                    <button type="submit" class="btn-action toggle">${u.role === 'admin' ? 'Demote' : 'Promote'}</button>
+                </form>
+                <form action="/admin/user/${u.id}/delete" method="POST" style="margin: 0;" onsubmit="return confirm('Are you sure you want to delete ${name}? This is irreversible.');">
+                    <button type="submit" class="btn-action delete">Delete</button>
+                </form>
+            </td>
+        </tr>`;
+}
+
+function loadUsers() {
+    const params = new URLSearchParams({ page: userState.page, per_page: userState.perPage, q: userState.q });
+    fetch(`/admin/data/users?${params}`)
+        .then(res => res.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            const pages = Math.max(1, Math.ceil(data.total / data.per_page));
+            document.getElementById('userTotal').textContent = data.total;
+            document.getElementById('userPage').textContent = `Page ${data.page} of ${pages}`;
+            document.getElementById('userPrev').disabled = data.page <= 1;
+            document.getElementById('userNext').disabled = data.page >= pages;
+            document.getElementById('userRows').innerHTML = data.users.length
+                ? data.users.map(userRow).join('')
+                : '<tr><td colspan="5" style="text-align: center;">No users found.</td></tr>';
+        })
+        .catch(err => console.error('Error fetching users:', err));
+}
+
+let alertCursor = null;
+
+function loadAlerts(append) {
+    const params = new URLSearchParams({ per_page: 100 });
+    if (append && alertCursor) params.set('before', alertCursor);
+    fetch(`/admin/data/alerts?${params}`)
+        .then(res => res.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            const rows = data.alerts.map(a => `
+                <tr>
+                    <td>${escapeHtml(a.timestamp)}</td>
+                    <td>${escapeHtml(a.username)}</td>
+                    <td>${escapeHtml(a.alert_type)}</td>
+                    <td>${escapeHtml(a.message)}</td>
+                </tr>`).join('');
+            const body = document.getElementById('alertRows');
+            if (append) {
+                body.insertAdjacentHTML('beforeend', rows);
+            } else {
+                body.innerHTML = rows || '<tr><td colspan="4" style="text-align: center;">No alerts found in the system.</td></tr>';
+            }
+            alertCursor = data.next_before;
+            document.getElementById('alertMore').style.display = alertCursor ? 'inline-block' : 'none';
+        })
+        .catch(err => console.error('Error fetching alerts:', err));
+}
+
+// --- Background user deletions ---
+function loadPurges() {
+    fetch('/admin/data/purges')
+        .then(res => res.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            const box = document.getElementById('purgeStatus');
+            const active = data.purges.filter(p => p.state === 'running' || p.state === 'failed');
+            box.style.display = active.length ? 'block' : 'none';
+            box.innerHTML = active.map(p => {
+                const done = p.percent !== null && p.percent !== undefined ? ` ${p.percent}%` : '';
+                const left = p.remaining !== undefined ? `, ${p.remaining} alerts left` : '';
+                const state = p.state === 'failed' ? `failed: ${escapeHtml(p.error)}` : `deleting${done}${left}`;
+                return `<div>🗑️ ${escapeHtml(p.label)} — ${state}</div>`;
+            }).join('');
+            if (active.some(p => p.state === 'running')) {
+                setTimeout(loadPurges, 2000);
+            } else if (data.purges.length) {
+                loadUsers();
+            }
+        })
+        .catch(err => console.error('Error fetching purge progress:', err));
+}
+
+// --- Alert retention status ---
+function loadRetention() {
+    const box = document.getElementById('retentionStatus');
+    if (!box) return;
+    fetch('/admin/data/retention')
+        .then(res => res.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            let html = data.partitioned
+                ? `<p>${data.partitions.length} partitions</p><table class="admin-table"><thead><tr><th>Partition</th><th>Holds alerts before</th><th>Rows (estimate)</th></tr></thead><tbody>` +
+                  data.partitions.map(p => `<tr><td>${escapeHtml(p.name)}</td><td>${escapeHtml(p.until || 'out of range')}</td><td>${p.estimated_rows}</td></tr>`).join('') +
+                  '</tbody></table>'
+                : '<p>This database has no partitions; expired months are deleted in batches.</p>';
+            if (data.last_run) {
+                const rows = data.last_run.expired.reduce((sum, e) => sum + e.rows, 0);
+                html += `<p>Last run: ${new Date(data.last_run.at * 1000).toLocaleString()}, expired ${rows} alerts` +
+                        (data.last_run.cutoff ? ` older than ${escapeHtml(data.last_run.cutoff)}` : '') + '.</p>';
+            }
+            box.innerHTML = html;
+        })
+        .catch(err => console.error('Error fetching retention status:', err));
+}
+
+// --- Request and query tracing ---
+function traceBlock(t) {
+    const spans = t.spans.map(s => `
+        <tr>
+            <td>${s.start_ms.toFixed(1)}</td>
+            <td>${s.ms.toFixed(2)}</td>
+            <td>${escapeHtml(s.kind)}</td>
+            <td><code>${escapeHtml(s.name)}</code></td>
+            <td><code>${s.params ? escapeHtml(JSON.stringify(s.params)) : ''}</code></td>
+        </tr>`).join('');
+    const dropped = t.dropped_spans ? ` (${t.dropped_spans} more spans not kept)` : '';
+    return `
+        <details style="margin-bottom: 0.5rem;">
+            <summary>${t.ms.toFixed(1)} ms — ${escapeHtml(t.name)}${t.status ? ` [${t.status}]` : ''} at ${escapeHtml(t.at)},
+                ${t.sql_count} queries (${t.sql_ms.toFixed(1)} ms)${dropped}</summary>
+            <table class="admin-table">
+                <thead><tr><th>Start (ms)</th><th>Duration (ms)</th><th>Kind</th><th>Span</th><th>Parameters</th></tr></thead>
+                <tbody>${spans}</tbody>
+            </table>
+        </details>`;
+}
+
+function loadTracing() {
+    fetch('/admin/tracing')
+        .then(res => res.json())
+        .then(data => {
+            if (data.error) throw new Error(data.error);
+            // Under serve.py the pipeline's background work is traced by the master process
+            const reports = data.master && data.master.enabled !== undefined ? [data, data.master] : [data];
+            const traces = reports.flatMap(r => r.slowest_traces).sort((a, b) => b.ms - a.ms);
+            const queries = reports.flatMap(r => r.slowest_queries).sort((a, b) => b.ms - a.ms);
+            const statements = reports.flatMap(r => r.statements).sort((a, b) => b.total_ms - a.total_ms);
+            document.getElementById('tracingSummary').textContent = data.enabled
+                ? `Sampling ${(data.sample_rate * 100).toFixed(1)}% of requests; queries over ${data.slow_query_ms} ms are always captured. ` +
+                  `${data.traced} traces and ${data.slow_queries_seen} slow queries since ${new Date(data.since * 1000).toLocaleString()}.`
+                : 'Tracing is disabled in config.yaml.';
+            document.getElementById('statementRows').innerHTML = statements.map(s => `
+                <tr>
+                    <td><code>${escapeHtml(s.statement)}</code></td>
+                    <td>${s.count}</td>
+                    <td>${s.total_ms.toFixed(1)}</td>
+                    <td>${s.mean_ms.toFixed(2)}</td>
+                    <td>${s.max_ms.toFixed(2)}</td>
+                </tr>`).join('') || '<tr><td colspan="5" style="text-align: center;">No sampled queries yet.</td></tr>';
+            document.getElementById('traceRows').innerHTML = traces.map(traceBlock).join('') || '<p>No sampled requests yet.</p>';
+            document.getElementById('slowQueryRows').innerHTML = queries.map(q => `
+                <tr>
+                    <td>${escapeHtml(q.at)}</td>
+                    <td>${q.ms.toFixed(1)}</td>
+                    <td>${escapeHtml(q.trace)}</td>
+                    <td><code>${escapeHtml(q.statement)}</code></td>
+                    <td><code>${escapeHtml(JSON.stringify(q.params))}</code></td>
+                </tr>`).join('') || '<tr><td colspan="5" style="text-align: center;">No slow queries.</td></tr>';
+        })
+        .catch(err => console.error('Error fetching traces:', err));
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    if (!document.getElementById('userRows')) return;
+
+    let searchTimer = null;
+    document.getElementById('userSearch').addEventListener('input', (e) => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(() => {
+            userState.q = e.target.value.trim();
+            userState.page = 1;
+            loadUsers();
+        }, 300);
+    });
+    document.getElementById('userPrev').addEventListener('click', () => { userState.page -= 1; loadUsers(); });
+    document.getElementById('userNext').addEventListener('click', () => { userState.page += 1; loadUsers(); });
+    document.getElementById('alertMore').addEventListener('click', () => loadAlerts(true));
+    document.getElementById('tracingRefresh').addEventListener('click', loadTracing);
+    document.getElementById('tracingReset').addEventListener('click', () => {
+        fetch('/admin/tracing/reset', { method: 'POST' }).then(loadTracing);
+    });
+
+    loadUsers();
+    loadAlerts(false);
+    loadPurges();
+    loadRetention();
+});
@@ -1,3 +1,6 @@
+// Pages set window.SESSION_ID to the session they show; without one the legacy routes use the user's latest session
+const API_BASE = window.SESSION_ID ? `/sessions/${encodeURIComponent(window.SESSION_ID)}` : '';
+
 // --- NEW: Global variables for history chart ---
 let populationHistory = [];
 let populationLabels = [];
@@ -5,7 +8,7 @@ const HISTORY_LENGTH = 50; // Max data points for the history chart
 
 async function updateData() {
   try {
-    const res = await fetch('/person_data');
+    const res = await fetch(`${API_BASE}/person_data`);
     if (!res.ok) throw new Error(`HTTP error: ${res.status}`);
     const data = await res.json();
 
@@ -73,7 +76,7 @@ async function updateData() {
             <td>${info["Green Time (s)"]}</td>
             <td>${info["Total Time (s)"]}</td>
             <td class="${alertClass}">${info["Alert"]}</td>
-            <td><a href="/download_pdf/${id}" target="_blank">Download PDF</a></td>
+            <td><a href="${API_BASE}/download_pdf/${id}" target="_blank">Download PDF</a></td>
           </tr>`;
         
         // Add per-person alerts
@@ -303,7 +306,7 @@ async function updateData() {
 
 async function resetTracker() {
   try {
-    const res = await fetch('/reset');
+    const res = await fetch(`${API_BASE}/reset`);
     if (!res.ok) throw new Error(`HTTP error: ${res.status}`);
     
     // --- NEW: Clear history data ---
@@ -335,5 +338,272 @@ async function resetTracker() {
   }
 }
 
+// --- Video feed: output tier, and where the overlays are drawn ---
+// In 'client' mode the page reads the unannotated '<tier>-raw' stream with fetch(), and the
+// boxes, ids, zone and alerts of each frame from /overlay_feed (matched by X-Frame-Seq),
+// and draws both on a canvas: the server skips drawing and overlays stay sharp at any zoom.
+const videoState = {
+  tier: null, mode: 'server', format: 'mjpeg', hls: null, hlsPoll: null, controller: null, events: null,
+  overlays: new Map(), bitmap: null, seq: 0, decoding: false, pending: null,
+};
+const OVERLAY_HISTORY = 120; // Overlays kept while their frames are on the way
+
+function videoFeedUrl(path, tier) {
+  const img = document.getElementById('videoFeed');
+  const url = new URL(img.dataset.src, window.location.href);
+  if (path) url.pathname = url.pathname.replace(/\/[^/]*$/, `/${path}`);
+  url.searchParams.set('tier', tier);
+  return url.toString();
+}
+
+function setVideoTier(tier) {
+  videoState.tier = tier;
+  setOverlayMode(videoState.mode);
+}
+
+function setOverlayMode(mode) {
+  const img = document.getElementById('videoFeed');
+  const canvas = document.getElementById('videoCanvas');
+  if (!img) return;
+  const tier = videoState.tier || img.dataset.tier;
+  stopClientStream();
+  videoState.mode = mode;
+  if (videoState.format === 'hls') return; // Applies when switching back to MJPEG
+  const toggle = document.getElementById('overlayToggleLabel');
+  if (toggle) toggle.hidden = mode !== 'client';
+  if (mode === 'client' && canvas && window.fetch && window.createImageBitmap) {
+    img.removeAttribute('src'); // Closes the annotated stream
+    img.hidden = true;
+    canvas.hidden = false;
+    startClientStream(`${tier}-raw`);
+  } else {
+    if (canvas) canvas.hidden = true;
+    img.hidden = false;
+    img.src = videoFeedUrl(null, tier);
+  }
+}
+
+function stopClientStream() {
+  if (videoState.controller) videoState.controller.abort();
+  if (videoState.events) videoState.events.close();
+  videoState.controller = null;
+  videoState.events = null;
+  videoState.overlays.clear();
+}
+
+function indexOfCrlfCrlf(buf) {
+  for (let i = 0; i + 3 < buf.length; i++) {
+    if (buf[i] === 13 && buf[i + 1] === 10 && buf[i + 2] === 13 && buf[i + 3] === 10) return i;
+  }
+  return -1;
+}
+
+async function startClientStream(rawTier) {
+  const controller = new AbortController();
+  videoState.controller = controller;
+
+  const events = new EventSource(videoFeedUrl('overlay_feed', rawTier));
+  videoState.events = events;
+  events.onmessage = (event) => {
+    const overlay = JSON.parse(event.data);
+    videoState.overlays.set(overlay.seq, overlay);
+    if (videoState.overlays.size > OVERLAY_HISTORY) {
+      videoState.overlays.delete(videoState.overlays.keys().next().value);
+    }
+    if (overlay.seq === videoState.seq) drawVideoCanvas();
+  };
+
+  try {
+    const res = await fetch(videoFeedUrl(null, rawTier), { signal: controller.signal });
+    if (!res.ok) throw new Error(`HTTP error: ${res.status}`);
+    const reader = res.body.getReader();
+    let buf = new Uint8Array(0);
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      const joined = new Uint8Array(buf.length + value.length);
+      joined.set(buf);
+      joined.set(value, buf.length);
+      buf = joined;
+      // Each part: '--frame' headers, a blank line, Content-Length bytes of JPEG, CRLF
+      while (true) {
+        const headerEnd = indexOfCrlfCrlf(buf);
+        if (headerEnd < 0) break;
+        const headers = new TextDecoder().decode(buf.subarray(0, headerEnd));
+        const length = parseInt((/Content-Length:\s*(\d+)/i.exec(headers) || [])[1], 10);
+        const seq = parseInt((/X-Frame-Seq:\s*(\d+)/i.exec(headers) || [])[1], 10);
+        const start = headerEnd + 4;
+        if (isNaN(length) || buf.length < start + length + 2) break;
+        showClientFrame(buf.slice(start, start + length), seq);
+        buf = buf.subarray(start + length + 2);
+      }
+    }
+  } catch (error) {
+    if (error.name === 'AbortError') return;
+    console.error('Error reading video stream:', error);
+  }
+  // The video ended or the connection dropped: reconnect like an <img> reload would
+  if (videoState.controller === controller) {
+    setTimeout(() => { if (videoState.controller === controller) setOverlayMode('client'); }, 2000);
+  }
+}
+
+async function showClientFrame(jpeg, seq) {
+  // Decode one frame at a time; if the stream is faster, only the newest waiting frame is shown
+  if (videoState.decoding) {
+    videoState.pending = { jpeg, seq };
+    return;
+  }
+  videoState.decoding = true;
+  try {
+    const bitmap = await createImageBitmap(new Blob([jpeg], { type: 'image/jpeg' }));
+    if (videoState.bitmap) videoState.bitmap.close();
+    videoState.bitmap = bitmap;
+    videoState.seq = seq;
+    drawVideoCanvas();
+  } catch (error) {
+    console.error('Error decoding frame:', error);
+  } finally {
+    videoState.decoding = false;
+  }
+  if (videoState.pending) {
+    const next = videoState.pending;
+    videoState.pending = null;
+    showClientFrame(next.jpeg, next.seq);
+  }
+}
+
+function overlayForFrame(seq) {
+  // The frame's own overlay, or the newest older one while it is still on the way
+  let best = null;
+  for (const [key, overlay] of videoState.overlays) {
+    if (key <= seq && (!best || key > best.seq)) best = overlay;
+  }
+  return best;
+}
+
+function drawVideoCanvas() {
+  const canvas = document.getElementById('videoCanvas');
+  const bitmap = videoState.bitmap;
+  if (!canvas || canvas.hidden || !bitmap) return;
+
+  // Size the backing store in device pixels so boxes and text stay crisp when scaled or zoomed
+  const ratio = window.devicePixelRatio || 1;
+  const cssWidth = Math.min(bitmap.width, canvas.parentElement.clientWidth || bitmap.width);
+  const width = Math.round(cssWidth * ratio);
+  const height = Math.round(width * bitmap.height / bitmap.width);
+  if (canvas.width !== width || canvas.height !== height) {
+    canvas.width = width;
+    canvas.height = height;
+    canvas.style.width = `${cssWidth}px`;
+  }
+  const ctx = canvas.getContext('2d');
+  ctx.drawImage(bitmap, 0, 0, width, height);
+
+  const toggle = document.getElementById('overlayToggle');
+  const overlay = overlayForFrame(videoState.seq);
+  if ((toggle && !toggle.checked) || !overlay) return;
+
+  // Overlay coordinates are in analysed-frame pixels; sizes scale with the picture like server-drawn ones
+  const sx = width / overlay.width;
+  const sy = height / overlay.height;
+  const text = (label, x, y, color, size) => {
+    ctx.font = `bold ${Math.max(8, Math.round(size * sx))}px sans-serif`;
+    ctx.fillStyle = color;
+    ctx.fillText(label, x, y);
+  };
+  ctx.lineWidth = Math.max(1, 2 * sx);
+
+  if (!overlay.zone) {
+    text('Draw RED Zone with mouse', 40 * sx, 40 * sy, '#ffff00', 20);
+    return;
+  }
+  const [[zx1, zy1], [zx2, zy2]] = overlay.zone.points;
+  ctx.strokeStyle = '#ff0000';
+  ctx.strokeRect(zx1 * sx, zy1 * sy, (zx2 - zx1) * sx, (zy2 - zy1) * sy);
+  text(overlay.zone.label, zx1 * sx, (zy1 - 10) * sy, '#ff0000', 16);
+
+  for (const [x1, y1, x2, y2, id, zone, alerted] of overlay.people) {
+    const color = zone === 'red' ? '#ff0000' : '#00ff00';
+    ctx.strokeStyle = color;
+    ctx.strokeRect(x1 * sx, y1 * sy, (x2 - x1) * sx, (y2 - y1) * sy);
+    text(`P${id}`, x1 * sx, (y1 - 10) * sy, color, 18);
+    if (alerted) text('ALERT!', x1 * sx, (y1 - 30) * sy, '#ff0000', 18);
+  }
+
+  const alerts = overlay.alerts;
+  if (alerts.population_alert) {
+    text(`ZONE POPULATION ALERT: ${alerts.red_zone_count} in Zone!`, 40 * sx, 80 * sy, '#ff0000', 26);
+  }
+  if (alerts.overall_population_alert) {
+    text(`OVERALL POPULATION ALERT: ${alerts.total_count} people!`, 40 * sx, 120 * sy, '#ff00ff', 26);
+  }
+}
+
+// HLS: the server encodes the annotated stream to H.264 segments that are fetched as plain files
+function setVideoFormat(format) {
+  const img = document.getElementById('videoFeed');
+  const canvas = document.getElementById('videoCanvas');
+  const video = document.getElementById('videoHls');
+  if (!img || !video) return;
+  stopHls();
+  videoState.format = format;
+  if (format !== 'hls' || !window.SESSION_ID) {
+    video.hidden = true;
+    setOverlayMode(videoState.mode);
+    return;
+  }
+  stopClientStream();
+  img.removeAttribute('src');
+  img.hidden = true;
+  if (canvas) canvas.hidden = true;
+  video.hidden = false;
+  startHls(video);
+}
+
+function stopHls() {
+  clearTimeout(videoState.hlsPoll);
+  if (videoState.hls) videoState.hls.destroy();
+  videoState.hls = null;
+  const video = document.getElementById('videoHls');
+  if (video) {
+    video.pause();
+    video.removeAttribute('src');
+  }
+}
+
+async function startHls(video) {
+  try {
+    // Starts the encoder; the playlist exists once the first segment is written
+    const res = await fetch(`${API_BASE}/hls`);
+    const info = await res.json();
+    if (!res.ok) throw new Error(info.error || `HTTP error: ${res.status}`);
+    if (videoState.format !== 'hls') return;
+    if (!info.ready) {
+      videoState.hlsPoll = setTimeout(() => startHls(video), 1000);
+      return;
+    }
+    if (window.Hls && Hls.isSupported()) {
+      const hls = new Hls({ liveDurationInfinity: true });
+      hls.loadSource(info.playlist);
+      hls.attachMedia(video);
+      videoState.hls = hls;
+    } else if (video.canPlayType('application/vnd.apple.mpegurl')) {
+      video.src = info.playlist; // Safari plays HLS natively
+    } else {
+      throw new Error('This browser cannot play HLS');
+    }
+    video.play().catch(() => {});
+  } catch (error) {
+    console.error('Error starting HLS stream:', error);
+  }
+}
+
+window.addEventListener('resize', drawVideoCanvas);
+document.addEventListener('DOMContentLoaded', () => {
+  const img = document.getElementById('videoFeed');
+  if (img && img.dataset.overlayMode === 'client') setOverlayMode('client');
+});
+
 setInterval(updateData, 1000);
 updateData();
\ No newline at end of file
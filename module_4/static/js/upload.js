@@ -0,0 +1,116 @@
+// --- Resumable chunked video upload ---
+const CHUNK_SIZE = 8 * 1024 * 1024;           // 8 MiB per PUT
+const CLIENT_HASH_LIMIT = 256 * 1024 * 1024;  // Hash small files up front so repeats skip the transfer
+const RETRY_DELAY_MS = 2000;                   // Wait when the server asks us to, or makes no progress
+
+function sleep(ms) {
+  return new Promise(resolve => setTimeout(resolve, ms));
+}
+
+function retryDelay(res) {
+  const seconds = parseInt(res.headers.get('Retry-After'), 10);
+  return Number.isFinite(seconds) ? seconds * 1000 : RETRY_DELAY_MS;
+}
+
+function uploadKey(file) {
+  return `upload:${file.name}:${file.size}:${file.lastModified}`;
+}
+
+async function sha256Hex(file) {
+  if (!window.crypto || !window.crypto.subtle || file.size > CLIENT_HASH_LIMIT) {
+    return null; // Server still de-duplicates after the transfer
+  }
+  const digest = await crypto.subtle.digest('SHA-256', await file.arrayBuffer());
+  return Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+}
+
+async function postJson(url, body) {
+  const res = await fetch(url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body || {})
+  });
+  const data = await res.json();
+  if (!res.ok) throw new Error(data.error || `HTTP error: ${res.status}`);
+  return data;
+}
+
+async function resumeOrBegin(file) {
+  const saved = localStorage.getItem(uploadKey(file));
+  if (saved) {
+    const res = await fetch(`/upload/chunked/${saved}`);
+    if (res.ok) {
+      const status = await res.json();
+      return { upload_id: saved, offset: status.offset, complete: false };
+    }
+    localStorage.removeItem(uploadKey(file));
+  }
+  const begin = await postJson('/upload/chunked', {
+    filename: file.name,
+    size: file.size,
+    sha256: await sha256Hex(file)
+  });
+  if (!begin.complete) localStorage.setItem(uploadKey(file), begin.upload_id);
+  return begin;
+}
+
+async function chunkedUpload(file, onProgress) {
+  const session = await resumeOrBegin(file);
+  if (session.complete) return session; // Identical content already on the server
+
+  let offset = session.offset;
+  while (offset < file.size) {
+    const end = Math.min(offset + CHUNK_SIZE, file.size);
+    const res = await fetch(`/upload/chunked/${session.upload_id}`, {
+      method: 'PUT',
+      headers: {
+        'Content-Type': 'application/octet-stream',
+        'Content-Range': `bytes ${offset}-${end - 1}/${file.size}`
+      },
+      body: file.slice(offset, end)
+    });
+    const data = await res.json();
+    if (res.status === 423) {
+      await sleep(retryDelay(res)); // Another request (e.g. another tab) is writing this upload
+      continue;
+    }
+    if (res.status === 409 && data.offset !== undefined) {
+      // Server has a different offset; continue from there at once, but never spin on the same one
+      if (data.offset === offset) await sleep(retryDelay(res));
+      offset = data.offset;
+      continue;
+    }
+    if (!res.ok) throw new Error(data.error || `HTTP error: ${res.status}`);
+    offset = data.offset;
+    onProgress(offset / file.size);
+  }
+
+  const done = await postJson(`/upload/chunked/${session.upload_id}/complete`);
+  localStorage.removeItem(uploadKey(file));
+  return done;
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  const form = document.getElementById('uploadForm');
+  if (!form || !window.fetch) return; // Plain form POST still works as a fallback
+
+  const progressEl = document.getElementById('uploadProgress');
+  form.addEventListener('submit', async (evt) => {
+    const file = form.querySelector('input[type="file"]').files[0];
+    if (!file) return;
+    evt.preventDefault();
+    const button = form.querySelector('button[type="submit"]');
+    button.disabled = true;
+    try {
+      const result = await chunkedUpload(file, (fraction) => {
+        if (progressEl) progressEl.innerText = `Uploading... ${Math.floor(fraction * 100)}%`;
+      });
+      if (progressEl) progressEl.innerText = result.deduplicated ? 'Already uploaded.' : 'Upload complete.';
+      window.location.href = result.redirect;
+    } catch (error) {
+      console.error('Chunked upload failed:', error);
+      if (progressEl) progressEl.innerText = `Upload failed: ${error.message}. Submit again to resume.`;
+      button.disabled = false;
+    }
+  });
+});
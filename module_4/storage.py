@@ -0,0 +1,91 @@
+import logging
+import os
+from typing import Dict
+import yaml
+from sqlalchemy import event
+from sqlalchemy.pool import StaticPool
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_SQLITE_CONFIG = {
+    'path': 'crowd_monitoring.db',
+    'pool_size': 8,                # Connections kept open in the pool
+    'max_overflow': 16,            # Extra connections opened under load and closed when returned
+    'busy_timeout_ms': 5000,       # Wait this long for another writer instead of failing with "database is locked"
+    'pragmas': {
+        'journal_mode': 'WAL',     # Readers don't block the writer and vice versa
+        'synchronous': 'NORMAL',   # Durable at checkpoints; safe with WAL and far fewer fsyncs than FULL
+        'cache_size': -65536,      # Page cache in KiB (negative) per connection: 64 MiB
+        'temp_store': 'MEMORY',
+        'mmap_size': 268435456,    # Read through a 256 MiB memory map
+        'foreign_keys': 'ON',      # Needed for ON DELETE CASCADE
+    },
+}
+
+
+def load_sqlite_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `sqlite` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_SQLITE_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('sqlite') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load sqlite config: {e}. Using defaults.")
+    config['pragmas'] = dict(DEFAULT_SQLITE_CONFIG['pragmas'], **(config.get('pragmas') or {}))
+    return config
+
+
+def database_uri(sqlite_config: Dict) -> str:
+    """SQLAlchemy URL from the environment.
+
+    DATABASE_URL wins if set. Otherwise DB_BACKEND picks ``postgresql`` (the
+    default, from the DB_* variables) or ``sqlite`` (a local file, for
+    single-node edge boxes; SQLITE_PATH or ``sqlite.path`` in config.yaml).
+    """
+    if os.getenv('DATABASE_URL'):
+        return os.getenv('DATABASE_URL')
+    backend = os.getenv('DB_BACKEND', 'postgresql').lower()
+    if backend == 'sqlite':
+        path = os.path.abspath(os.getenv('SQLITE_PATH') or sqlite_config['path'])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"sqlite:///{path}"
+    if backend not in ('postgresql', 'postgres'):
+        raise ValueError(f"Unsupported DB_BACKEND: {backend}")
+    return (f"postgresql://{os.getenv('DB_USER')}:{os.getenv('DB_PASSWORD')}@"
+            f"{os.getenv('DB_HOST')}:{os.getenv('DB_PORT')}/{os.getenv('DB_NAME')}")
+
+
+def engine_options(uri: str, sqlite_config: Dict) -> Dict:
+    """Engine keyword arguments for the backend ``uri`` points at."""
+    if not uri.startswith('sqlite'):
+        return {}
+    connect_args = {'check_same_thread': False, 'timeout': int(sqlite_config['busy_timeout_ms']) / 1000.0}
+    if uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri:
+        return {'poolclass': StaticPool, 'connect_args': connect_args}  # One connection, so one shared in-memory database
+    # The default QueuePool: a request thread checks a connection out and
+    # returns it when done, so any number of server threads share a bounded
+    # set. Pragmas are applied per connection by install_sqlite_pragmas.
+    return {
+        'pool_size': int(sqlite_config['pool_size']),
+        'max_overflow': int(sqlite_config['max_overflow']),
+        'connect_args': connect_args,
+    }
+
+
+def install_sqlite_pragmas(engine, sqlite_config: Dict) -> None:
+    """Apply the configured pragmas to every new SQLite connection of ``engine``."""
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = dict(sqlite_config['pragmas'], busy_timeout=int(sqlite_config['busy_timeout_ms']))
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    logger.info(f"SQLite database at {engine.url.database} "
+                f"({', '.join(f'{k}={v}' for k, v in pragmas.items())})")
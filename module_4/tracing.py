@@ -0,0 +1,315 @@
+import contextlib
+import contextvars
+import datetime
+import heapq
+import itertools
+import logging
+import random
+import re
+import threading
+import time
+from typing import Dict, Iterator, List, Optional
+import yaml
+from flask import g, request, before_render_template, template_rendered, \
+    request_started, request_finished, request_tearing_down
+from sqlalchemy import event
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_TRACING_CONFIG = {
+    'enabled': True,
+    'sample_rate': 0.05,          # Fraction of requests (and background tasks) traced span by span
+    'slowest': 50,                # Slowest traces and slowest queries kept for the admin panel
+    'slow_query_ms': 100,         # Queries slower than this are captured (and logged) even when not sampled
+    'max_spans': 500,             # Spans kept per trace; the rest are only counted
+    'max_statement_chars': 1000,
+    'statements': 200,            # Distinct statements aggregated before lumping the rest together
+}
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+_current: contextvars.ContextVar[Optional['Trace']] = contextvars.ContextVar('trace', default=None)
+
+
+def load_tracing_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `tracing` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_TRACING_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('tracing') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load tracing config: {e}. Using defaults.")
+    return config
+
+
+def _redact_value(value) -> str:
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (str, bytes)):
+        return f"<{type(value).__name__}:{len(value)}>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_params(parameters) -> object:
+    """Shape of the bound parameters (types and lengths), never their values."""
+    if isinstance(parameters, dict):
+        return {key: _redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {'rows': len(parameters), 'first': redact_params(parameters[0])}
+        return [_redact_value(value) for value in parameters]
+    return _redact_value(parameters)
+
+
+class Trace:
+    """Spans of one request or background task, relative to its start."""
+
+    __slots__ = ('kind', 'name', 'wall', 'started', 'spans', 'dropped', 'sql_count', 'sql_seconds',
+                 'duration', 'status', '_template_starts')
+
+    def __init__(self, kind: str, name: str):
+        self.kind = kind
+        self.name = name
+        self.wall = time.time()
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.dropped = 0
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.duration = 0.0
+        self.status: Optional[int] = None
+        self._template_starts: List[float] = []
+
+    def add(self, kind: str, name: str, start: float, end: float, max_spans: int, **detail) -> None:
+        if len(self.spans) >= max_spans:
+            self.dropped += 1
+            return
+        span = {'kind': kind, 'name': name,
+                'start_ms': round((start - self.started) * 1000, 3), 'ms': round((end - start) * 1000, 3)}
+        span.update(detail)
+        self.spans.append(span)
+
+    def as_dict(self) -> Dict:
+        return {
+            'kind': self.kind,
+            'name': self.name,
+            'at': datetime.datetime.utcfromtimestamp(self.wall).strftime('%Y-%m-%d %H:%M:%S'),
+            'ms': round(self.duration * 1000, 3),
+            'status': self.status,
+            'sql_count': self.sql_count,
+            'sql_ms': round(self.sql_seconds * 1000, 3),
+            'spans': self.spans,
+            'dropped_spans': self.dropped,
+        }
+
+
+class _Slowest:
+    """The ``size`` slowest items seen, as a bounded min-heap."""
+
+    def __init__(self, size: int):
+        self.size = max(1, size)
+        self._heap: List = []
+        self._counter = itertools.count()
+
+    def offer(self, seconds: float, item: Dict) -> None:
+        entry = (seconds, next(self._counter), item)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+        elif seconds > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def items(self) -> List[Dict]:
+        return [item for _, _, item in sorted(self._heap, key=lambda e: e[0], reverse=True)]
+
+
+class Tracer:
+    """Per-request tracing of Flask requests, SQL statements and template rendering.
+
+    A sampled request (``sample_rate``) gets a trace whose spans are every
+    cursor execution (SQLAlchemy ``before/after_cursor_execute``) and every
+    template render; finished traces compete for the ``slowest`` ring, and
+    their statements are aggregated so the most expensive queries stand out.
+    Unsampled requests cost one random draw; their queries are only timed, and
+    kept if they cross ``slow_query_ms``. Statements are stored with literals
+    stripped and parameters reduced to their types.
+
+    Background work outside requests (e.g. alert writes from the pipeline
+    thread) can be traced with ``with tracer.trace('log_alerts'): ...``.
+    Buffers are per process: under serve.py each worker holds its own requests
+    and the master holds the pipeline's tasks.
+    """
+
+    def __init__(self, config: Optional[Dict] = None):
+        self.config = config or dict(DEFAULT_TRACING_CONFIG)
+        self.enabled = bool(self.config.get('enabled', True))
+        self.sample_rate = float(self.config['sample_rate'])
+        self.slow_query = float(self.config['slow_query_ms']) / 1000.0
+        self.max_spans = int(self.config['max_spans'])
+        self.max_statement_chars = int(self.config['max_statement_chars'])
+        self.max_statements = int(self.config['statements'])
+        self._lock = threading.Lock()
+        self._reset_buffers()
+
+    def _reset_buffers(self) -> None:
+        self._traces = _Slowest(int(self.config['slowest']))
+        self._queries = _Slowest(int(self.config['slowest']))
+        self._statements: Dict[str, List[float]] = {}  # statement -> [count, total s, max s]
+        self._counts = {'traced': 0, 'slow_queries': 0}
+        self._since = time.time()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._reset_buffers()
+
+    # --- Installation ---
+
+    def init_app(self, app, engine) -> None:
+        """Hook the Flask request and template signals and the engine's cursor events."""
+        if not self.enabled:
+            return
+        request_started.connect(self._request_started, app)
+        request_finished.connect(self._request_finished, app)
+        request_tearing_down.connect(self._request_tearing_down, app)
+        before_render_template.connect(self._before_render, app)
+        template_rendered.connect(self._after_render, app)
+        event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+        logger.info(f"Tracing {self.sample_rate:.0%} of requests; "
+                    f"capturing queries over {self.slow_query * 1000:.0f} ms")
+
+    def _sampled(self) -> bool:
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    # --- Requests and tasks ---
+
+    def _request_started(self, sender, **extra) -> None:
+        if not self._sampled():
+            return
+        rule = request.url_rule.rule if request.url_rule else request.path
+        g._trace_token = _current.set(Trace('request', f"{request.method} {rule}"))
+
+    def _request_finished(self, sender, response, **extra) -> None:
+        trace = _current.get()
+        if trace is not None:
+            trace.status = response.status_code
+
+    def _request_tearing_down(self, sender, **extra) -> None:
+        token = g.pop('_trace_token', None)
+        if token is None:
+            return
+        trace = _current.get()
+        _current.reset(token)
+        if trace is not None:
+            self._finish(trace)
+
+    @contextlib.contextmanager
+    def trace(self, name: str) -> Iterator[None]:
+        """Trace a block of background work as one task (sampled like requests)."""
+        if not self.enabled or _current.get() is not None or not self._sampled():
+            yield
+            return
+        trace = Trace('task', name)
+        token = _current.set(trace)
+        try:
+            yield
+        finally:
+            _current.reset(token)
+            self._finish(trace)
+
+    def _finish(self, trace: Trace) -> None:
+        trace.duration = time.perf_counter() - trace.started
+        with self._lock:
+            self._counts['traced'] += 1
+            self._traces.offer(trace.duration, trace.as_dict())
+
+    # --- Templates ---
+
+    def _before_render(self, sender, template, context, **extra) -> None:
+        trace = _current.get()
+        if trace is not None:
+            trace._template_starts.append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra) -> None:
+        trace = _current.get()
+        if trace is not None and trace._template_starts:
+            start = trace._template_starts.pop()
+            trace.add('template', template.name or '(string)', start, time.perf_counter(), self.max_spans)
+
+    # --- SQL ---
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault('_trace_query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        starts = conn.info.get('_trace_query_start')
+        if not starts:
+            return
+        start = starts.pop()
+        end = time.perf_counter()
+        seconds = end - start
+        trace = _current.get()
+        if trace is None and seconds < self.slow_query:
+            return
+        sql = self.normalize(statement)
+        if trace is not None:
+            trace.sql_count += 1
+            trace.sql_seconds += seconds
+            trace.add('sql', sql, start, end, self.max_spans,
+                      params=redact_params(parameters), rows=getattr(cursor, 'rowcount', -1))
+            self._aggregate(sql, seconds)
+        if seconds >= self.slow_query:
+            with self._lock:
+                self._counts['slow_queries'] += 1
+                self._queries.offer(seconds, {
+                    'statement': sql,
+                    'params': redact_params(parameters),
+                    'ms': round(seconds * 1000, 3),
+                    'at': datetime.datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S'),
+                    'trace': trace.name if trace is not None else threading.current_thread().name,
+                })
+            logger.warning(f"Slow query ({seconds * 1000:.0f} ms): {sql[:200]}")
+
+    def normalize(self, statement: str) -> str:
+        """Single-line statement with literal values replaced by ``?``."""
+        sql = _LITERAL.sub('?', _SPACE.sub(' ', statement).strip())
+        return sql[:self.max_statement_chars]
+
+    def _aggregate(self, sql: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._statements.get(sql)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    sql = '(other statements)'
+                stats = self._statements.setdefault(sql, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = max(stats[2], seconds)
+
+    # --- Reporting ---
+
+    def report(self, limit: int = 50) -> Dict:
+        with self._lock:
+            statements = sorted(self._statements.items(), key=lambda item: item[1][1], reverse=True)
+            return {
+                'enabled': self.enabled,
+                'sample_rate': self.sample_rate,
+                'slow_query_ms': round(self.slow_query * 1000, 1),
+                'since': self._since,
+                'traced': self._counts['traced'],
+                'slow_queries_seen': self._counts['slow_queries'],
+                'slowest_traces': self._traces.items()[:limit],
+                'slowest_queries': self._queries.items()[:limit],
+                # Only sampled traces contribute, so counts are a sample too
+                'statements': [{
+                    'statement': sql,
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(worst * 1000, 3),
+                } for sql, (count, total, worst) in statements[:limit]],
+            }
+
+
+tracer = Tracer(load_tracing_config())
@@ -0,0 +1,198 @@
+import contextlib
+import cv2
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+import yaml
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROXY_CONFIG = {
+    'enabled': True,
+    'max_side': 960,          # Longest edge of the proxy; YOLO runs at 640 anyway
+    'fps': 15,                # Constant output frame rate
+    'codec': 'MJPG',          # Intra-only, cheapest to decode
+    'extension': '.avi',
+    'quality': 85,
+    'keyframe_interval': 15,  # Only honoured by inter-frame codecs on FFmpeg-backed OpenCV builds
+}
+
+
+def load_proxy_config(config_path: str = "config.yaml") -> Dict:
+    """Read the `proxy` section of config.yaml, falling back to defaults."""
+    config = dict(DEFAULT_PROXY_CONFIG)
+    try:
+        with open(config_path, 'r') as f:
+            config.update((yaml.safe_load(f) or {}).get('proxy') or {})
+    except Exception as e:
+        logger.warning(f"Failed to load proxy config: {e}. Using defaults.")
+    return config
+
+
+class ProxyTranscoder:
+    """Builds reduced-resolution, constant-frame-rate analysis proxies of uploaded videos.
+
+    Originals are never modified so they remain available for evidence export.
+    Work runs on a single background thread so uploads return immediately.
+
+    Progress lives in the proxy folder, so every worker process sees the same
+    status: a ``.pending`` marker (holding the pid of the process that queued
+    the job) while queued or running, the ``.tmp`` output while it is being
+    written, the proxy itself when ready and a ``.failed`` marker on error.
+    A marker whose process has died is ignored and the job can be queued again.
+    """
+
+    def __init__(self, upload_folder: str, config: Optional[Dict] = None):
+        self.upload_folder = upload_folder
+        self.proxy_folder = os.path.join(upload_folder, 'proxies')
+        os.makedirs(self.proxy_folder, exist_ok=True)
+        self.config = config or dict(DEFAULT_PROXY_CONFIG)
+        # FFmpeg-backed builds read encoder options from this variable when a writer opens. It is set
+        # once here, at import time, because changing the environment while other threads run is unsafe.
+        os.environ.setdefault('OPENCV_FFMPEG_WRITER_OPTIONS', f"g;{int(self.config['keyframe_interval'])}")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='proxy-transcoder')
+
+    def proxy_path(self, filename: str) -> str:
+        stem, _ = os.path.splitext(filename)
+        return os.path.join(self.proxy_folder, f"{stem}.proxy{self.config['extension']}")
+
+    def _marker(self, filename: str, kind: str) -> str:
+        stem, _ = os.path.splitext(self.proxy_path(filename))
+        return f"{stem}.{kind}"
+
+    def _tmp_path(self, filename: str) -> str:
+        stem, ext = os.path.splitext(self.proxy_path(filename))
+        return f"{stem}.tmp{ext}"
+
+    @staticmethod
+    def _claim_alive(marker: str) -> bool:
+        """Whether a ``.pending`` marker belongs to a process that is still running."""
+        try:
+            with open(marker, 'r') as f:
+                pid = int(f.read().strip())
+            os.kill(pid, 0)
+        except PermissionError:
+            return True  # Alive, just not ours to signal
+        except (OSError, ValueError):
+            return False
+        return True
+
+    def _claim(self, filename: str) -> bool:
+        """Atomically create the ``.pending`` marker; False if a live process already holds it."""
+        marker = self._marker(filename, 'pending')
+        scratch = f"{marker}.{os.getpid()}.{threading.get_ident()}"
+        with open(scratch, 'w') as f:
+            f.write(str(os.getpid()))
+        try:
+            if os.path.exists(marker) and not self._claim_alive(marker):
+                logger.warning(f"Discarding proxy job for {filename} left by a dead process")
+                for path in (marker, self._tmp_path(filename)):
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path)
+            os.link(scratch, marker)  # Fails if the marker exists, unlike a rename
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(scratch)
+
+    def submit(self, filename: str) -> None:
+        """Queue a proxy build for an uploaded file unless one already exists or is queued."""
+        if not self.config.get('enabled', True):
+            return
+        if os.path.exists(self.proxy_path(filename)) or not self._claim(filename):
+            return
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._marker(filename, 'failed'))
+        self._executor.submit(self._run, filename)
+
+    def get_status(self, filename: str) -> str:
+        if os.path.exists(self.proxy_path(filename)):
+            return 'ready'
+        if self._claim_alive(self._marker(filename, 'pending')):
+            return 'running' if os.path.exists(self._tmp_path(filename)) else 'pending'
+        if os.path.exists(self._marker(filename, 'failed')):
+            return 'failed'
+        return 'missing'
+
+    def queue_depth(self) -> int:
+        """Proxy builds queued or running in any process."""
+        try:
+            names = os.listdir(self.proxy_folder)
+        except OSError:
+            return 0
+        return sum(1 for name in names
+                   if name.endswith('.pending') and self._claim_alive(os.path.join(self.proxy_folder, name)))
+
+    def resolve(self, filename: str) -> str:
+        """Return the path analysis should read: the proxy if ready, else the original."""
+        proxy = self.proxy_path(filename)
+        if os.path.exists(proxy):
+            return proxy
+        return os.path.join(self.upload_folder, filename)
+
+    def _run(self, filename: str) -> None:
+        try:
+            self._transcode(os.path.join(self.upload_folder, filename), self.proxy_path(filename))
+        except Exception as e:
+            logger.error(f"Proxy transcoding failed for {filename}: {e}")
+            with open(self._marker(filename, 'failed'), 'w') as f:
+                f.write(str(e))
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self._marker(filename, 'pending'))
+
+    def _output_size(self, width: int, height: int) -> Tuple[int, int]:
+        scale = min(1.0, self.config['max_side'] / float(max(width, height)))
+        # Even dimensions keep every codec happy
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+    def _open_writer(self, path: str, fps: float, size: Tuple[int, int]) -> cv2.VideoWriter:
+        fourcc = cv2.VideoWriter_fourcc(*self.config['codec'])
+        writer = cv2.VideoWriter(path, fourcc, fps, size)
+        if writer.isOpened():
+            writer.set(cv2.VIDEOWRITER_PROP_QUALITY, self.config['quality'])
+        return writer
+
+    def _transcode(self, src_path: str, dst_path: str) -> None:
+        cap = cv2.VideoCapture(src_path)
+        if not cap.isOpened():
+            raise IOError(f"Cannot open {src_path}")
+
+        src_fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+        out_fps = min(float(self.config['fps']), src_fps)
+        size = self._output_size(int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        stem, ext = os.path.splitext(dst_path)
+        tmp_path = f"{stem}.tmp{ext}"
+        writer = self._open_writer(tmp_path, out_fps, size)
+        if not writer.isOpened():
+            cap.release()
+            raise IOError(f"Cannot open video writer for {tmp_path}")
+
+        logger.info(f"Building analysis proxy {dst_path} at {size[0]}x{size[1]} @ {out_fps:.1f} fps")
+        index, written = 0, 0
+        try:
+            while True:
+                # grab() advances without the colour conversion; only retrieve frames we keep
+                if not cap.grab():
+                    break
+                if index / src_fps + 1e-6 >= written / out_fps:
+                    ret, frame = cap.retrieve()
+                    if not ret:
+                        break
+                    writer.write(cv2.resize(frame, size, interpolation=cv2.INTER_AREA))
+                    written += 1
+                index += 1
+        finally:
+            cap.release()
+            writer.release()
+
+        if written == 0:
+            os.remove(tmp_path)
+            raise IOError("No frames decoded from source")
+        os.replace(tmp_path, dst_path)
+        logger.info(f"Analysis proxy ready: {dst_path} ({written} frames)")
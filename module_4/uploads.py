@@ -0,0 +1,248 @@
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from typing import BinaryIO, Dict, Iterator, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_SIZE = 1024 * 1024  # 1 MiB read/hash block
+PARTIAL_MAX_AGE = 24 * 3600  # Abandoned partial uploads are purged after a day
+LOCKED_RETRY_AFTER = 2  # Seconds a client waits while another request holds the upload
+
+
+class UploadError(Exception):
+    """Raised when a chunked upload request cannot be applied."""
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None,
+                 retry_after: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+        self.retry_after = retry_after  # Seconds; the request can be repeated as-is after this
+
+
+class UploadStore:
+    """Content-addressed video storage with resumable, streamed chunked uploads.
+
+    Files are stored as ``<sha256><ext>`` in the upload folder. Partial uploads
+    live in a hidden sub-folder on the same filesystem so finishing an upload
+    is a rename, never a second copy.
+
+    Who uploaded each stored file is recorded in a hidden ``.owners`` folder
+    (one line per uploader, de-duplicated uploads included), so originals can
+    be handed out only to the users who sent that content.
+
+    Each partial upload is locked on its own (``flock`` on the ``.part`` file),
+    so a slow chunk only holds up its own upload, in this process or any other
+    worker sharing the folder.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.partial_dir = os.path.join(root, '.partial')
+        self.owners_dir = os.path.join(root, '.owners')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        os.makedirs(self.owners_dir, exist_ok=True)
+        self._lock = threading.Lock()  # Guards the exists/rename in _commit
+
+    # --- Paths & metadata ---
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.partial_dir, f"{upload_id}.json")
+
+    def _read_meta(self, upload_id: str) -> Dict:
+        if not upload_id.isalnum():
+            raise UploadError("Invalid upload id", 404)
+        try:
+            with open(self._meta_path(upload_id), 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError("Unknown or expired upload", 404)
+
+    @staticmethod
+    def _extension(filename: str) -> str:
+        _, ext = os.path.splitext(filename or '')
+        ext = ext.lower()
+        return ext if ext[1:].isalnum() and len(ext) <= 8 else '.bin'
+
+    def find(self, digest: str, ext: str) -> Optional[str]:
+        """Return the stored filename for a digest if the content already exists."""
+        digest = (digest or '').lower()
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            return None
+        filename = f"{digest}{ext}"
+        return filename if os.path.exists(os.path.join(self.root, filename)) else None
+
+    def _owners_path(self, filename: str) -> str:
+        return os.path.join(self.owners_dir, os.path.basename(filename))
+
+    def add_owner(self, filename: str, owner: Optional[str]) -> None:
+        """Record that ``owner`` uploaded the stored file ``filename``."""
+        if not owner or self.is_owner(filename, owner):
+            return
+        # One short O_APPEND write per line, so concurrent workers never interleave
+        with open(self._owners_path(filename), 'a') as f:
+            f.write(f"{owner}\n")
+
+    def is_owner(self, filename: str, owner: Optional[str]) -> bool:
+        """Whether ``owner`` uploaded the stored file ``filename``."""
+        try:
+            with open(self._owners_path(filename), 'r') as f:
+                return owner in f.read().splitlines()
+        except FileNotFoundError:
+            return False
+
+    # --- Chunked upload protocol ---
+
+    def begin(self, filename: str, size: int, owner: str, digest: Optional[str] = None) -> Dict:
+        """Start a chunked upload, or short-circuit if the content is already stored."""
+        if size is None or size < 0:
+            raise UploadError("A non-negative file size is required")
+        ext = self._extension(filename)
+
+        existing = self.find(digest, ext) if digest else None
+        if existing:
+            logger.info(f"Upload of '{filename}' de-duplicated before transfer: {existing}")
+            self.add_owner(existing, owner)
+            return {'complete': True, 'filename': existing, 'deduplicated': True}
+
+        self.purge_stale()
+        upload_id = uuid.uuid4().hex
+        meta = {'filename': filename, 'ext': ext, 'size': int(size), 'owner': owner, 'created': time.time()}
+        with open(self._meta_path(upload_id), 'w') as f:
+            json.dump(meta, f)
+        open(self._part_path(upload_id), 'wb').close()
+        return {'complete': False, 'upload_id': upload_id, 'offset': 0}
+
+    def status(self, upload_id: str, owner: str) -> Dict:
+        """Return how many bytes of an upload have been received (for resuming)."""
+        meta = self._read_meta(upload_id)
+        self._check_owner(meta, owner)
+        return {'upload_id': upload_id, 'offset': os.path.getsize(self._part_path(upload_id)), 'size': meta['size']}
+
+    def append(self, upload_id: str, start: int, stream: BinaryIO, length: int, owner: str) -> int:
+        """Stream one chunk from ``stream`` onto the partial file."""
+        meta = self._read_meta(upload_id)
+        self._check_owner(meta, owner)
+
+        with self._locked_part(upload_id, 'ab') as f:
+            offset = os.fstat(f.fileno()).st_size
+            if start != offset:
+                raise UploadError("Chunk does not start at the current offset", 409, offset)
+            if offset + length > meta['size']:
+                raise UploadError("Chunk exceeds the declared file size", 416, offset)
+
+            remaining = length
+            while remaining > 0:
+                block = stream.read(min(READ_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                f.write(block)
+                remaining -= len(block)
+            offset += length - remaining
+            os.utime(self._meta_path(upload_id))  # Keeps an active upload's metadata from being purged
+
+        if remaining:
+            raise UploadError("Connection closed before the chunk was complete", 400, offset)
+        return offset
+
+    def finish(self, upload_id: str, owner: str) -> Tuple[str, bool]:
+        """Hash a fully received upload and move it to its content address. Returns (filename, deduplicated)."""
+        meta = self._read_meta(upload_id)
+        self._check_owner(meta, owner)
+
+        with self._locked_part(upload_id, 'rb') as f:
+            offset = os.fstat(f.fileno()).st_size
+            if offset != meta['size']:
+                raise UploadError("Upload is incomplete", 409, offset)
+            hasher = hashlib.sha256()
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                hasher.update(block)
+            with self._lock:
+                result = self._commit(self._part_path(upload_id), hasher.hexdigest(), meta['ext'], owner)
+            os.remove(self._meta_path(upload_id))
+        return result
+
+    def save_stream(self, stream: BinaryIO, filename: str, owner: Optional[str] = None) -> Tuple[str, bool]:
+        """Store a whole file-like object (e.g. a form upload) under its content address."""
+        part_path = self._part_path(uuid.uuid4().hex)
+        hasher = hashlib.sha256()
+        with open(part_path, 'wb') as f:
+            while True:
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                f.write(block)
+                hasher.update(block)
+        with self._lock:
+            return self._commit(part_path, hasher.hexdigest(), self._extension(filename), owner)
+
+    # --- Internals ---
+
+    @contextlib.contextmanager
+    def _locked_part(self, upload_id: str, mode: str) -> Iterator[BinaryIO]:
+        """Open an upload's partial file holding its exclusive lock; a second request for it gets a 423."""
+        part_path = self._part_path(upload_id)
+        try:
+            f = open(part_path, mode)
+        except FileNotFoundError:
+            raise UploadError("Unknown or expired upload", 404)
+        with f:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                # 423, not 409: the offset is still moving, so the client should wait, not resend
+                raise UploadError("Another request for this upload is in progress", 423,
+                                  os.fstat(f.fileno()).st_size, retry_after=LOCKED_RETRY_AFTER)
+            # The lock holder may have finished the upload (renamed the file) before we got the lock
+            try:
+                current = os.stat(part_path)
+            except FileNotFoundError:
+                current = None
+            if current is None or current.st_ino != os.fstat(f.fileno()).st_ino:
+                raise UploadError("Unknown or expired upload", 404)
+            yield f
+
+    def _commit(self, part_path: str, digest: str, ext: str, owner: Optional[str] = None) -> Tuple[str, bool]:
+        filename = f"{digest}{ext}"
+        final_path = os.path.join(self.root, filename)
+        self.add_owner(filename, owner)
+        if os.path.exists(final_path):
+            os.remove(part_path)
+            logger.info(f"Upload de-duplicated: {filename}")
+            return filename, True
+        os.replace(part_path, final_path)
+        logger.info(f"Stored upload: {filename}")
+        return filename, False
+
+    @staticmethod
+    def _check_owner(meta: Dict, owner: str) -> None:
+        if meta.get('owner') != owner:
+            raise UploadError("Unknown or expired upload", 404)
+
+    def purge_stale(self, max_age: int = PARTIAL_MAX_AGE) -> None:
+        """Remove partial uploads whose data and metadata have not been touched for ``max_age`` seconds."""
+        cutoff = time.time() - max_age
+        try:
+            last_touched: Dict[str, float] = {}
+            for name in os.listdir(self.partial_dir):
+                upload_id = name.split('.')[0]
+                mtime = os.path.getmtime(os.path.join(self.partial_dir, name))
+                last_touched[upload_id] = max(last_touched.get(upload_id, 0.0), mtime)
+            for upload_id, mtime in last_touched.items():
+                if mtime < cutoff:
+                    for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(path)
+        except OSError as e:
+            logger.warning(f"Could not purge stale partial uploads: {e}")